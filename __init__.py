@@ -1 +0,0 @@
-__init__.py
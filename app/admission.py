@@ -0,0 +1,502 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from custom_exceptions import OverloadError
+from logger.app_logger import get_logger
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+logger = get_logger(__name__)
+
+
+# Admitted routes, matched by path prefix. Lower priorities are served first
+# and shed last. max_wait bounds the time spent queued, and a class sheds
+# queued requests once its queueing delay stayed above target for interval.
+ROUTE_CLASSES = {
+    "/prices": {
+        "priority": 0,
+        "concurrency": 64,
+        "max_wait": 2.0,
+        "target": 0.1,
+        "interval": 1.0,
+    },
+    "/tickers": {
+        "priority": 1,
+        "concurrency": 16,
+        "max_wait": 2.0,
+        "target": 0.2,
+        "interval": 1.0,
+    },
+    "/book": {
+        "priority": 1,
+        "concurrency": 16,
+        "max_wait": 2.0,
+        "target": 0.2,
+        "interval": 1.0,
+    },
+    "/trades": {
+        "priority": 2,
+        "concurrency": 8,
+        "max_wait": 1.0,
+        "target": 0.05,
+        "interval": 0.5,
+    },
+}
+
+# Priority and deadline of the request being served, if it was admitted.
+current_admission: ContextVar[Optional[Tuple[int, float]]] = ContextVar(
+    "current_admission", default=None
+)
+
+
+class CoDel:
+    def __init__(self, target: float, interval: float) -> None:
+        """
+        Initializes a CoDel instance, the controlled delay queue management
+        of RFC 8289 applied to queued requests.
+
+        Requests are dropped as they leave the queue once their queueing delay
+        stayed above target for a whole interval, then ever more often, at
+        intervals shrinking with the square root of the number of drops, until
+        the delay goes back under target.
+
+        :param target: Acceptable queueing delay in seconds.
+        :type target: float
+        :param interval: Seconds the delay may stay above target.
+        :type interval: float
+        """
+        self.target = target
+        self.interval = interval
+        self.first_above: Optional[float] = None
+        self.dropping = False
+        self.drop_next = 0.0
+        self.count = 0
+
+    def should_drop(self, sojourn: float, now: float) -> bool:
+        """
+        Decide whether a request leaving the queue is dropped.
+
+        :param sojourn: Seconds the request spent queued.
+        :type sojourn: float
+        :param now: Monotonic time.
+        :type now: float
+        :return: Whether to drop the request.
+        :rtype: bool
+        """
+        if sojourn < self.target:
+            self.first_above = None
+            self.dropping = False
+            return False
+        if self.first_above is None:
+            self.first_above = now + self.interval
+            return False
+        if not self.dropping:
+            if now < self.first_above:
+                return False
+            self.dropping = True
+            # Resume near the previous drop rate if the last episode was recent.
+            recent = now - self.drop_next < 16 * self.interval
+            self.count = self.count - 2 if recent and self.count > 2 else 1
+            self.drop_next = now + self.interval / math.sqrt(self.count)
+            return True
+        if now < self.drop_next:
+            return False
+        self.count += 1
+        self.drop_next = now + self.interval / math.sqrt(self.count)
+        return True
+
+
+class PriorityGate:
+    def __init__(self, concurrency: int) -> None:
+        """
+        Initializes a PriorityGate instance, a semaphore handing free slots
+        to the waiter with the lowest priority value first.
+
+        :param concurrency: Number of slots.
+        :type concurrency: int
+        """
+        self.concurrency = concurrency
+        self.active = 0
+        self.waiting = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.stats = {"acquired": 0, "timeouts": 0}
+
+    async def acquire(self, priority: int, timeout: Optional[float]) -> bool:
+        """
+        Take a slot, waiting at most timeout seconds.
+
+        :param priority: The priority of the caller, lower goes first.
+        :type priority: int
+        :param timeout: Seconds to wait, None to wait as long as needed.
+        :type timeout: Optional[float]
+        :return: Whether a slot was taken.
+        :rtype: bool
+        """
+        if self.active < self.concurrency and not self.waiting:
+            self.active += 1
+            self.stats["acquired"] += 1
+            return True
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            # Unless the slot was handed over just as the wait timed out.
+            if not future.done():
+                future.cancel()
+                self.waiting -= 1
+                self.stats["timeouts"] += 1
+                return False
+        except asyncio.CancelledError:
+            if future.done():
+                self.release()
+            else:
+                future.cancel()
+                self.waiting -= 1
+            raise
+        self.stats["acquired"] += 1
+        return True
+
+    def release(self) -> None:
+        """
+        Give a slot back, handing it to the first waiter still waiting.
+        """
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                self.waiting -= 1
+                return
+        self.active -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the occupancy and counters of the gate.
+
+        :return: The active and waiting callers, and the counters.
+        :rtype: Dict[str, Any]
+        """
+        return {"active": self.active, "waiting": self.waiting, **self.stats}
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        classes: Dict[str, Dict[str, Any]],
+        capacity: int,
+        max_queue: int,
+        exchange_concurrency: int,
+    ) -> None:
+        """
+        Initializes an AdmissionController instance.
+
+        Requests of the admitted routes share capacity slots, and every route
+        class is further bounded by its own concurrency. Requests that cannot
+        run right away wait in per-class queues served in priority order,
+        and are rejected once they waited max_wait, once CoDel finds their
+        class' queue persistently slow, or once the queues are full and
+        nothing of lower priority is left to evict. Upstream requests made
+        while serving are bounded per exchange.
+
+        :param classes: Settings of the route classes keyed by path prefix.
+        :type classes: Dict[str, Dict[str, Any]]
+        :param capacity: Number of requests served concurrently.
+        :type capacity: int
+        :param max_queue: Number of requests waiting, across classes.
+        :type max_queue: int
+        :param exchange_concurrency: Number of concurrent request path
+            upstream requests per exchange.
+        :type exchange_concurrency: int
+        """
+        self.classes = classes
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.exchange_concurrency = exchange_concurrency
+        self.active = 0
+        self.queued = 0
+        self.states: Dict[str, Dict[str, Any]] = {
+            prefix: {
+                "active": 0,
+                "queue": deque(),
+                "codel": CoDel(settings["target"], settings["interval"]),
+                "service_time": 0.0,
+                "stats": {
+                    "admitted": 0,
+                    "waited": 0,
+                    "shed_queue_full": 0,
+                    "shed_evicted": 0,
+                    "shed_deadline": 0,
+                    "shed_codel": 0,
+                },
+            }
+            for prefix, settings in classes.items()
+        }
+        self.order = sorted(classes, key=lambda prefix: classes[prefix]["priority"])
+        self.gates: Dict[str, PriorityGate] = {}
+
+    def classify(self, path: str) -> Optional[str]:
+        """
+        Get the route class of a path.
+
+        :param path: The request path.
+        :type path: str
+        :return: The prefix of the class, None if the route is not admitted.
+        :rtype: Optional[str]
+        """
+        for prefix in self.classes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return prefix
+        return None
+
+    def has_room(self, prefix: str) -> bool:
+        """
+        Check whether a request of a class may start now.
+
+        :param prefix: The route class.
+        :type prefix: str
+        :return: Whether there is a free slot for the class.
+        :rtype: bool
+        """
+        return (
+            self.active < self.capacity
+            and self.states[prefix]["active"] < self.classes[prefix]["concurrency"]
+        )
+
+    def get_retry_after(self, prefix: str) -> int:
+        """
+        Estimate the seconds after which a shed request is worth retrying.
+
+        :param prefix: The route class.
+        :type prefix: str
+        :return: The whole seconds, at least one.
+        :rtype: int
+        """
+        state = self.states[prefix]
+        backlog = (len(state["queue"]) + 1) / self.classes[prefix]["concurrency"]
+        return max(1, math.ceil(state["service_time"] * backlog))
+
+    def shed(self, prefix: str, reason: str) -> OverloadError:
+        """
+        Count a shed request and build its error.
+
+        :param prefix: The route class.
+        :type prefix: str
+        :param reason: "queue_full", "evicted", "deadline" or "codel".
+        :type reason: str
+        :return: The error to reject the request with.
+        :rtype: OverloadError
+        """
+        self.states[prefix]["stats"][f"shed_{reason}"] += 1
+        return OverloadError(
+            status_code=503,
+            detail="Server overloaded, retry later.",
+            retry_after=self.get_retry_after(prefix),
+        )
+
+    def evict(self, priority: int) -> bool:
+        """
+        Make room in the queues by shedding the newest request of the lowest
+        priority class queued below the given priority.
+
+        :param priority: The priority of the request needing room.
+        :type priority: int
+        :return: Whether a request was evicted.
+        :rtype: bool
+        """
+        for prefix in reversed(self.order):
+            if self.classes[prefix]["priority"] <= priority:
+                return False
+            queue = self.states[prefix]["queue"]
+            if queue:
+                _, future = queue.pop()
+                self.queued -= 1
+                future.set_exception(self.shed(prefix, "evicted"))
+                return True
+        return False
+
+    async def acquire(self, prefix: str) -> float:
+        """
+        Admit a request, queueing it until a slot frees up.
+
+        :param prefix: The route class.
+        :type prefix: str
+        :raises OverloadError: If the request is shed.
+        :return: The deadline of the request, in monotonic time.
+        :rtype: float
+        """
+        settings = self.classes[prefix]
+        state = self.states[prefix]
+        now = time.monotonic()
+        deadline = now + settings["max_wait"]
+        if not state["queue"] and self.has_room(prefix):
+            state["codel"].should_drop(0.0, now)
+            self.start(prefix)
+            return deadline
+        if self.queued >= self.max_queue and not self.evict(settings["priority"]):
+            raise self.shed(prefix, "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        state["queue"].append((now, future))
+        state["stats"]["waited"] += 1
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), settings["max_wait"])
+        except asyncio.TimeoutError:
+            if not future.done():
+                state["queue"].remove((now, future))
+                self.queued -= 1
+                future.cancel()
+                raise self.shed(prefix, "deadline")
+            # Admitted or shed just as the wait timed out.
+            if future.exception() is not None:
+                raise future.exception()
+        except asyncio.CancelledError:
+            if not future.done():
+                state["queue"].remove((now, future))
+                self.queued -= 1
+                future.cancel()
+            elif future.exception() is None:
+                self.release(prefix, 0.0)
+            raise
+        return deadline
+
+    def start(self, prefix: str) -> None:
+        """
+        Count a request of a class as running.
+
+        :param prefix: The route class.
+        :type prefix: str
+        """
+        self.active += 1
+        self.states[prefix]["active"] += 1
+        self.states[prefix]["stats"]["admitted"] += 1
+
+    def release(self, prefix: str, service_time: float) -> None:
+        """
+        Count a request as done and admit the queued requests that fit.
+
+        :param prefix: The route class.
+        :type prefix: str
+        :param service_time: Seconds the request ran for.
+        :type service_time: float
+        """
+        state = self.states[prefix]
+        self.active -= 1
+        state["active"] -= 1
+        if service_time:
+            state["service_time"] = 0.8 * state["service_time"] + 0.2 * service_time
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """
+        Admit queued requests in priority order while slots are free, letting
+        CoDel shed the ones that waited too long.
+        """
+        now = time.monotonic()
+        for prefix in self.order:
+            state = self.states[prefix]
+            while state["queue"] and self.has_room(prefix):
+                enqueued_at, future = state["queue"].popleft()
+                self.queued -= 1
+                if state["codel"].should_drop(now - enqueued_at, now):
+                    future.set_exception(self.shed(prefix, "codel"))
+                    continue
+                self.start(prefix)
+                future.set_result(None)
+            if self.active >= self.capacity:
+                return
+
+    @asynccontextmanager
+    async def admit(self, prefix: str) -> AsyncIterator[None]:
+        """
+        Serve a request of a class within its admission slot.
+
+        :param prefix: The route class.
+        :type prefix: str
+        :raises OverloadError: If the request is shed.
+        """
+        deadline = await self.acquire(prefix)
+        token = current_admission.set((self.classes[prefix]["priority"], deadline))
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            current_admission.reset(token)
+            self.release(prefix, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def exchange_slot(self, exchange: str) -> AsyncIterator[None]:
+        """
+        Make an upstream request on the request path within the exchange's
+        concurrency, served in request priority order.
+
+        Admitted requests only wait for a slot until their deadline, others
+        (streams and routes outside admission) as long as needed.
+
+        :param exchange: The exchange name.
+        :type exchange: str
+        :raises OverloadError: If no slot frees up before the deadline.
+        """
+        gate = self.gates.get(exchange)
+        if gate is None:
+            gate = self.gates[exchange] = PriorityGate(self.exchange_concurrency)
+        admission = current_admission.get()
+        if admission is None:
+            priority, timeout = len(self.order), None
+        else:
+            priority, deadline = admission
+            timeout = max(deadline - time.monotonic(), 0.0)
+        if not await gate.acquire(priority, timeout):
+            raise OverloadError(
+                status_code=503,
+                detail=f"{exchange} is saturated, retry later.",
+                retry_after=1,
+            )
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the occupancy and shedding counters.
+
+        :return: The totals, the state of every route class and exchange.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "queued": self.queued,
+            "classes": {
+                prefix: {
+                    "priority": self.classes[prefix]["priority"],
+                    "active": state["active"],
+                    "queued": len(state["queue"]),
+                    "dropping": state["codel"].dropping,
+                    "service_time": state["service_time"],
+                    **state["stats"],
+                }
+                for prefix, state in self.states.items()
+            },
+            "exchanges": {name: gate.get_stats() for name, gate in self.gates.items()},
+        }
+
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+
+controller = AdmissionController(
+    ROUTE_CLASSES,
+    capacity=int(os.environ.get("ADMISSION_CAPACITY", "64")),
+    max_queue=int(os.environ.get("ADMISSION_QUEUE", "256")),
+    exchange_concurrency=int(os.environ.get("EXCHANGE_CONCURRENCY", "8")),
+)
@@ -0,0 +1,464 @@
+import asyncio
+import os
+import time
+import uuid
+from bisect import bisect_right, insort
+from decimal import Decimal
+from operator import itemgetter
+from urllib.parse import urlparse
+
+import aiohttp
+
+from exchanges.utils import shared_session
+from routers.utils import (
+    EXCHANGE_CLASSES,
+    EXCHANGE_MAP,
+    compute_total_prices,
+    get_supported_exchanges,
+    merge_order_books,
+    order_books,
+    scheduler,
+)
+from logger.app_logger import get_logger
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+logger = get_logger(__name__)
+
+
+# Hosts alerts may be delivered to, webhooks are meant for local consumers.
+DEFAULT_WEBHOOK_HOSTS = "localhost,127.0.0.1,::1"
+
+# Side of the book walked by every price metric.
+METRIC_SIDES = {"buy_price": "asks", "sell_price": "bids"}
+
+
+class AlertEngine:
+    def __init__(
+        self, poll_interval: float = 5.0, webhook_hosts: Optional[Set[str]] = None
+    ) -> None:
+        """
+        Initializes an AlertEngine instance.
+
+        Alerts watching the same value, i.e. the same crypto, quantity, metric
+        and exchanges, share a key. The thresholds of every key are kept
+        sorted by direction, so when a book update moves a value from one
+        level to another only the alerts whose thresholds lie in between are
+        found, with two bisections, and touched. The values a book update may
+        have moved are computed together, every book side they read being
+        filled once for all their quantities.
+
+        :param poll_interval: Seconds between two demand signals for the
+            books watched by alerts.
+        :type poll_interval: float
+        :param webhook_hosts: Hosts webhooks may be delivered to.
+        :type webhook_hosts: Optional[Set[str]]
+        """
+        self.poll_interval = poll_interval
+        self.webhook_hosts = webhook_hosts or set(DEFAULT_WEBHOOK_HOSTS.split(","))
+        self.alerts: Dict[str, Dict[str, Any]] = {}
+        self.thresholds: Dict[Tuple, Dict[str, List[Tuple[Decimal, str]]]] = {}
+        self.keys: Dict[str, Set[Tuple]] = {}
+        self.values: Dict[Tuple, Decimal] = {}
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.deliveries: Set[asyncio.Task] = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def get_key(self, alert: Dict[str, Any]) -> Tuple:
+        """
+        Get the key of the value an alert watches.
+
+        :param alert: The alert.
+        :type alert: Dict[str, Any]
+        :return: The crypto, quantity, metric and exchanges.
+        :rtype: Tuple
+        """
+        return (
+            alert["crypto"],
+            alert["quantity"],
+            alert["metric"],
+            alert["exchange"],
+            alert["other_exchange"],
+        )
+
+    async def add(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Register an alert.
+
+        The alert fires every time its value crosses the threshold in its
+        direction, starting from the value at registration.
+
+        :param request: The crypto, metric, quantity, threshold, direction,
+            exchange, other exchange and webhook of the alert.
+        :type request: Dict[str, Any]
+        :raises ValueError: If the alert is not consistent.
+        :return: The registered alert.
+        :rtype: Dict[str, Any]
+        """
+        if request["quantity"] <= 0:
+            raise ValueError("The quantity must be positive.")
+        if request["metric"] == "spread":
+            if not request["exchange"] or not request["other_exchange"]:
+                raise ValueError("A spread alert needs two exchanges.")
+            if request["exchange"] == request["other_exchange"]:
+                raise ValueError("A spread alert needs two different exchanges.")
+        elif request["other_exchange"]:
+            raise ValueError("Only spread alerts take a second exchange.")
+        listed = [
+            EXCHANGE_MAP[exchange]
+            for exchange in await get_supported_exchanges(request["crypto"])
+        ]
+        for exchange in (request["exchange"], request["other_exchange"]):
+            if exchange and exchange not in listed:
+                raise ValueError(f"{request['crypto']} is not listed on {exchange}.")
+        webhook = request["webhook"]
+        if webhook and (
+            urlparse(webhook).scheme not in ("http", "https")
+            or urlparse(webhook).hostname not in self.webhook_hosts
+        ):
+            raise ValueError("Webhooks must point to a local HTTP endpoint.")
+
+        alert = {
+            "id": uuid.uuid4().hex,
+            "crypto": request["crypto"],
+            "metric": request["metric"],
+            "quantity": request["quantity"],
+            "threshold": Decimal(request["threshold"]),
+            "direction": request["direction"],
+            "exchange": request["exchange"],
+            "other_exchange": request["other_exchange"],
+            "webhook": webhook,
+            "triggered": 0,
+            "created_at": time.time(),
+        }
+        key = self.get_key(alert)
+        self.alerts[alert["id"]] = alert
+        self.keys.setdefault(alert["crypto"], set()).add(key)
+        thresholds = self.thresholds.setdefault(key, {"above": [], "below": []})
+        insort(thresholds[alert["direction"]], (alert["threshold"], alert["id"]))
+        if key not in self.values:
+            value = self.compute(key)
+            if value is not None:
+                self.values[key] = value
+        return self.describe(alert)
+
+    def remove(self, alert_id: str) -> bool:
+        """
+        Remove an alert.
+
+        :param alert_id: The alert id.
+        :type alert_id: str
+        :return: Whether the alert existed.
+        :rtype: bool
+        """
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return False
+        key = self.get_key(alert)
+        thresholds = self.thresholds[key]
+        thresholds[alert["direction"]].remove((alert["threshold"], alert_id))
+        if not thresholds["above"] and not thresholds["below"]:
+            del self.thresholds[key]
+            self.values.pop(key, None)
+            self.keys[alert["crypto"]].discard(key)
+            if not self.keys[alert["crypto"]]:
+                del self.keys[alert["crypto"]]
+        return True
+
+    def describe(self, alert: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the JSON representation of an alert.
+
+        :param alert: The alert.
+        :type alert: Dict[str, Any]
+        :return: The alert with its threshold as a decimal string.
+        :rtype: Dict[str, Any]
+        """
+        return {**alert, "threshold": str(alert["threshold"])}
+
+    def get_alerts(self) -> List[Dict[str, Any]]:
+        """
+        Get every registered alert.
+
+        :return: The alerts.
+        :rtype: List[Dict[str, Any]]
+        """
+        return [self.describe(alert) for alert in self.alerts.values()]
+
+    def get_quantities(self, keys: Iterable[Tuple]) -> Dict[Tuple, Set[float]]:
+        """
+        Get the quantities the values of keys take from every book side.
+
+        :param keys: The keys.
+        :type keys: Iterable[Tuple]
+        :return: The quantities keyed by exchange, None for the consolidated
+            book, and side.
+        :rtype: Dict[Tuple, Set[float]]
+        """
+        quantities: Dict[Tuple, Set[float]] = {}
+        for _, quantity, metric, exchange, other_exchange in keys:
+            if metric in METRIC_SIDES:
+                sides = [(exchange, METRIC_SIDES[metric])]
+            else:
+                sides = [
+                    (venue, side)
+                    for venue in (exchange, other_exchange)
+                    for side in ("asks", "bids")
+                ]
+            for venue_side in sides:
+                quantities.setdefault(venue_side, set()).add(quantity)
+        return quantities
+
+    def get_total_prices(
+        self, crypto: str, quantities: Dict[Tuple, Set[float]]
+    ) -> Dict[Tuple, Decimal]:
+        """
+        Get the total prices of taking quantities from the latest polled
+        books, with the semantics of compute_total_price.
+
+        Every book side is filled once for all its quantities: exchange books
+        with a logarithmic query per quantity and the consolidated book, merged
+        once, in a single walk.
+
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param quantities: The quantities keyed by exchange, None for the
+            consolidated book, and side.
+        :type quantities: Dict[Tuple, Set[float]]
+        :return: The total prices keyed by exchange, side and quantity, missing
+            for the books not polled yet.
+        :rtype: Dict[Tuple, Decimal]
+        """
+        total_prices = {}
+        merged = None
+        for (exchange, side), side_quantities in quantities.items():
+            if exchange is not None:
+                order_book = order_books.get((exchange, crypto))
+                if order_book is None:
+                    continue
+                for quantity in side_quantities:
+                    total_prices[(exchange, side, quantity)] = Decimal(
+                        order_book.get_total_price(side, quantity)
+                    )
+                continue
+
+            if merged is None:
+                snapshots = [
+                    scheduler.get_snapshot(exchange_name, crypto, "book")
+                    for exchange_name in EXCHANGE_CLASSES
+                ]
+                books = [snapshot["data"] for snapshot in snapshots if snapshot]
+                if not books:
+                    continue
+                merged = merge_order_books(books)
+            side_quantities = list(side_quantities)
+            side_prices = compute_total_prices(
+                merged[side],
+                side_quantities,
+                merged["price_decimals"],
+                merged["amount_decimals"],
+            )
+            for quantity, total_price in zip(side_quantities, side_prices):
+                total_prices[(None, side, quantity)] = Decimal(total_price)
+        return total_prices
+
+    def compute(
+        self, key: Tuple, total_prices: Optional[Dict[Tuple, Decimal]] = None
+    ) -> Optional[Decimal]:
+        """
+        Compute the value watched by a key.
+
+        Price metrics are the total price of buying (asks) or selling (bids)
+        the quantity. The spread is the difference between the mid prices of
+        the quantity on both exchanges, in percent of the second one.
+
+        :param key: The crypto, quantity, metric and exchanges.
+        :type key: Tuple
+        :param total_prices: The total prices computed by get_total_prices for
+            the key, defaults to computing them.
+        :type total_prices: Optional[Dict[Tuple, Decimal]]
+        :return: The value or None if the books are not available.
+        :rtype: Optional[Decimal]
+        """
+        crypto, quantity, metric, exchange, other_exchange = key
+        if total_prices is None:
+            total_prices = self.get_total_prices(crypto, self.get_quantities([key]))
+        if metric in METRIC_SIDES:
+            return total_prices.get((exchange, METRIC_SIDES[metric], quantity))
+        mids = []
+        for venue in (exchange, other_exchange):
+            buy = total_prices.get((venue, "asks", quantity))
+            sell = total_prices.get((venue, "bids", quantity))
+            if buy is None or sell is None:
+                return None
+            mids.append((buy + sell) / 2)
+        if not mids[1]:
+            return None
+        return (mids[0] - mids[1]) / mids[1] * 100
+
+    def evaluate(self, crypto: str, exchange: str) -> List[Dict[str, Any]]:
+        """
+        Re-evaluate the values a book update of an exchange may have moved and
+        fire the alerts whose thresholds were crossed.
+
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param exchange: The exchange whose book was updated.
+        :type exchange: str
+        :return: The fired alert events.
+        :rtype: List[Dict[str, Any]]
+        """
+        events = []
+        keys = [
+            key
+            for key in self.keys.get(crypto, ())
+            if key[3] is None or exchange in (key[3], key[4])
+        ]
+        total_prices = self.get_total_prices(crypto, self.get_quantities(keys))
+        for key in keys:
+            value = self.compute(key, total_prices)
+            if value is None:
+                continue
+            previous = self.values.get(key)
+            self.values[key] = value
+            if previous is None or value == previous:
+                continue
+            thresholds = self.thresholds[key]
+            if value > previous:
+                crossed = thresholds["above"]
+                low = bisect_right(crossed, previous, key=itemgetter(0))
+                high = bisect_right(crossed, value, key=itemgetter(0))
+            else:
+                crossed = thresholds["below"]
+                low = bisect_right(crossed, value, key=itemgetter(0))
+                high = bisect_right(crossed, previous, key=itemgetter(0))
+            for _, alert_id in crossed[low:high]:
+                alert = self.alerts[alert_id]
+                alert["triggered"] += 1
+                events.append(
+                    {
+                        "alert": self.describe(alert),
+                        "value": str(value),
+                        "previous_value": str(previous),
+                        "triggered_at": time.time(),
+                    }
+                )
+        for event in events:
+            self.deliver(event)
+        return events
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        """
+        Push a fired alert to the stream subscribers and its webhook.
+
+        :param event: The fired alert event.
+        :type event: Dict[str, Any]
+        """
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping alert for a slow subscriber.")
+        if event["alert"]["webhook"]:
+            task = asyncio.create_task(self.post_webhook(event))
+            self.deliveries.add(task)
+            task.add_done_callback(self.deliveries.discard)
+
+    async def post_webhook(self, event: Dict[str, Any]) -> None:
+        """
+        Deliver a fired alert to its webhook.
+
+        :param event: The fired alert event.
+        :type event: Dict[str, Any]
+        """
+        url = event["alert"]["webhook"]
+        try:
+            async with shared_session.request(
+                "POST", url, json=event, timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning("Failed to deliver alert to %s: %s", url, e)
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Register a queue that receives every fired alert.
+
+        :return: The subscriber queue.
+        :rtype: asyncio.Queue
+        """
+        queue = asyncio.Queue(maxsize=1000)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        """
+        Remove a subscriber queue.
+
+        :param queue: The subscriber queue.
+        :type queue: asyncio.Queue
+        """
+        self.subscribers.discard(queue)
+
+    def on_snapshot(
+        self, exchange: str, crypto: str, kind: str, snapshot: Dict[str, Any]
+    ) -> None:
+        """
+        Evaluate the alerts on the order books refreshed by the polling scheduler.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind.
+        :type kind: str
+        :param snapshot: The refreshed snapshot.
+        :type snapshot: Dict[str, Any]
+        """
+        if kind == "book" and crypto in self.keys:
+            self.evaluate(crypto, exchange)
+
+    async def request_books(self) -> None:
+        """
+        Keep the books watched by alerts in demand, so the scheduler polls
+        them for as long as alerts are registered.
+        """
+        while True:
+            for crypto in list(self.keys):
+                try:
+                    for exchange in await get_supported_exchanges(crypto):
+                        scheduler.record_demand(EXCHANGE_MAP[exchange], crypto, "book")
+                except Exception as e:
+                    logger.warning(
+                        "Alert engine failed to request %s books: %s", crypto, e
+                    )
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        """
+        Start evaluating the alerts on the books polled by the scheduler.
+        """
+        if self.task is None:
+            scheduler.add_listener(self.on_snapshot)
+            self.task = asyncio.create_task(self.request_books())
+
+    async def stop(self) -> None:
+        """
+        Stop evaluating the alerts.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            scheduler.listeners.remove(self.on_snapshot)
+            self.task = None
+
+
+engine = AlertEngine(
+    poll_interval=float(os.environ.get("ALERTS_POLL_INTERVAL", "5")),
+    webhook_hosts=set(
+        os.environ.get("ALERT_WEBHOOK_HOSTS", DEFAULT_WEBHOOK_HOSTS).split(",")
+    ),
+)
@@ -0,0 +1,342 @@
+import asyncio
+import os
+import time
+from decimal import Decimal
+
+from app.supported_cryptos import NAMES
+from exchanges.fixed_point import rescale_book, to_decimal_string
+from routers.utils import EXCHANGE_MAP, get_supported_exchanges, scheduler
+from logger.app_logger import get_logger
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+logger = get_logger(__name__)
+
+
+# Taker fees charged by each venue, as a fraction of the traded notional.
+DEFAULT_FEES = {"coinbase": 0.006, "gemini": 0.004, "kraken": 0.0026}
+
+# Fees are applied as integer parts per million to keep the walk exact.
+FEE_DECIMALS = 6
+FEE_SCALE = 10**FEE_DECIMALS
+
+
+def load_fees() -> Dict[str, float]:
+    """
+    Load the per-venue taker fees, overriding the defaults with the
+    ARBITRAGE_FEES environment variable (Ex: "coinbase=0.005,kraken=0.0016").
+
+    :return: The fee fraction for every exchange.
+    :rtype: Dict[str, float]
+    """
+    fees = dict(DEFAULT_FEES)
+    for entry in os.environ.get("ARBITRAGE_FEES", "").split(","):
+        if "=" not in entry:
+            continue
+        exchange, fee = entry.split("=", 1)
+        try:
+            fees[exchange.strip().lower()] = float(fee)
+        except ValueError:
+            logger.warning("Ignoring invalid arbitrage fee entry: %s", entry)
+    return fees
+
+
+class ArbitrageScanner:
+    def __init__(
+        self,
+        fees: Dict[str, float],
+        poll_interval: float = 5.0,
+        depth: int = 50,
+    ) -> None:
+        """
+        Initializes an ArbitrageScanner instance.
+
+        :param fees: The taker fee fraction for every exchange.
+        :type fees: Dict[str, float]
+        :param poll_interval: Seconds to wait between two polls of the books.
+        :type poll_interval: float
+        :param depth: Number of levels per side used when sizing opportunities.
+        :type depth: int
+        """
+        self.fees = fees
+        self.poll_interval = poll_interval
+        self.depth = depth
+        self.books: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.opportunities: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.latency = {"count": 0, "last_ms": None, "max_ms": 0.0, "total_ms": 0.0}
+        self.task: Optional[asyncio.Task] = None
+
+    def update_book(
+        self,
+        crypto: str,
+        exchange: str,
+        order_book: Dict[str, Any],
+        received_at: float,
+    ) -> List[Dict[str, Any]]:
+        """
+        Store a fresh book and re-evaluate only the venue pairs it takes part in.
+
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param exchange: The exchange the book was fetched from.
+        :type exchange: str
+        :param order_book: The fixed-point order book, both sides sorted best first.
+        :type order_book: Dict[str, Any]
+        :param received_at: Monotonic time at which the book was received.
+        :type received_at: float
+        :return: The opportunities that were opened, updated or closed.
+        :rtype: List[Dict[str, Any]]
+        """
+        book = {
+            "bids": order_book["bids"][: self.depth],
+            "asks": order_book["asks"][: self.depth],
+            "price_decimals": order_book["price_decimals"],
+            "amount_decimals": order_book["amount_decimals"],
+        }
+        if self.books.get((crypto, exchange)) == book:
+            return []
+        self.books[(crypto, exchange)] = book
+
+        signals = []
+        for other in EXCHANGE_MAP.values():
+            if other == exchange or (crypto, other) not in self.books:
+                continue
+            for buy_exchange, sell_exchange in ((exchange, other), (other, exchange)):
+                signal = self.evaluate(crypto, buy_exchange, sell_exchange)
+                if signal:
+                    signals.append(signal)
+
+        for signal in signals:
+            self.record_latency(signal, received_at)
+            self.publish(signal)
+        return signals
+
+    def evaluate(
+        self, crypto: str, buy_exchange: str, sell_exchange: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Size the opportunity of buying on one venue and selling on another.
+
+        Asks of the buying venue are walked against bids of the selling venue
+        for as long as the bid, net of fees, still exceeds the ask plus fees.
+        Both books are moved to a common scale and fees to parts per million,
+        so the walk is done in exact integer arithmetic.
+
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param buy_exchange: The exchange to buy from.
+        :type buy_exchange: str
+        :param sell_exchange: The exchange to sell to.
+        :type sell_exchange: str
+        :return: The changed opportunity or None if nothing changed.
+        :rtype: Optional[Dict[str, Any]]
+        """
+        buy_book = self.books[(crypto, buy_exchange)]
+        sell_book = self.books[(crypto, sell_exchange)]
+        price_decimals = max(buy_book["price_decimals"], sell_book["price_decimals"])
+        amount_decimals = max(buy_book["amount_decimals"], sell_book["amount_decimals"])
+        asks = rescale_book(buy_book, price_decimals, amount_decimals)["asks"]
+        bids = rescale_book(sell_book, price_decimals, amount_decimals)["bids"]
+        buy_fee = FEE_SCALE + round(self.fees.get(buy_exchange, 0.0) * FEE_SCALE)
+        sell_fee = FEE_SCALE - round(self.fees.get(sell_exchange, 0.0) * FEE_SCALE)
+
+        size = 0
+        cost = 0
+        profit = 0
+        ask_index, bid_index = 0, 0
+        ask_left = asks[0]["amount"] if asks else 0
+        bid_left = bids[0]["amount"] if bids else 0
+        while ask_index < len(asks) and bid_index < len(bids):
+            ask_price = asks[ask_index]["price"] * buy_fee
+            bid_price = bids[bid_index]["price"] * sell_fee
+            if bid_price <= ask_price:
+                break
+            executable = min(ask_left, bid_left)
+            size += executable
+            cost += executable * ask_price
+            profit += executable * (bid_price - ask_price)
+            ask_left -= executable
+            bid_left -= executable
+            if ask_left <= 0:
+                ask_index += 1
+                if ask_index < len(asks):
+                    ask_left = asks[ask_index]["amount"]
+            if bid_left <= 0:
+                bid_index += 1
+                if bid_index < len(bids):
+                    bid_left = bids[bid_index]["amount"]
+
+        key = (crypto, buy_exchange, sell_exchange)
+        previous = self.opportunities.get(key)
+        if size <= 0:
+            if previous is None:
+                return None
+            del self.opportunities[key]
+            return dict(previous, status="closed")
+
+        notional_decimals = price_decimals + amount_decimals + FEE_DECIMALS
+        opportunity = {
+            "crypto": crypto,
+            "buy_exchange": buy_exchange,
+            "sell_exchange": sell_exchange,
+            "buy_price": to_decimal_string(asks[0]["price"], price_decimals),
+            "sell_price": to_decimal_string(bids[0]["price"], price_decimals),
+            "size": to_decimal_string(size, amount_decimals),
+            "cost": to_decimal_string(cost, notional_decimals),
+            "profit": to_decimal_string(profit, notional_decimals),
+            "profit_percentage": 100 * profit / cost,
+        }
+        if previous and all(
+            previous[field] == opportunity[field] for field in opportunity
+        ):
+            return None
+        opportunity["status"] = "updated" if previous else "opened"
+        self.opportunities[key] = opportunity
+        return opportunity
+
+    def record_latency(self, signal: Dict[str, Any], received_at: float) -> None:
+        """
+        Stamp a signal with the time elapsed since its book was received.
+
+        :param signal: The opportunity being emitted.
+        :type signal: Dict[str, Any]
+        :param received_at: Monotonic time at which the book was received.
+        :type received_at: float
+        """
+        latency_ms = (time.monotonic() - received_at) * 1000
+        signal["detection_latency_ms"] = latency_ms
+        signal["detected_at"] = time.time()
+        self.latency["count"] += 1
+        self.latency["last_ms"] = latency_ms
+        self.latency["total_ms"] += latency_ms
+        self.latency["max_ms"] = max(self.latency["max_ms"], latency_ms)
+
+    def get_latency_stats(self) -> Dict[str, Any]:
+        """
+        Get the book-update-to-signal latency statistics.
+
+        :return: The number of signals and their last, mean and max latency.
+        :rtype: Dict[str, Any]
+        """
+        count = self.latency["count"]
+        return {
+            "count": count,
+            "last_ms": self.latency["last_ms"],
+            "mean_ms": self.latency["total_ms"] / count if count else None,
+            "max_ms": self.latency["max_ms"],
+        }
+
+    def get_opportunities(self, crypto: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the currently open opportunities, most profitable first.
+
+        :param crypto: Restrict the opportunities to a cryptocurrency.
+        :type crypto: Optional[str]
+        :return: The open opportunities.
+        :rtype: List[Dict[str, Any]]
+        """
+        opportunities = [
+            opportunity
+            for key, opportunity in self.opportunities.items()
+            if crypto is None or key[0] == crypto
+        ]
+        opportunities.sort(key=lambda x: Decimal(x["profit"]), reverse=True)
+        return opportunities
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Register a queue that receives every emitted signal.
+
+        :return: The subscriber queue.
+        :rtype: asyncio.Queue
+        """
+        queue = asyncio.Queue(maxsize=1000)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        """
+        Remove a subscriber queue.
+
+        :param queue: The subscriber queue.
+        :type queue: asyncio.Queue
+        """
+        self.subscribers.discard(queue)
+
+    def publish(self, signal: Dict[str, Any]) -> None:
+        """
+        Push a signal to every subscriber, dropping it for slow consumers.
+
+        :param signal: The opportunity being emitted.
+        :type signal: Dict[str, Any]
+        """
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(signal)
+            except asyncio.QueueFull:
+                logger.warning("Dropping arbitrage signal for a slow subscriber.")
+
+    def on_snapshot(
+        self, exchange: str, crypto: str, kind: str, snapshot: Dict[str, Any]
+    ) -> None:
+        """
+        Feed the order books refreshed by the polling scheduler to the scanner.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind.
+        :type kind: str
+        :param snapshot: The refreshed snapshot.
+        :type snapshot: Dict[str, Any]
+        """
+        if kind == "book":
+            self.update_book(
+                crypto, exchange, snapshot["data"], snapshot["received_at"]
+            )
+
+    async def pin_books(self) -> None:
+        """
+        Keep every supported book polled at the scanner's interval.
+        """
+        while True:
+            try:
+                for crypto in NAMES:
+                    for exchange in await get_supported_exchanges(crypto):
+                        scheduler.pin(
+                            EXCHANGE_MAP[exchange], crypto, "book", self.poll_interval
+                        )
+                return
+            except Exception as e:
+                logger.warning("Arbitrage scanner failed to pin the books: %s", e)
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        """
+        Start scanning the books polled by the scheduler.
+        """
+        if self.task is None:
+            scheduler.add_listener(self.on_snapshot)
+            self.task = asyncio.create_task(self.pin_books())
+
+    async def stop(self) -> None:
+        """
+        Stop scanning.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            scheduler.listeners.remove(self.on_snapshot)
+            self.task = None
+
+
+scanner = ArbitrageScanner(
+    load_fees(),
+    poll_interval=float(os.environ.get("ARBITRAGE_POLL_INTERVAL", "5")),
+    depth=int(os.environ.get("ARBITRAGE_DEPTH", "50")),
+)
@@ -0,0 +1,473 @@
+import asyncio
+import bisect
+import hashlib
+import hmac
+import os
+from contextvars import ContextVar
+from urllib.parse import quote
+
+from aiohttp import ClientConnectionError, ClientTimeout
+
+from exchanges.fixed_point import LazyLevels
+from exchanges.utils import shared_session
+from logger.app_logger import get_logger
+from offload import offloader
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+
+logger = get_logger(__name__)
+
+
+# Set while serving another node, so resources are fetched from the venues
+# rather than routed again when two nodes briefly disagree on the owner.
+serving_locally: ContextVar[bool] = ContextVar("serving_locally", default=False)
+
+Fetcher = Callable[[str, str, Optional[int]], Awaitable[Any]]
+
+
+def get_hash(key: str) -> int:
+    """
+    Hash a key onto the ring.
+
+    :param key: The key.
+    :type key: str
+    :return: The 64 bit position of the key.
+    :rtype: int
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str], replicas: int = 100) -> None:
+        """
+        Initializes a HashRing instance, assigning keys to nodes by
+        consistent hashing.
+
+        Every node is placed at replicas points of the ring and a key belongs
+        to the first node point after it, so when a node joins or leaves only
+        the keys of its own arcs move.
+
+        :param nodes: The node URLs.
+        :type nodes: Iterable[str]
+        :param replicas: The number of points per node.
+        :type replicas: int
+        """
+        points = sorted(
+            (get_hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def get_owner(self, key: str) -> Optional[str]:
+        """
+        Get the node owning a key.
+
+        :param key: The key.
+        :type key: str
+        :return: The node URL, None when the ring is empty.
+        :rtype: Optional[str]
+        """
+        if not self.hashes:
+            return None
+        index = bisect.bisect(self.hashes, get_hash(key)) % len(self.hashes)
+        return self.nodes[index]
+
+
+def encode_snapshot(kind: str, data: Any) -> Any:
+    """
+    Encode a polled resource to be sent to another node.
+
+    Book sides are sent as the raw levels they were decoded from.
+
+    :param kind: The resource kind ("book", "trades" or "tickers").
+    :type kind: str
+    :param data: The resource.
+    :type data: Any
+    :return: The JSON serializable resource.
+    :rtype: Any
+    """
+    if kind != "book":
+        return data
+    return {
+        "bids": data["bids"].levels,
+        "asks": data["asks"].levels,
+        "keyed": data["bids"].keyed,
+        "price_decimals": data["price_decimals"],
+        "amount_decimals": data["amount_decimals"],
+    }
+
+
+def decode_snapshot(kind: str, payload: Any) -> Any:
+    """
+    Decode a resource received from another node.
+
+    :param kind: The resource kind ("book", "trades" or "tickers").
+    :type kind: str
+    :param payload: The decoded JSON resource.
+    :type payload: Any
+    :return: The resource, as the local fetchers return it.
+    :rtype: Any
+    """
+    if kind != "book":
+        return payload
+    price_decimals = payload["price_decimals"]
+    amount_decimals = payload["amount_decimals"]
+    return {
+        "bids": LazyLevels(
+            payload["bids"], price_decimals, amount_decimals, True, payload["keyed"]
+        ),
+        "asks": LazyLevels(
+            payload["asks"], price_decimals, amount_decimals, False, payload["keyed"]
+        ),
+        "price_decimals": price_decimals,
+        "amount_decimals": amount_decimals,
+    }
+
+
+class Cluster:
+    def __init__(
+        self,
+        node: Optional[str],
+        seeds: List[str],
+        token: Optional[str] = None,
+        replicas: int = 100,
+        health_interval: float = 2,
+        timeout: float = 10,
+        connect_timeout: float = 1,
+    ) -> None:
+        """
+        Initializes a Cluster instance, sharding the (exchange, crypto) pairs
+        across the nodes serving the app.
+
+        Each pair is owned by one live node, the only one polling it from the
+        venue. The other nodes read the owner's published snapshots instead.
+        Nodes announce themselves to the seeds when they start and leave
+        when they stop, and peers are health checked, so ownership moves to
+        the remaining nodes when one joins, leaves or stops responding.
+
+        :param node: The URL other nodes reach this node at, None to disable
+            clustering.
+        :type node: Optional[str]
+        :param seeds: The URLs of the nodes to announce this node to.
+        :type seeds: List[str]
+        :param token: The token nodes authenticate each other with.
+        :type token: Optional[str]
+        :param replicas: The number of ring points per node.
+        :type replicas: int
+        :param health_interval: Seconds between two health checks of the peers.
+        :type health_interval: float
+        :param timeout: Seconds a snapshot is awaited from its owner.
+        :type timeout: float
+        :param connect_timeout: Seconds a connection to a peer is awaited
+            before it is considered down.
+        :type connect_timeout: float
+        """
+        self.node = node.rstrip("/") if node else None
+        self.token = token
+        self.replicas = replicas
+        self.health_interval = health_interval
+        self.timeout = ClientTimeout(total=timeout, sock_connect=connect_timeout)
+        self.health_timeout = ClientTimeout(total=connect_timeout * 2)
+        self.nodes: Set[str] = {seed.rstrip("/") for seed in seeds if seed.strip()}
+        if self.node:
+            self.nodes.add(self.node)
+        self.live: Set[str] = {self.node} if self.node else set()
+        self.ring = HashRing(self.live, replicas)
+        self.task: Optional[asyncio.Task] = None
+        self.routed = 0
+        self.served = 0
+        self.rebalances = 0
+
+    def is_enabled(self) -> bool:
+        """
+        Check whether this node is part of a cluster.
+
+        :return: True when CLUSTER_SELF is set.
+        :rtype: bool
+        """
+        return self.node is not None
+
+    def get_headers(self) -> Dict[str, str]:
+        """
+        Get the headers of the requests to other nodes.
+
+        :return: The headers.
+        :rtype: Dict[str, str]
+        """
+        return {"X-Cluster-Token": self.token} if self.token else {}
+
+    def check_token(self, token: str) -> bool:
+        """
+        Check the token of a request from another node.
+
+        :param token: The X-Cluster-Token header.
+        :type token: str
+        :return: Whether the token matches, always True when none is set.
+        :rtype: bool
+        """
+        return not self.token or hmac.compare_digest(token, self.token)
+
+    def set_live(self, live: Set[str]) -> None:
+        """
+        Replace the live nodes, rebuilding the ring when they changed.
+
+        :param live: The live node URLs.
+        :type live: Set[str]
+        """
+        if live == self.live:
+            return
+        joined = sorted(live - self.live)
+        left = sorted(self.live - live)
+        self.live = live
+        self.ring = HashRing(live, self.replicas)
+        self.rebalances += 1
+        logger.info(
+            f"Rebalanced the cluster over {len(live)} nodes, joined: {joined}, left: {left}."
+        )
+
+    def add_node(self, node: str) -> None:
+        """
+        Add a node that announced itself.
+
+        :param node: The node URL.
+        :type node: str
+        """
+        node = node.rstrip("/")
+        self.nodes.add(node)
+        self.set_live(self.live | {node})
+
+    def remove_node(self, node: str) -> None:
+        """
+        Take a node that left or is unreachable out of the ring. It is put
+        back when it passes a health check again.
+
+        :param node: The node URL.
+        :type node: str
+        """
+        node = node.rstrip("/")
+        if node != self.node:
+            self.set_live(self.live - {node})
+
+    def get_owner(self, exchange: str, crypto: str) -> Optional[str]:
+        """
+        Get the node owning a pair.
+
+        :param exchange: The exchange name.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :return: The node URL, None when clustering is disabled.
+        :rtype: Optional[str]
+        """
+        # Crypto enums format as "Crypto.BTC", so keys use their value.
+        crypto = getattr(crypto, "value", crypto)
+        return self.ring.get_owner(f"{exchange}:{crypto}")
+
+    def get_remote_owner(self, exchange: str, crypto: str) -> Optional[str]:
+        """
+        Get the node a pair is read from, when it is not this one.
+
+        :param exchange: The exchange name.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :return: The owner's URL, None when the pair is fetched locally.
+        :rtype: Optional[str]
+        """
+        if not self.is_enabled() or serving_locally.get():
+            return None
+        owner = self.get_owner(exchange, crypto)
+        return owner if owner != self.node else None
+
+    async def fetch(
+        self,
+        kind: str,
+        exchange: str,
+        crypto: str,
+        limit: Optional[int],
+        fetch_local: Fetcher,
+    ) -> Any:
+        """
+        Fetch a resource from its owner, or from the venue when this node
+        owns it.
+
+        An owner that cannot be reached is taken out of the ring and the
+        resource is fetched from the next owner. Errors answered by the owner
+        are raised.
+
+        :param kind: The resource kind ("book", "trades" or "tickers").
+        :type kind: str
+        :param exchange: The exchange name.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param limit: The number of items, for trades.
+        :type limit: Optional[int]
+        :param fetch_local: Fetches the resource from the venue.
+        :type fetch_local: Fetcher
+        :return: The resource.
+        :rtype: Any
+        """
+        while True:
+            owner = self.get_remote_owner(exchange, crypto)
+            if owner is None:
+                return await fetch_local(exchange, crypto, limit)
+            url = f"{owner}/internal/snapshot/{kind}/{exchange}/{quote(crypto, safe='')}"
+            if limit is not None:
+                url += f"?limit={limit}"
+            try:
+                async with shared_session.request(
+                    "GET", url, headers=self.get_headers(), timeout=self.timeout
+                ) as response:
+                    body = await response.read()
+                    response.raise_for_status()
+            except ClientConnectionError as e:
+                logger.warning(
+                    "Failed to reach %s, taking it out of the ring: %s", owner, e
+                )
+                self.remove_node(owner)
+                continue
+            self.routed += 1
+            return decode_snapshot(kind, await offloader.decode(body))
+
+    def route(self, kind: str, fetch_local: Fetcher) -> Fetcher:
+        """
+        Wrap a venue fetcher so that the resources owned by other nodes are
+        read from them.
+
+        :param kind: The resource kind ("book", "trades" or "tickers").
+        :type kind: str
+        :param fetch_local: Fetches the resource from the venue.
+        :type fetch_local: Fetcher
+        :return: The routed fetcher.
+        :rtype: Fetcher
+        """
+
+        async def fetch(exchange: str, crypto: str, limit: Optional[int] = None) -> Any:
+            return await self.fetch(kind, exchange, crypto, limit, fetch_local)
+
+        return fetch
+
+    async def check_node(self, node: str) -> Optional[List[str]]:
+        """
+        Health check a peer.
+
+        :param node: The node URL.
+        :type node: str
+        :return: The nodes known to the peer, None when it is down.
+        :rtype: Optional[List[str]]
+        """
+        try:
+            async with shared_session.request(
+                "GET",
+                f"{node}/internal/health",
+                headers=self.get_headers(),
+                timeout=self.health_timeout,
+            ) as response:
+                response.raise_for_status()
+                return (await response.json())["nodes"]
+        except Exception:
+            return None
+
+    async def check_nodes(self) -> None:
+        """
+        Health check every known peer and rebuild the ring from those that
+        answered, learning the nodes they know of.
+        """
+        peers = sorted(self.nodes - {self.node})
+        results = await asyncio.gather(*(self.check_node(peer) for peer in peers))
+        live = {self.node}
+        for peer, known in zip(peers, results):
+            if known is not None:
+                live.add(peer)
+                self.nodes.update(known)
+        self.set_live(live)
+
+    async def announce(self, path: str) -> None:
+        """
+        Notify the live peers that this node joined or is leaving.
+
+        :param path: "join" or "leave".
+        :type path: str
+        """
+
+        async def notify(peer: str) -> None:
+            try:
+                async with shared_session.request(
+                    "POST",
+                    f"{peer}/internal/{path}",
+                    headers=self.get_headers(),
+                    json={"node": self.node},
+                    timeout=self.health_timeout,
+                ) as response:
+                    response.raise_for_status()
+            except Exception as e:
+                logger.warning("Failed to notify %s of the %s: %s", peer, path, e)
+
+        peers = sorted(self.live - {self.node})
+        await asyncio.gather(*(notify(peer) for peer in peers))
+
+    async def run(self) -> None:
+        """
+        Health check the peers until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_nodes()
+            except Exception:
+                logger.exception("Cluster health check failed.")
+
+    async def start(self) -> None:
+        """
+        Find the live peers, join them and start health checking them.
+        """
+        if not self.is_enabled() or self.task is not None:
+            return
+        await self.check_nodes()
+        await self.announce("join")
+        self.task = asyncio.create_task(self.run())
+        logger.info(f"Joined the cluster as {self.node} with {sorted(self.live)}.")
+
+    async def stop(self) -> None:
+        """
+        Stop health checking and leave the cluster.
+        """
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        await self.announce("leave")
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        Get the membership of the cluster as seen by this node.
+
+        :return: The node, the known and live nodes, and the routing counters.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            "node": self.node,
+            "nodes": sorted(self.nodes),
+            "live": sorted(self.live),
+            "rebalances": self.rebalances,
+            "routed": self.routed,
+            "served": self.served,
+        }
+
+
+cluster = Cluster(
+    os.environ.get("CLUSTER_SELF") or None,
+    os.environ.get("CLUSTER_NODES", "").split(","),
+    token=os.environ.get("CLUSTER_TOKEN") or None,
+    replicas=int(os.environ.get("CLUSTER_REPLICAS", "100")),
+    health_interval=float(os.environ.get("CLUSTER_HEALTH_INTERVAL", "2")),
+    timeout=float(os.environ.get("CLUSTER_TIMEOUT", "10")),
+    connect_timeout=float(os.environ.get("CLUSTER_CONNECT_TIMEOUT", "1")),
+)
@@ -0,0 +1,159 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Encoder:
+    def __init__(self, encoding: str) -> None:
+        """
+        Initializes an Encoder instance, a streaming compressor.
+
+        :param encoding: "br" or "gzip".
+        :type encoding: str
+        """
+        self.encoding = encoding
+        if encoding == "br":
+            # Quality 4 compresses better than gzip at a similar speed.
+            self.compressor = brotli.Compressor(quality=4)
+        else:
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """
+        Compress a chunk, flushing it so that it can be decoded right away.
+
+        :param data: The chunk.
+        :type data: bytes
+        :param finish: Whether this is the last chunk.
+        :type finish: bool
+        :return: The compressed bytes.
+        :rtype: bytes
+        """
+        if self.encoding == "br":
+            compressed = self.compressor.process(data)
+            if finish:
+                return compressed + self.compressor.finish()
+            return compressed + self.compressor.flush()
+        compressed = self.compressor.compress(data)
+        return compressed + self.compressor.flush(
+            zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH
+        )
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the content coding from an Accept-Encoding header.
+
+    :param accept_encoding: The header value (Ex: "gzip, br;q=0.9").
+    :type accept_encoding: str
+    :return: "br" when brotli is installed and accepted, else "gzip" when
+        accepted, else None.
+    :rtype: Optional[str]
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        if weights.get(coding, weights.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024) -> None:
+        """
+        Initializes a CompressionMiddleware instance, compressing response
+        bodies with brotli or gzip as negotiated with the client.
+
+        Streamed bodies are flushed chunk by chunk, so newline delimited
+        streams are still delivered as they are produced. Server-sent events
+        and bodies already encoded are passed through.
+
+        :param app: The application.
+        :type app: ASGIApp
+        :param minimum_size: Size in bytes under which single chunk bodies are
+            sent uncompressed.
+        :type minimum_size: int
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        encoder: Optional[Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                passthrough = "content-encoding" in headers or headers.get(
+                    "content-type", ""
+                ).startswith("text/event-stream")
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                if start is not None:
+                    await send(start)
+                    start = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    start = None
+                    passthrough = True
+                    return
+                encoder = Encoder(encoding)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                body = encoder.compress(body, finish=not more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+                start = None
+            else:
+                body = encoder.compress(body, finish=not more_body)
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_compressed)
@@ -14,3 +14,10 @@ class SignatureError(Exception):
     def __init__(self, status_code, detail):
         self.status_code = status_code
         self.detail = detail
+
+
+class OverloadError(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
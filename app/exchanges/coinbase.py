@@ -1,120 +1,281 @@
+import asyncio
 import hashlib
-import hmac
-import os
 import time
+from contextlib import aclosing
 
 from fastapi.responses import Response
 
 from app.supported_cryptos import NAMES
-from custom_exceptions import EncodeError, APIKeyError
+from custom_exceptions import EncodeError
 from urls import (
     COINBASE_PRICE_URL,
     COINBASE_ASSETS_URL,
     COINBASE_TRADES_URL,
+    COINBASE_TRADES_AFTER_URL,
     COINBASE_BALANCES_URL,
+    COINBASE_TICKER_URL,
 )
 from .exchange_interface import ExchangeInterface
-from .utils import make_request as request_helper, structure_coinbase
-from logger.app_logger import logger
-from typing import Any, Dict, List, Union
+from .fixed_point import DEFAULT_DECIMALS, decimals_from_increment, LazyLevels
+from .private import ApiKey, PrivateClient
+from .utils import (
+    compact_book,
+    iter_completed,
+    make_request as request_helper,
+    structure_coinbase,
+)
+from logger.app_logger import get_logger
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Union,
+)
+
+
+logger = get_logger(__name__)
 
 
 class Coinbase(ExchangeInterface):
     price_url = COINBASE_PRICE_URL
     assets_url = COINBASE_ASSETS_URL
     trades_url = COINBASE_TRADES_URL
+    trades_after_url = COINBASE_TRADES_AFTER_URL
     balances_url = COINBASE_BALANCES_URL
+    # Requests are signed with a timestamp rather than a nonce, so keys are
+    # shared by concurrent calls.
+    private_client = PrivateClient("COINBASE", hashlib.sha256, str.encode, False)
+    ticker_url = COINBASE_TICKER_URL
+    max_ticker_requests = 10
+    trades_page_size = 1000
+    max_trade_page_requests = 5
     assets = {}
+    scales = {}
+    universe = {}
 
     def __init__(self, crypto_pair: str) -> None:
         """
         Initializes a Coinbase instance.
 
+        The product, book URL and scales of the pair are looked up once, so
+        the assets are loaded first.
+
         :param crypto_pair: The crypto pair.
         :type crypto_pair: str
         """
         self.crypto_pair = crypto_pair
+        self.product = Coinbase.assets[crypto_pair]
+        self.book_url = Coinbase.price_url.format(self.product)
+        self.price_decimals, self.amount_decimals = Coinbase.scales.get(
+            crypto_pair, (DEFAULT_DECIMALS, DEFAULT_DECIMALS)
+        )
 
-    async def get_trades(self, limit: int) -> List[Dict[str, Any]]:
+    async def iter_trades(self, limit: int) -> AsyncIterator[List[Dict[str, Any]]]:
         """
-        Retrieve trades from Coinbase exchange.
+        Retrieve trades from Coinbase exchange page by page, newest first.
+
+        Trade ids are sequential per product, so once the latest page is in
+        the "after" cursor of every older page is known and the pages are
+        fetched concurrently, yielded as they arrive.
 
         :param limit: The maximum number of trades to retrieve.
         :type limit: int
-        :return: A list of structured trades.
-        :rtype: List[Dict[str, Any]]
+        :return: Pages of structured trades.
+        :rtype: AsyncIterator[List[Dict[str, Any]]]
         """
-        complete_url = Coinbase.trades_url.format(
-            Coinbase.assets[self.crypto_pair], limit
+        product = self.product
+        page_size = min(limit, Coinbase.trades_page_size)
+        trades = await request_helper(
+            Coinbase.trades_url.format(product, page_size),
+            "GET",
+            transform=structure_coinbase,
+        )
+        yield trades
+        remaining = limit - len(trades)
+        if remaining <= 0 or len(trades) < page_size:
+            return
+
+        cursors = []
+        after = min(trade["trade_id"] for trade in trades)
+        while remaining > 0 and after > 1:
+            size = min(remaining, Coinbase.trades_page_size)
+            cursors.append((after, size))
+            after -= size
+            remaining -= size
+        pages = iter_completed(
+            (
+                request_helper(
+                    Coinbase.trades_after_url.format(product, size, after),
+                    "GET",
+                    transform=structure_coinbase,
+                )
+                for after, size in cursors
+            ),
+            Coinbase.max_trade_page_requests,
         )
-        response = await request_helper(complete_url, "GET")
-        structured_response = structure_coinbase(response)
-        return structured_response
+        async with aclosing(pages):
+            async for trades in pages:
+                yield trades
 
-    async def get_bid_price(self) -> List[Dict[str, float]]:
+    async def get_order_book(self) -> Dict[str, Any]:
+        """
+        Retrieves both sides of the order book from Coinbase with a single request.
+
+        Prices and amounts are fixed-point integers on the pair's price tick
+        and lot size scales, which are returned alongside the levels. Levels
+        are only decoded as far as they are read, best first.
+
+        :return: The bid and ask prices keyed by side, and their decimals.
+        :rtype: Dict[str, Any]
+        """
+        book = await request_helper(self.book_url, "GET", transform=compact_book)
+        return {
+            "bids": LazyLevels(
+                book["bids"], self.price_decimals, self.amount_decimals, True
+            ),
+            "asks": LazyLevels(
+                book["asks"], self.price_decimals, self.amount_decimals, False
+            ),
+            "price_decimals": self.price_decimals,
+            "amount_decimals": self.amount_decimals,
+        }
+
+    async def get_bid_price(self) -> List[Dict[str, int]]:
         """
         Retrieves the bid prices from Coinbase.
 
         :return: The bid prices.
-        :rtype: List[Dict[str, float]]
+        :rtype: List[Dict[str, int]]
         """
-        complete_url = Coinbase.price_url.format(Coinbase.assets[self.crypto_pair])
-        response = await request_helper(complete_url, "GET")
-        response = [
-            {"price": float(bid[0]), "amount": float(bid[1])}
-            for bid in response["bids"]
-        ]
-        return response
+        order_book = await self.get_order_book()
+        return order_book["bids"]
 
-    async def get_ask_price(self) -> List[Dict[str, float]]:
+    async def get_ask_price(self) -> List[Dict[str, int]]:
         """
         Retrieves the ask prices from Coinbase.
 
         :return: The ask prices.
-        :rtype: List[Dict[str, float]]
+        :rtype: List[Dict[str, int]]
         """
-        complete_url = Coinbase.price_url.format(Coinbase.assets[self.crypto_pair])
-        response = await request_helper(complete_url, "GET")
-        response = [
-            {"price": float(ask[0]), "amount": float(ask[1])}
-            for ask in response["asks"]
-        ]
-        return response
+        order_book = await self.get_order_book()
+        return order_book["asks"]
 
     @classmethod
-    async def get_assets(cls) -> Dict[str, str]:
+    async def get_assets(cls, refresh: bool = False) -> Dict[str, str]:
         """
         Retrieves the assets from Coinbase.
 
+        USD pairs are keyed by crypto and pairs quoted in another supported
+        crypto by base and quote (Ex: "ETH/BTC").
+
+        :param refresh: Whether to fetch the assets again when already loaded.
+        :type refresh: bool
         :raises Exception: If an error occurs while fetching the assets.
 
         :return: The assets dictionary.
         :rtype: Dict[str, str]
         """
-        if not cls.assets:
+        if refresh or not cls.assets:
             response = await request_helper(cls.assets_url, "GET")
             assets = {}
+            scales = {}
+            universe = {}
             for asset in response:
-                if asset["base_currency"] in NAMES and asset["quote_currency"] == "USD":
-                    assets[asset["base_currency"]] = asset["id"]
+                if asset["quote_currency"] == "USD":
+                    universe[asset["base_currency"]] = asset["id"]
+                if asset["base_currency"] not in NAMES:
+                    continue
+                if asset["quote_currency"] == "USD":
+                    crypto = asset["base_currency"]
+                elif asset["quote_currency"] in NAMES:
+                    crypto = f"{asset['base_currency']}/{asset['quote_currency']}"
+                else:
+                    continue
+                assets[crypto] = asset["id"]
+                scales[crypto] = (
+                    decimals_from_increment(asset["quote_increment"]),
+                    decimals_from_increment(asset["base_increment"]),
+                )
+            cls.scales = scales
+            cls.universe = universe
             cls.assets = assets
         return cls.assets
 
+    @classmethod
+    async def get_tickers(
+        cls,
+        cryptos: Optional[List[str]] = None,
+        throttle: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> Dict[str, Dict[str, Optional[str]]]:
+        """
+        Retrieves the best bid, best ask and last price of many assets.
+
+        Coinbase has no multi-product ticker, so unlike the other exchanges it
+        cannot serve tickers without one request per pair. The tickers are
+        fetched concurrently, at most max_ticker_requests at a time, and every
+        request after the first waits for the throttle, so a fetch of many
+        pairs is spread over time to stay within the exchange's budget.
+
+        :param cryptos: The cryptocurrencies, defaults to every USD pair listed.
+        :type cryptos: Optional[List[str]]
+        :param throttle: Awaited before every request after the first.
+        :type throttle: Optional[Callable[[], Awaitable[None]]]
+        :return: The tickers keyed by crypto.
+        :rtype: Dict[str, Dict[str, Optional[str]]]
+        """
+        await cls.get_assets()
+        products = {
+            crypto: product
+            for crypto, product in cls.universe.items()
+            if cryptos is None or crypto in cryptos
+        }
+        semaphore = asyncio.Semaphore(cls.max_ticker_requests)
+
+        async def get_ticker(index: int, product: str) -> Dict[str, Any]:
+            async with semaphore:
+                # The first request is paid for by whoever started the fetch.
+                if index and throttle is not None:
+                    await throttle()
+                return await request_helper(cls.ticker_url.format(product), "GET")
+
+        responses = await asyncio.gather(
+            *(
+                get_ticker(index, product)
+                for index, product in enumerate(products.values())
+            ),
+            return_exceptions=True,
+        )
+        tickers = {}
+        for crypto, response in zip(products, responses):
+            if isinstance(response, Exception):
+                logger.warning("Failed to fetch coinbase ticker of %s.", crypto)
+                continue
+            tickers[crypto] = {
+                "bid": response.get("bid"),
+                "ask": response.get("ask"),
+                "last": response.get("price"),
+            }
+        return tickers
+
     @classmethod
     async def get_balance_details(cls):
-        headers = cls.get_authorization_headers(cls.balances_url, None, "GET")
-        response = await request_helper(cls.balances_url, "GET", headers)
+        async with cls.private_client.key() as api_key:
+            headers = cls.get_authorization_headers(
+                api_key, cls.balances_url, None, "GET"
+            )
+            response = await request_helper(cls.balances_url, "GET", headers)
         return response
 
     @classmethod
-    def get_authorization_headers(cls, url, body, request_method):
+    def get_authorization_headers(cls, api_key: ApiKey, url, body, request_method):
         timestamp = str(int(time.time()))
         message = timestamp + request_method + url + (body or "")
         try:
             encoded_message = message.encode("utf-8")
-            api_key = os.environ["COINBASE_API_KEY"]
-            secret_key = os.environ["COINBASE_SECRET_KEY"]
-            secret_key_bytes = secret_key.encode("utf-8")
         except UnicodeEncodeError:
             logger.exception(
                 "Failed to encode the message while building coinbase authorization headers."
@@ -123,21 +284,11 @@ class Coinbase(ExchangeInterface):
                 status_code=500,
                 detail="Failed to encode the message while building coinbase authorization headers.",
             )
-        except KeyError:
-            logger.exception(
-                "Coinbase keys needs to be set to be able to make the API call."
-            )
-            raise APIKeyError(
-                status_code=500,
-                detail="Coinbase keys needs to be set to be able to make the API call.",
-            )
 
-        signature = hmac.new(
-            secret_key_bytes, encoded_message, hashlib.sha256
-        ).hexdigest()
+        signature = api_key.sign(encoded_message).hexdigest()
 
         return {
             "CB-ACCESS-SIGN": signature,
             "CB-ACCESS-TIMESTAMP": timestamp,
-            "CB-ACCESS-KEY": api_key,
+            "CB-ACCESS-KEY": api_key.api_key,
         }
@@ -1,7 +1,13 @@
 from abc import ABC, abstractmethod
 
+from typing import Any, Dict, List
+
 
 class ExchangeInterface(ABC):
+    @abstractmethod
+    def get_order_book():
+        pass
+
     @abstractmethod
     def get_bid_price():
         pass
@@ -14,6 +20,31 @@ class ExchangeInterface(ABC):
     def get_assets():
         pass
 
+    @classmethod
+    def get_tickers():
+        pass
+
     @abstractmethod
-    def get_trades():
+    def iter_trades():
         pass
+
+    async def get_trades(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Retrieve the most recent trades, newest first, paginating the exchange
+        as needed.
+
+        :param limit: The maximum number of trades to retrieve.
+        :type limit: int
+        :return: A list of structured trades.
+        :rtype: List[Dict[str, Any]]
+        """
+        pages = []
+        async for page in self.iter_trades(limit):
+            if page:
+                if page[0]["time"] < page[-1]["time"]:
+                    page = page[::-1]
+                pages.append(page)
+        # Pages cover disjoint spans but complete in any order, so ordering
+        # the pages by their newest trade orders the trades.
+        pages.sort(key=lambda page: page[0]["time"], reverse=True)
+        return [trade for page in pages for trade in page][:limit]
@@ -0,0 +1,311 @@
+import heapq
+import operator
+from collections.abc import Sequence
+from decimal import Decimal
+
+from tracing import span
+from typing import Any, Dict, Iterator, Iterable, List, Optional, Tuple, Union
+
+
+# Scale used for pairs whose venue does not publish tick or lot sizes.
+DEFAULT_DECIMALS = 8
+
+
+def decimals_from_increment(increment: Union[str, float, int]) -> int:
+    """
+    Get the number of decimals implied by a price tick or lot size.
+
+    :param increment: The increment (Ex: "0.01", 1e-08).
+    :type increment: Union[str, float, int]
+    :return: The number of decimals.
+    :rtype: int
+    """
+    exponent = Decimal(str(increment)).normalize().as_tuple().exponent
+    return max(-exponent, 0)
+
+
+def to_fixed(value: Union[str, float, int], decimals: int) -> int:
+    """
+    Parse a decimal string into an integer scaled by 10 ** decimals.
+
+    Digits beyond the scale are only accepted when they are zeros, so the
+    conversion is always exact.
+
+    :param value: The decimal value (Ex: "30000.12").
+    :type value: Union[str, float, int]
+    :param decimals: The number of decimals of the scale.
+    :type decimals: int
+    :raises ValueError: If the value has more precision than the scale.
+    :return: The scaled integer.
+    :rtype: int
+    """
+    if not isinstance(value, str):
+        value = repr(value) if isinstance(value, float) else str(value)
+    if "e" in value or "E" in value:
+        value = format(Decimal(value), "f")
+    whole, _, fraction = value.partition(".")
+    if len(fraction) > decimals:
+        if fraction[decimals:].strip("0"):
+            raise ValueError(f"{value} has more than {decimals} decimals.")
+        fraction = fraction[:decimals]
+    return int(whole + fraction.ljust(decimals, "0"))
+
+
+def to_decimal_string(value: int, decimals: int) -> str:
+    """
+    Format an integer scaled by 10 ** decimals as an exact decimal string.
+
+    :param value: The scaled integer.
+    :type value: int
+    :param decimals: The number of decimals of the scale.
+    :type decimals: int
+    :return: The decimal string (Ex: "30000.12").
+    :rtype: str
+    """
+    if decimals == 0:
+        return str(value)
+    sign = "-" if value < 0 else ""
+    whole, fraction = divmod(abs(value), 10**decimals)
+    fraction = str(fraction).rjust(decimals, "0").rstrip("0")
+    return f"{sign}{whole}.{fraction}" if fraction else f"{sign}{whole}"
+
+
+def parse_fixed(value: Union[str, float, int], decimals: int) -> int:
+    """
+    Parse a decimal string into an integer scaled by 10 ** decimals, taking a
+    shortcut when it is printed with exactly the scale's decimals.
+
+    :param value: The decimal value (Ex: "30000.12").
+    :type value: Union[str, float, int]
+    :param decimals: The number of decimals of the scale.
+    :type decimals: int
+    :raises ValueError: If the value has more precision than the scale.
+    :return: The scaled integer.
+    :rtype: int
+    """
+    if isinstance(value, str) and len(value) > decimals and value[-decimals - 1] == ".":
+        return int(value.replace(".", ""))
+    return to_fixed(value, decimals)
+
+
+def rescale(value: int, from_decimals: int, to_decimals: int) -> int:
+    """
+    Move a scaled integer to a finer scale.
+
+    :param value: The scaled integer.
+    :type value: int
+    :param from_decimals: The number of decimals of the current scale.
+    :type from_decimals: int
+    :param to_decimals: The number of decimals of the target scale.
+    :type to_decimals: int
+    :raises ValueError: If the target scale is coarser than the current one.
+    :return: The rescaled integer.
+    :rtype: int
+    """
+    if to_decimals < from_decimals:
+        raise ValueError("Rescaling to a coarser scale would lose precision.")
+    return value * 10 ** (to_decimals - from_decimals)
+
+
+def iter_rescaled(
+    levels: Iterable[Dict[str, int]], price_factor: int, amount_factor: int
+) -> Iterator[Dict[str, int]]:
+    """
+    Lazily move book levels to a finer scale.
+
+    :param levels: The levels.
+    :type levels: Iterable[Dict[str, int]]
+    :param price_factor: The factor applied to the prices.
+    :type price_factor: int
+    :param amount_factor: The factor applied to the amounts.
+    :type amount_factor: int
+    :return: The rescaled levels.
+    :rtype: Iterator[Dict[str, int]]
+    """
+    if price_factor == 1 and amount_factor == 1:
+        yield from levels
+        return
+    for level in levels:
+        yield {
+            "price": level["price"] * price_factor,
+            "amount": level["amount"] * amount_factor,
+        }
+
+
+def rescale_book(
+    order_book: Dict[str, Any], price_decimals: int, amount_decimals: int
+) -> Dict[str, Any]:
+    """
+    Move both sides of an order book to a finer scale.
+
+    :param order_book: The order book with its price and amount decimals.
+    :type order_book: Dict[str, Any]
+    :param price_decimals: The number of decimals of the target price scale.
+    :type price_decimals: int
+    :param amount_decimals: The number of decimals of the target amount scale.
+    :type amount_decimals: int
+    :return: The rescaled order book.
+    :rtype: Dict[str, Any]
+    """
+    price_factor = 10 ** (price_decimals - order_book["price_decimals"])
+    amount_factor = 10 ** (amount_decimals - order_book["amount_decimals"])
+    if price_factor < 1 or amount_factor < 1:
+        raise ValueError("Rescaling to a coarser scale would lose precision.")
+    rescaled = {"price_decimals": price_decimals, "amount_decimals": amount_decimals}
+    for side in ("bids", "asks"):
+        rescaled[side] = list(
+            iter_rescaled(order_book[side], price_factor, amount_factor)
+        )
+    return rescaled
+
+
+class LazyLevels(Sequence):
+    def __init__(
+        self,
+        levels: List[Any],
+        price_decimals: int,
+        amount_decimals: int,
+        descending: bool,
+        keyed: bool = False,
+    ) -> None:
+        """
+        Initializes a LazyLevels instance, one side of an order book decoded
+        from the raw venue levels only as far as it is read, best level first.
+
+        :param levels: The raw levels, either [price, amount, ...] lists or
+            {"price": ..., "amount": ...} dicts when keyed is True.
+        :type levels: List[Any]
+        :param price_decimals: The number of decimals of the price scale.
+        :type price_decimals: int
+        :param amount_decimals: The number of decimals of the amount scale.
+        :type amount_decimals: int
+        :param descending: Whether the best level has the highest price (bids).
+        :type descending: bool
+        :param keyed: Whether the levels are dicts rather than lists.
+        :type keyed: bool
+        """
+        self.levels = levels
+        self.price_decimals = price_decimals
+        self.amount_decimals = amount_decimals
+        self.descending = descending
+        self.keyed = keyed
+        self.decoded: List[Dict[str, int]] = []
+        self.checked = False
+        self.heap: Optional[List[Tuple[float, int]]] = None
+
+    def get_price(self, level: Any) -> Any:
+        """
+        Get the raw price of a level.
+
+        :param level: The raw level.
+        :type level: Any
+        :return: The raw price.
+        :rtype: Any
+        """
+        return level["price"] if self.keyed else level[0]
+
+    def get_amount(self, level: Any) -> Any:
+        """
+        Get the raw amount of a level.
+
+        :param level: The raw level.
+        :type level: Any
+        :return: The raw amount.
+        :rtype: Any
+        """
+        return level["amount"] if self.keyed else level[1]
+
+    def decode(self, level: Any) -> Dict[str, int]:
+        """
+        Decode a raw level into fixed-point price and amount.
+
+        :param level: The raw level.
+        :type level: Any
+        :return: The decoded level.
+        :rtype: Dict[str, int]
+        """
+        return {
+            "price": parse_fixed(self.get_price(level), self.price_decimals),
+            "amount": parse_fixed(self.get_amount(level), self.amount_decimals),
+        }
+
+    def check_order(self) -> None:
+        """
+        Check whether the venue delivered the side best level first, in which
+        case levels are decoded in place, and otherwise heapify the prices so
+        the best levels are selected one at a time as they are read.
+        """
+        self.checked = True
+        prices = [self.get_price(level) for level in self.levels]
+        # Doubles tell apart every decimal of up to 15 significant digits, so
+        # comparing them is exact for the prices venues publish.
+        if all(isinstance(price, str) for price in prices) and (
+            max(map(len, prices), default=0) <= 16
+        ):
+            keys = list(map(float, prices))
+        else:
+            keys = [to_fixed(price, self.price_decimals) for price in prices]
+        compare = operator.ge if self.descending else operator.le
+        if all(map(compare, keys, keys[1:])):
+            return
+        sign = -1 if self.descending else 1
+        self.heap = [(sign * key, index) for index, key in enumerate(keys)]
+        heapq.heapify(self.heap)
+
+    def decode_until(self, count: int) -> None:
+        """
+        Decode the best levels until count of them are available.
+
+        :param count: The number of levels needed.
+        :type count: int
+        """
+        with span("parse"):
+            if not self.checked:
+                self.check_order()
+            decoded = self.decoded
+            if self.heap is None:
+                for level in self.levels[len(decoded) : count]:
+                    decoded.append(self.decode(level))
+            else:
+                while len(decoded) < count and self.heap:
+                    _, index = heapq.heappop(self.heap)
+                    decoded.append(self.decode(self.levels[index]))
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            forward = (index.start or 0) >= 0 and (index.step or 1) > 0
+            if forward and index.stop is not None and index.stop >= 0:
+                self.decode_until(index.stop)
+            else:
+                self.decode_until(len(self.levels))
+        elif index >= 0:
+            self.decode_until(index + 1)
+        else:
+            self.decode_until(len(self.levels))
+        return self.decoded[index]
+
+    def __iter__(self) -> Iterator[Dict[str, int]]:
+        index = 0
+        while True:
+            if index >= len(self.decoded):
+                self.decode_until(index + 1)
+                if index >= len(self.decoded):
+                    return
+            yield self.decoded[index]
+            index += 1
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, LazyLevels):
+            return (
+                self.levels == other.levels
+                and self.keyed == other.keyed
+                and self.price_decimals == other.price_decimals
+                and self.amount_decimals == other.amount_decimals
+            )
+        return list(self) == other
+
+    def __repr__(self) -> str:
+        return f"LazyLevels({len(self.decoded)}/{len(self.levels)} decoded)"
@@ -1,28 +1,43 @@
+import asyncio
 import base64
 import hashlib
-import hmac
 from fastapi.responses import Response
 import json
-import os
-import time
 
 from app.supported_cryptos import NAMES
-from custom_exceptions import APIKeyError, EncodeError, SignatureError
+from custom_exceptions import EncodeError, SignatureError
 from urls import (
     GEMINI_PRICE_URL,
     GEMINI_ASSETS_URL,
     GEMINI_TRADES_URL,
     GEMINI_BALANCES_URL,
     GEMINI_BALANCES_POSTFIX,
+    GEMINI_SYMBOL_DETAILS_URL,
+    GEMINI_PRICEFEED_URL,
 )
 from .exchange_interface import ExchangeInterface
+from .fixed_point import DEFAULT_DECIMALS, decimals_from_increment, LazyLevels
+from .private import ApiKey, PrivateClient
 from .utils import (
+    compact_book,
     make_request as request_helper,
-    make_request_synchronous as request_helper_sync,
     structure_gemini,
 )
-from logger.app_logger import logger
-from typing import Any, Dict, List, Optional, Union
+from logger.app_logger import get_logger
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+
+logger = get_logger(__name__)
 
 
 class Gemini(ExchangeInterface):
@@ -30,144 +45,247 @@ class Gemini(ExchangeInterface):
     assets_url = GEMINI_ASSETS_URL
     trades_url = GEMINI_TRADES_URL
     balances_url = GEMINI_BALANCES_URL
+    private_client = PrivateClient("GEMINI", hashlib.sha384, str.encode)
+    symbol_details_url = GEMINI_SYMBOL_DETAILS_URL
+    pricefeed_url = GEMINI_PRICEFEED_URL
+    trades_page_size = 500
     assets = {}
+    scales = {}
+    universe = {}
 
     def __init__(self, crypto_pair: str) -> None:
         """
         Initializes a Gemini instance.
 
+        The symbol, book URL and scales of the pair are looked up once, so the
+        assets are loaded first.
+
         :param crypto_pair: The crypto pair.
         :type crypto_pair: str
         """
         self.crypto_pair = crypto_pair
+        self.symbol = Gemini.assets[crypto_pair]
+        self.book_url = Gemini.price_url.format(self.symbol)
+        self.price_decimals, self.amount_decimals = Gemini.scales.get(
+            crypto_pair, (DEFAULT_DECIMALS, DEFAULT_DECIMALS)
+        )
 
     @classmethod
-    async def get_assets(cls) -> Dict[str, str]:
+    async def get_assets(cls, refresh: bool = False) -> Dict[str, str]:
         """
         Retrieves the assets from Gemini.
 
+        USD pairs are keyed by crypto and pairs quoted in another supported
+        crypto by base and quote (Ex: "ETH/BTC").
+
+        :param refresh: Whether to fetch the assets again when already loaded.
+        :type refresh: bool
         :raises Exception: If an error occurs while fetching the assets.
 
         :return: The assets dictionary.
         :rtype: Dict[str, str]
         """
-        if not cls.assets:
+        if refresh or not cls.assets:
             response = await request_helper(cls.assets_url)
             assets = {}
+            universe = {}
             for asset in response:
+                if asset.upper().endswith("USD"):
+                    universe[asset.upper()[:-3]] = asset.upper()
                 for crypto in NAMES:
                     if crypto + "USD" == asset.upper():
                         assets[crypto] = asset.upper()
+                    for quote in NAMES - {crypto}:
+                        if crypto + quote == asset.upper():
+                            assets[f"{crypto}/{quote}"] = asset.upper()
+            cls.scales = await cls.get_scales(assets)
+            cls.universe = universe
             cls.assets = assets
         return cls.assets
 
-    async def get_trades(self, limit: int) -> List[Dict[str, Any]]:
+    @classmethod
+    async def get_tickers(
+        cls,
+        cryptos: Optional[List[str]] = None,
+        throttle: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> Dict[str, Dict[str, Optional[str]]]:
+        """
+        Retrieves the last price of many assets with a single request.
+
+        The Gemini price feed covers every pair at once but only carries the
+        last price, so bid and ask are left empty.
+
+        :param cryptos: The cryptocurrencies, defaults to every USD pair listed.
+        :type cryptos: Optional[List[str]]
+        :param throttle: Unused, a single request is made.
+        :type throttle: Optional[Callable[[], Awaitable[None]]]
+        :return: The tickers keyed by crypto.
+        :rtype: Dict[str, Dict[str, Optional[str]]]
+        """
+        await cls.get_assets()
+        symbols = {symbol: crypto for crypto, symbol in cls.universe.items()}
+        response = await request_helper(cls.pricefeed_url)
+        tickers = {}
+        for price in response:
+            crypto = symbols.get(price["pair"])
+            if crypto is None or (cryptos is not None and crypto not in cryptos):
+                continue
+            tickers[crypto] = {"bid": None, "ask": None, "last": price["price"]}
+        return tickers
+
+    @classmethod
+    async def get_scales(cls, assets: Dict[str, str]) -> Dict[str, Tuple[int, int]]:
+        """
+        Retrieves the price tick and lot size decimals of the given assets.
+
+        Gemini only lists symbol names, so the details of every supported
+        symbol are fetched once alongside the assets.
+
+        :param assets: The assets dictionary.
+        :type assets: Dict[str, str]
+        :return: The price and amount decimals keyed by crypto.
+        :rtype: Dict[str, Tuple[int, int]]
+        """
+        cryptos = list(assets)
+        details = await asyncio.gather(
+            *(
+                request_helper(cls.symbol_details_url.format(assets[crypto].lower()))
+                for crypto in cryptos
+            ),
+            return_exceptions=True,
+        )
+        scales = {}
+        for crypto, detail in zip(cryptos, details):
+            if isinstance(detail, Exception):
+                logger.warning(
+                    "Failed to fetch gemini details of %s: %s", crypto, detail
+                )
+                continue
+            scales[crypto] = (
+                decimals_from_increment(detail["quote_increment"]),
+                decimals_from_increment(detail["tick_size"]),
+            )
+        return scales
+
+    async def iter_trades(self, limit: int) -> AsyncIterator[List[Dict[str, Any]]]:
         """
         Retrieve trades from Gemini exchange.
 
+        Gemini's public trades can only be paged forward from a timestamp or
+        trade id and always return the newest matching trades, so the most
+        recent trades cannot be walked backwards and pulls are capped at a
+        single page.
+
         :param limit: The maximum number of trades to retrieve.
         :type limit: int
-        :return: A list of structured trades.
-        :rtype: List[Dict[str, Any]]
+        :return: Pages of structured trades.
+        :rtype: AsyncIterator[List[Dict[str, Any]]]
         """
-        complete_url = Gemini.trades_url.format(Gemini.assets[self.crypto_pair], limit)
-        response = await request_helper(complete_url)
-        structured_response = structure_gemini(response)
-        return structured_response
+        complete_url = Gemini.trades_url.format(
+            self.symbol, min(limit, Gemini.trades_page_size)
+        )
+        yield await request_helper(complete_url, transform=structure_gemini)
 
-    async def get_bid_price(self) -> List[Dict[str, float]]:
+    async def get_order_book(self) -> Dict[str, Any]:
+        """
+        Retrieves both sides of the order book from Gemini with a single request.
+
+        Prices and amounts are fixed-point integers on the pair's price tick
+        and lot size scales, which are returned alongside the levels. Levels
+        are only decoded as far as they are read, best first.
+
+        :return: The bid and ask prices keyed by side, and their decimals.
+        :rtype: Dict[str, Any]
+        """
+        book = await request_helper(self.book_url, transform=compact_book)
+        return {
+            "bids": LazyLevels(
+                book["bids"], self.price_decimals, self.amount_decimals, True
+            ),
+            "asks": LazyLevels(
+                book["asks"], self.price_decimals, self.amount_decimals, False
+            ),
+            "price_decimals": self.price_decimals,
+            "amount_decimals": self.amount_decimals,
+        }
+
+    async def get_bid_price(self) -> List[Dict[str, int]]:
         """
         Retrieves the bid prices from Gemini.
 
         :return: The bid prices.
-        :rtype: List[Dict[str, float]]
-        """
-        complete_url = Gemini.price_url.format(Gemini.assets[self.crypto_pair])
-        response = await request_helper(complete_url)
-        response = [
-            {"price": float(bid["price"]), "amount": float(bid["amount"])}
-            for bid in response["bids"]
-        ]
-        return response
+        :rtype: List[Dict[str, int]]
+        """
+        order_book = await self.get_order_book()
+        return order_book["bids"]
 
-    async def get_ask_price(self) -> List[Dict[str, float]]:
+    async def get_ask_price(self) -> List[Dict[str, int]]:
         """
         Retrieves the ask prices from Gemini.
 
         :return: The ask prices.
-        :rtype: List[Dict[str, float]]
-        """
-        complete_url = Gemini.price_url.format(Gemini.assets[self.crypto_pair])
-        response = await request_helper(complete_url)
-        response = [
-            {"price": float(ask["price"]), "amount": float(ask["amount"])}
-            for ask in response["asks"]
-        ]
-        return response
+        :rtype: List[Dict[str, int]]
+        """
+        order_book = await self.get_order_book()
+        return order_book["asks"]
 
     @classmethod
     async def get_balance_details(cls) -> Union[dict, Response]:
         """
         Get balance details from the Gemini exchange.
 
+        Gemini rejects nonces lower than the last one of a key, so the key is
+        held until the response arrives and concurrent calls use other keys.
+
         :return: The balance details or an error response.
         :rtype: Union[dict, Response]
         """
-        data = {
-            "nonce": str(int(time.time())),
-            "request": GEMINI_BALANCES_POSTFIX,
-        }
-        headers = cls.get_authorization_headers(data)
-        response = request_helper_sync(cls.balances_url, "POST", headers, data)
+        async with cls.private_client.key() as api_key:
+            data = {
+                "nonce": str(api_key.nonces.next()),
+                "request": GEMINI_BALANCES_POSTFIX,
+            }
+            headers = cls.get_authorization_headers(api_key, data)
+            response = await request_helper(cls.balances_url, "POST", headers, data)
+        if not response:
+            return Response(content="No balances to show.", status_code=200)
         return response
 
     @classmethod
-    def get_authorization_headers(cls, data: dict) -> Optional[dict]:
+    def get_authorization_headers(cls, api_key: ApiKey, data: dict) -> dict:
         """
         Get the authorization headers for Gemini API requests.
 
+        :param api_key: The API key.
+        :type api_key: ApiKey
         :param data: The data to include in the request.
         :type data: dict
-        :return: The authorization headers or None if there was an error.
-        :rtype: Optional[dict]
+        :return: The authorization headers.
+        :rtype: dict
         """
-        try:
-            api_key = os.environ["GEMINI_API_KEY"]
-            secret_key = os.environ["GEMINI_SECRET_KEY"]
-        except KeyError:
-            logger.exception(
-                "Gemini keys needs to be set to be able to make the API call."
-            )
-            raise APIKeyError(
-                status_code=500,
-                detail="Gemini keys needs to be set to be able to make the API call.",
-            )
-        payload, signature = cls.get_payload_and_signature(data, secret_key)
+        payload, signature = cls.get_payload_and_signature(data, api_key)
         return {
-            "X-GEMINI-APIKEY": api_key,
+            "X-GEMINI-APIKEY": api_key.api_key,
             "X-GEMINI-PAYLOAD": payload,
             "X-GEMINI-SIGNATURE": signature,
         }
 
     @classmethod
-    def get_payload_and_signature(cls, data: dict, secret_key: str) -> Optional[tuple]:
+    def get_payload_and_signature(cls, data: dict, api_key: ApiKey) -> tuple:
         """
         Get the payload and signature for Gemini API requests.
 
         :param data: The data to include in the request.
         :type data: dict
-        :param secret_key: The secret key for the API.
-        :type secret_key: str
-        :return: The payload and signature or None if there was an error.
-        :rtype: Optional[tuple]
+        :param api_key: The API key.
+        :type api_key: ApiKey
+        :return: The payload and signature.
+        :rtype: tuple
         """
         try:
             encoded_payload = json.dumps(data).encode()
             payload_b64 = base64.b64encode(encoded_payload)
-            secret_key_bytes = secret_key.encode("utf-8")
-            signature = hmac.new(
-                secret_key_bytes, payload_b64, hashlib.sha384
-            ).hexdigest()
+            signature = api_key.sign(payload_b64).hexdigest()
         except TypeError:
             logger.exception("Error while serializing gemini data.")
             raise TypeError("Error while serializing gemini data.")
@@ -1,23 +1,43 @@
 import base64
 import hashlib
-import hmac
-import os
-import time
 import urllib
+from contextlib import aclosing
+from functools import partial
 
 from app.supported_cryptos import NAMES
-from custom_exceptions import APIKeyError, EncodeError, SignatureError
+from custom_exceptions import EncodeError, SignatureError
 from urls import (
     KRAKEN_PRICE_URL,
     KRAKEN_ASSETS_URL,
     KRAKEN_TRADES_URL,
+    KRAKEN_TRADES_SINCE_URL,
     KRAKEN_BALANCES_URL,
     KRAKEN_BALANCES_POSTFIX,
+    KRAKEN_TICKER_URL,
 )
 from .exchange_interface import ExchangeInterface
-from .utils import make_request as request_helper, structure_kraken
-from logger.app_logger import logger
-from typing import Any, Dict, List, Optional, Union
+from .fixed_point import DEFAULT_DECIMALS, LazyLevels
+from .private import ApiKey, PrivateClient
+from .utils import (
+    compact_kraken_book,
+    iter_in_order,
+    make_request as request_helper,
+    structure_kraken,
+)
+from logger.app_logger import get_logger
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Union,
+)
+
+
+logger = get_logger(__name__)
 
 
 class Kraken(ExchangeInterface):
@@ -25,127 +45,291 @@ class Kraken(ExchangeInterface):
     assets_url = KRAKEN_ASSETS_URL
     trades_url = KRAKEN_TRADES_URL
     balances_url = KRAKEN_BALANCES_URL
+    private_client = PrivateClient("KRAKEN", hashlib.sha512, base64.b64decode)
+    ticker_url = KRAKEN_TICKER_URL
+    trades_since_url = KRAKEN_TRADES_SINCE_URL
+    trades_page_size = 1000
+    max_trade_page_requests = 2
+    # Kraken names a few assets after their ISO 4217 style codes.
+    base_aliases = {"XBT": "BTC", "XDG": "DOGE"}
     assets = None
+    scales = {}
+    universe = {}
 
     def __init__(self, crypto_pair: str) -> None:
         """
         Initializes a Kraken instance.
 
+        The pair name, book URL, book transform and scales of the pair are
+        looked up once, so the assets are loaded first.
+
         :param crypto_pair: The crypto pair.
         :type crypto_pair: str
         """
         self.crypto_pair = crypto_pair
+        self.pair = Kraken.assets[crypto_pair]
+        self.book_url = Kraken.price_url.format(self.pair)
+        self.book_transform = partial(compact_kraken_book, pair=self.pair)
+        self.price_decimals, self.amount_decimals = Kraken.scales.get(
+            crypto_pair, (DEFAULT_DECIMALS, DEFAULT_DECIMALS)
+        )
 
     @classmethod
-    async def get_assets(cls) -> Dict[str, str]:
+    async def get_assets(cls, refresh: bool = False) -> Dict[str, str]:
         """
         Retrieves the assets from Kraken.
 
+        USD pairs are keyed by crypto and pairs quoted in another supported
+        crypto by base and quote (Ex: "ETH/BTC").
+
+        :param refresh: Whether to fetch the assets again when already loaded.
+        :type refresh: bool
         :raises Exception: If an error occurs while fetching the assets.
 
         :return: The assets dictionary.
         :rtype: Dict[str, str]
         """
-        if not cls.assets:
+        if refresh or not cls.assets:
             response = await request_helper(cls.assets_url, "GET")
             if not isinstance(response, dict):
                 return response
             response = response["result"]
             assets = {}
+            universe = {}
+            for pair, asset in response.items():
+                base, _, quote = asset.get("wsname", "").partition("/")
+                base = cls.base_aliases.get(base, base)
+                quote = cls.base_aliases.get(quote, quote)
+                if quote == "USD":
+                    universe[base] = pair
+                elif base in NAMES and quote in NAMES:
+                    assets[f"{base}/{quote}"] = pair
             for crypto in NAMES:
                 for asset in response.values():
                     if asset["altname"] == crypto + "USD":
                         assets[crypto] = crypto + "USD"
             assets["BTC"] = "XXBTZUSD"
             assets["ETH"] = "XETHZUSD"
+            scales = {}
+            for crypto, pair in assets.items():
+                if pair in response:
+                    scales[crypto] = (
+                        response[pair]["pair_decimals"],
+                        response[pair]["lot_decimals"],
+                    )
+            cls.scales = scales
+            cls.universe = universe
             cls.assets = assets
         return cls.assets
 
-    async def get_trades(self, limit: int) -> List[Dict[str, Any]]:
+    @classmethod
+    async def get_tickers(
+        cls,
+        cryptos: Optional[List[str]] = None,
+        throttle: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> Dict[str, Dict[str, Optional[str]]]:
         """
-        Retrieve trades from Kraken exchange.
+        Retrieves the best bid, best ask and last price of many assets with a
+        single request.
+
+        :param cryptos: The cryptocurrencies, defaults to every USD pair listed.
+        :type cryptos: Optional[List[str]]
+        :param throttle: Unused, a single request is made.
+        :type throttle: Optional[Callable[[], Awaitable[None]]]
+        :return: The tickers keyed by crypto.
+        :rtype: Dict[str, Dict[str, Optional[str]]]
+        """
+        await cls.get_assets()
+        pairs = {
+            pair: crypto
+            for crypto, pair in cls.universe.items()
+            if cryptos is None or crypto in cryptos
+        }
+        if not pairs:
+            return {}
+        # Without a pair filter Kraken returns every pair, which keeps the URL
+        # short when the whole universe is requested.
+        complete_url = cls.ticker_url
+        if cryptos is not None:
+            complete_url += "?pair=" + ",".join(pairs)
+        response = await request_helper(complete_url, "GET")
+        tickers = {}
+        for pair, ticker in response["result"].items():
+            if pair not in pairs:
+                continue
+            tickers[pairs[pair]] = {
+                "bid": ticker["b"][0],
+                "ask": ticker["a"][0],
+                "last": ticker["c"][0],
+            }
+        return tickers
+
+    async def iter_trades(self, limit: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Retrieve trades from Kraken exchange page by page.
+
+        Kraken only pages forward in time from a "since" timestamp. The span
+        holding the older trades is estimated from the trade rate of the
+        latest page and split into windows of about a page each, which are
+        paged concurrently and yielded newest first. Windows further back are
+        added until the limit is reached or the history runs out, the last
+        window keeping only its newest trades.
 
         :param limit: The maximum number of trades to retrieve.
         :type limit: int
+        :return: Pages of structured trades.
+        :rtype: AsyncIterator[List[Dict[str, Any]]]
+        """
+        pair = self.pair
+        complete_url = Kraken.trades_url.format(
+            pair, min(limit, Kraken.trades_page_size)
+        )
+        response = await request_helper(complete_url, "GET")
+        trades = response["result"][pair]
+        yield structure_kraken(response, pair)
+        remaining = limit - len(trades)
+        if remaining <= 0 or len(trades) < Kraken.trades_page_size:
+            return
+
+        end = float(trades[0][2])
+        window = max(float(trades[-1][2]) - end, 1.0)
+        while remaining > 0:
+            count = -(-remaining // Kraken.trades_page_size)
+            # Windows go back in time, so yielding them in order keeps the
+            # trades contiguous from the latest page down to the limit.
+            pages = iter_in_order(
+                (
+                    self.get_trades_between(
+                        pair, end - (index + 1) * window, end - index * window
+                    )
+                    for index in range(count)
+                ),
+                Kraken.max_trade_page_requests,
+            )
+            received = 0
+            async with aclosing(pages):
+                async for page in pages:
+                    # Pages are in ascending time, the newest trades are last.
+                    page = page[-remaining:]
+                    remaining -= len(page)
+                    received += len(page)
+                    if page:
+                        yield page
+                    if remaining <= 0:
+                        break
+            if not received:
+                return
+            end -= count * window
+
+    async def get_trades_between(
+        self, pair: str, start: float, end: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve the Kraken trades of a time window, paging forward from its start.
+
+        :param pair: The Kraken pair.
+        :type pair: str
+        :param start: The start of the window in seconds since the epoch.
+        :type start: float
+        :param end: The end of the window in seconds since the epoch, excluded.
+        :type end: float
         :return: A list of structured trades.
         :rtype: List[Dict[str, Any]]
         """
-        complete_url = Kraken.trades_url.format(Kraken.assets[self.crypto_pair], limit)
-        response = await request_helper(complete_url, "GET")
-        structured_response = structure_kraken(
-            response, Kraken.assets[self.crypto_pair]
+        trades = []
+        since = int(start * 1e9)
+        while True:
+            complete_url = Kraken.trades_since_url.format(
+                pair, Kraken.trades_page_size, since
+            )
+            response = await request_helper(complete_url, "GET")
+            page = response["result"][pair]
+            in_window = [trade for trade in page if float(trade[2]) < end]
+            trades.extend(in_window)
+            if len(in_window) < len(page) or len(page) < Kraken.trades_page_size:
+                break
+            since = response["result"]["last"]
+        return structure_kraken({"result": {pair: trades}}, pair)
+
+    async def get_order_book(self) -> Dict[str, Any]:
+        """
+        Retrieves both sides of the order book from Kraken with a single request.
+
+        Prices and amounts are fixed-point integers on the pair's price tick
+        and lot size scales, which are returned alongside the levels. Levels
+        are only decoded as far as they are read, best first.
+
+        :return: The bid and ask prices keyed by side, and their decimals.
+        :rtype: Dict[str, Any]
+        """
+        book = await request_helper(
+            self.book_url, "GET", transform=self.book_transform
         )
-        return structured_response
+        return {
+            "bids": LazyLevels(
+                book["bids"], self.price_decimals, self.amount_decimals, True
+            ),
+            "asks": LazyLevels(
+                book["asks"], self.price_decimals, self.amount_decimals, False
+            ),
+            "price_decimals": self.price_decimals,
+            "amount_decimals": self.amount_decimals,
+        }
 
-    async def get_bid_price(self) -> List[Dict[str, float]]:
+    async def get_bid_price(self) -> List[Dict[str, int]]:
         """
         Retrieves the bid prices from Kraken.
 
         :return: The bid prices.
-        :rtype: List[Dict[str, float]]
+        :rtype: List[Dict[str, int]]
         """
-        complete_url = Kraken.price_url.format(Kraken.assets[self.crypto_pair])
-        response = await request_helper(complete_url, "GET")
-        response = [
-            {"price": float(bid[0]), "amount": float(bid[1])}
-            for bid in response["result"][Kraken.assets[self.crypto_pair]]["bids"]
-        ]
-        return response
+        order_book = await self.get_order_book()
+        return order_book["bids"]
 
-    async def get_ask_price(self) -> List[Dict[str, float]]:
+    async def get_ask_price(self) -> List[Dict[str, int]]:
         """
         Retrieves the ask prices from Kraken.
 
         :return: The ask prices.
-        :rtype: List[Dict[str, float]]
+        :rtype: List[Dict[str, int]]
         """
-        complete_url = Kraken.price_url.format(Kraken.assets[self.crypto_pair])
-        response = await request_helper(complete_url, "GET")
-        response = [
-            {"price": float(ask[0]), "amount": float(ask[1])}
-            for ask in response["result"][Kraken.assets[self.crypto_pair]]["asks"]
-        ]
-        return response
+        order_book = await self.get_order_book()
+        return order_book["asks"]
 
     @classmethod
     async def get_balance_details(cls) -> dict:
         """
         Get balance details from Kraken exchange.
 
+        Kraken rejects nonces lower than the last one of a key, so the key is
+        held until the response arrives and concurrent calls use other keys.
+
         :return: The balance details.
         :rtype: dict
         """
-        data = {"nonce": str(int(1000 * time.time()))}
-        headers = cls.get_authorization_headers(data)
-        response = await request_helper(cls.balances_url, "POST", headers, data)
+        async with cls.private_client.key() as api_key:
+            data = {"nonce": str(api_key.nonces.next())}
+            headers = cls.get_authorization_headers(api_key, data)
+            response = await request_helper(cls.balances_url, "POST", headers, data)
         return response["result"]
 
     @classmethod
-    def get_authorization_headers(cls, data: dict) -> Optional[dict]:
+    def get_authorization_headers(cls, api_key: ApiKey, data: dict) -> dict:
         """
         Get the authorization headers for Kraken API requests.
 
+        :param api_key: The API key.
+        :type api_key: ApiKey
         :param data: The data to include in the request.
         :type data: dict
-        :return: The authorization headers or None if there was an error.
-        :rtype: Optional[dict]
+        :return: The authorization headers.
+        :rtype: dict
         """
-        try:
-            api_key = os.environ["KRAKEN_API_KEY"]
-            secret_key = os.environ["KRAKEN_SECRET_KEY"]
-        except KeyError:
-            logger.exception(
-                "Kraken keys needs to be set to be able to make the API call."
-            )
-            raise APIKeyError(
-                status_code=500,
-                detail="Kraken keys needs to be set to be able to make the API call.",
-            )
-        signature = cls.get_signature(KRAKEN_BALANCES_POSTFIX, data, secret_key)
-        return {"API-Key": api_key, "API-Sign": signature}
+        signature = cls.get_signature(KRAKEN_BALANCES_POSTFIX, data, api_key)
+        return {"API-Key": api_key.api_key, "API-Sign": signature}
 
     @classmethod
-    def get_signature(cls, url: str, data: dict, secret: str) -> Optional[str]:
+    def get_signature(cls, url: str, data: dict, api_key: ApiKey) -> str:
         """
         Get the signature for Kraken API requests.
 
@@ -153,18 +337,17 @@ class Kraken(ExchangeInterface):
         :type url: str
         :param data: The data to include in the request.
         :type data: dict
-        :param secret: The secret key for the API.
-        :type secret: str
-        :return: The signature or None if there was an error.
-        :rtype: Optional[str]
+        :param api_key: The API key.
+        :type api_key: ApiKey
+        :return: The signature.
+        :rtype: str
         """
         try:
             postdata = urllib.parse.urlencode(data)
             encoded = (str(data["nonce"]) + postdata).encode()
             message = url.encode() + hashlib.sha256(encoded).digest()
 
-            mac = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
-            sigdigest = base64.b64encode(mac.digest())
+            sigdigest = base64.b64encode(api_key.sign(message).digest())
         except TypeError:
             logger.exception("Error while serializing kraken data.")
             raise TypeError("Error while serializing kraken data.")
@@ -0,0 +1,621 @@
+import random
+from collections import deque
+from decimal import Decimal, InvalidOperation
+
+from .fixed_point import LazyLevels, parse_fixed, to_decimal_string, to_fixed
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+# Private generator for the treap priorities, leaving the global one alone.
+priorities = random.Random()
+
+
+class Node:
+    __slots__ = (
+        "key",
+        "price",
+        "amount",
+        "priority",
+        "left",
+        "right",
+        "total_amount",
+        "total_notional",
+    )
+
+    def __init__(self, key: int, price: int, amount: int) -> None:
+        """
+        Initializes a Node instance, one price level of a book side.
+
+        :param key: The sort key, the price negated on descending sides.
+        :type key: int
+        :param price: The fixed-point price.
+        :type price: int
+        :param amount: The fixed-point amount.
+        :type amount: int
+        """
+        self.key = key
+        self.price = price
+        self.amount = amount
+        self.priority = priorities.random()
+        self.left: Optional[Node] = None
+        self.right: Optional[Node] = None
+        self.total_amount = amount
+        self.total_notional = amount * price
+
+    def refresh(self) -> None:
+        """
+        Recompute the amount and notional totals of the subtree.
+        """
+        total_amount = self.amount
+        total_notional = self.amount * self.price
+        if self.left is not None:
+            total_amount += self.left.total_amount
+            total_notional += self.left.total_notional
+        if self.right is not None:
+            total_amount += self.right.total_amount
+            total_notional += self.right.total_notional
+        self.total_amount = total_amount
+        self.total_notional = total_notional
+
+
+def split(node: Optional[Node], key: int) -> Tuple[Optional[Node], Optional[Node]]:
+    """
+    Split a treap into the levels sorted before a key and the rest.
+
+    :param node: The root of the treap.
+    :type node: Optional[Node]
+    :param key: The key of the first level of the second treap.
+    :type key: int
+    :return: The roots of both treaps.
+    :rtype: Tuple[Optional[Node], Optional[Node]]
+    """
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = split(node.right, key)
+        node.refresh()
+        return node, right
+    left, node.left = split(node.left, key)
+    node.refresh()
+    return left, node
+
+
+def merge(left: Optional[Node], right: Optional[Node]) -> Optional[Node]:
+    """
+    Merge two treaps whose levels are all sorted left before right.
+
+    :param left: The root of the first treap.
+    :type left: Optional[Node]
+    :param right: The root of the second treap.
+    :type right: Optional[Node]
+    :return: The root of the merged treap.
+    :rtype: Optional[Node]
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        left.refresh()
+        return left
+    right.left = merge(left, right.left)
+    right.refresh()
+    return right
+
+
+def set_amount(node: Node, key: int, amount: int) -> None:
+    """
+    Change the amount of an existing level and the totals above it.
+
+    :param node: The root of the treap.
+    :type node: Node
+    :param key: The key of the level.
+    :type key: int
+    :param amount: The new amount.
+    :type amount: int
+    """
+    if key < node.key:
+        set_amount(node.left, key, amount)
+    elif key > node.key:
+        set_amount(node.right, key, amount)
+    else:
+        node.amount = amount
+    node.refresh()
+
+
+class OrderBookSide:
+    def __init__(self, descending: bool) -> None:
+        """
+        Initializes an OrderBookSide instance.
+
+        Levels are kept in a treap keyed by price, best first, where every
+        node holds the amount and notional of its subtree. Updates, fills
+        and depth queries walk a single root to leaf path, so they take
+        O(log n) time however deep the book is.
+
+        :param descending: Whether the best level has the highest price (bids).
+        :type descending: bool
+        """
+        self.descending = descending
+        self.root: Optional[Node] = None
+        self.amounts: Dict[int, int] = {}
+        self.raw: Dict[Any, Any] = {}
+        self.changes: Dict[int, int] = {}
+
+    def get_key(self, price: int) -> int:
+        """
+        Get the sort key of a price, so that better prices sort first.
+
+        :param price: The fixed-point price.
+        :type price: int
+        :return: The sort key.
+        :rtype: int
+        """
+        return -price if self.descending else price
+
+    def update(self, price: int, amount: int) -> None:
+        """
+        Insert, change or remove (amount 0) a price level, and record the
+        change.
+
+        :param price: The fixed-point price.
+        :type price: int
+        :param amount: The fixed-point amount.
+        :type amount: int
+        """
+        self.changes[price] = max(amount, 0)
+        key = self.get_key(price)
+        if price in self.amounts:
+            if amount <= 0:
+                del self.amounts[price]
+                left, rest = split(self.root, key)
+                _, right = split(rest, key + 1)
+                self.root = merge(left, right)
+            else:
+                self.amounts[price] = amount
+                set_amount(self.root, key, amount)
+        elif amount > 0:
+            self.amounts[price] = amount
+            left, right = split(self.root, key)
+            self.root = merge(merge(left, Node(key, price, amount)), right)
+
+    def apply_levels(
+        self,
+        levels: Union[LazyLevels, Iterable[Dict[str, int]]],
+        price_decimals: int,
+        amount_decimals: int,
+    ) -> int:
+        """
+        Bring the side in line with a full snapshot of it, touching only the
+        levels that changed.
+
+        Raw venue levels are diffed as they were received, so only the
+        changed levels are ever decoded.
+
+        :param levels: The snapshot levels.
+        :type levels: Union[LazyLevels, Iterable[Dict[str, int]]]
+        :param price_decimals: The number of decimals of the price scale.
+        :type price_decimals: int
+        :param amount_decimals: The number of decimals of the amount scale.
+        :type amount_decimals: int
+        :return: The number of levels that changed.
+        :rtype: int
+        """
+        if isinstance(levels, LazyLevels):
+            raw = {
+                levels.get_price(level): levels.get_amount(level)
+                for level in levels.levels
+            }
+            previous = self.raw
+            self.raw = raw
+            if not previous:
+                for price in self.amounts:
+                    self.changes[price] = 0
+                self.root = None
+                self.amounts = {}
+            changed = 0
+            for price in previous.keys() - raw.keys():
+                self.update(parse_fixed(price, price_decimals), 0)
+                changed += 1
+            for price, amount in raw.items():
+                if previous.get(price) != amount:
+                    self.update(
+                        parse_fixed(price, price_decimals),
+                        parse_fixed(amount, amount_decimals),
+                    )
+                    changed += 1
+            return changed
+
+        self.raw = {}
+        amounts = {level["price"]: level["amount"] for level in levels}
+        changed = 0
+        for price in self.amounts.keys() - amounts.keys():
+            self.update(price, 0)
+            changed += 1
+        for price, amount in amounts.items():
+            if self.amounts.get(price) != amount:
+                self.update(price, amount)
+                changed += 1
+        return changed
+
+    def get_fill(self, quantity: int) -> Tuple[int, int]:
+        """
+        Get the cost of taking a quantity from the best levels.
+
+        :param quantity: The fixed-point quantity.
+        :type quantity: int
+        :return: The cost, scaled by both the price and amount scales, and the
+            quantity filled, short of the requested one if the side is too thin.
+        :rtype: Tuple[int, int]
+        """
+        cost = 0
+        quantity_left = quantity
+        node = self.root
+        while node is not None and quantity_left > 0:
+            left = node.left
+            if left is not None:
+                if quantity_left <= left.total_amount:
+                    node = left
+                    continue
+                cost += left.total_notional
+                quantity_left -= left.total_amount
+            current_quantity = min(node.amount, quantity_left)
+            cost += current_quantity * node.price
+            quantity_left -= current_quantity
+            node = node.right
+        return cost, quantity - quantity_left
+
+    def get_depth(self, price: int) -> Tuple[int, int]:
+        """
+        Get the amount and notional available at a price or better.
+
+        :param price: The fixed-point limit price.
+        :type price: int
+        :return: The amount and the notional of the levels within the price.
+        :rtype: Tuple[int, int]
+        """
+        bound = self.get_key(price)
+        amount = 0
+        notional = 0
+        node = self.root
+        while node is not None:
+            if node.key <= bound:
+                amount += node.amount
+                notional += node.amount * node.price
+                if node.left is not None:
+                    amount += node.left.total_amount
+                    notional += node.left.total_notional
+                node = node.right
+            else:
+                node = node.left
+        return amount, notional
+
+    def get_best(self) -> Optional[int]:
+        """
+        Get the best price of the side.
+
+        :return: The fixed-point best price, None if the side is empty.
+        :rtype: Optional[int]
+        """
+        node = self.root
+        if node is None:
+            return None
+        while node.left is not None:
+            node = node.left
+        return node.price
+
+    def __iter__(self) -> Iterator[Dict[str, int]]:
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield {"price": node.price, "amount": node.amount}
+            node = node.right
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+
+class OrderBook:
+    def __init__(
+        self, price_decimals: int, amount_decimals: int, history: int = 100
+    ) -> None:
+        """
+        Initializes an OrderBook instance, an incrementally maintained book.
+
+        The levels changed by the last history snapshots are kept, so clients
+        holding an older version of the book can be sent only the changes.
+
+        :param price_decimals: The number of decimals of the price scale.
+        :type price_decimals: int
+        :param amount_decimals: The number of decimals of the amount scale.
+        :type amount_decimals: int
+        :param history: The number of versions whose changes are kept.
+        :type history: int
+        """
+        self.price_decimals = price_decimals
+        self.amount_decimals = amount_decimals
+        self.bids = OrderBookSide(descending=True)
+        self.asks = OrderBookSide(descending=False)
+        self.version = 0
+        self.history: Deque[Tuple[int, Dict[str, Dict[int, int]]]] = deque(
+            maxlen=history
+        )
+
+    def get_side(self, side: str) -> OrderBookSide:
+        """
+        Get a side of the book.
+
+        :param side: "bids" or "asks".
+        :type side: str
+        :return: The side.
+        :rtype: OrderBookSide
+        """
+        return self.bids if side == "bids" else self.asks
+
+    def apply_snapshot(
+        self, order_book: Dict[str, Any], version: Optional[int] = None
+    ) -> int:
+        """
+        Bring the book in line with a full snapshot as returned by the
+        adapters' get_order_book, touching only the levels that changed.
+
+        :param order_book: The order book with its price and amount decimals.
+        :type order_book: Dict[str, Any]
+        :param version: The version of the snapshot, defaults to the next one.
+        :type version: Optional[int]
+        :return: The number of levels that changed.
+        :rtype: int
+        """
+        if (
+            order_book["price_decimals"] != self.price_decimals
+            or order_book["amount_decimals"] != self.amount_decimals
+        ):
+            self.__init__(
+                order_book["price_decimals"],
+                order_book["amount_decimals"],
+                self.history.maxlen,
+            )
+        changed = 0
+        changes = {}
+        for side in ("bids", "asks"):
+            book_side = self.get_side(side)
+            book_side.changes = {}
+            changed += book_side.apply_levels(
+                order_book[side], self.price_decimals, self.amount_decimals
+            )
+            changes[side] = book_side.changes
+            book_side.changes = {}
+        self.version = self.version + 1 if version is None else version
+        self.history.append((self.version, changes))
+        return changed
+
+    def get_changes(self, since: int) -> Optional[Dict[str, Dict[int, int]]]:
+        """
+        Get the levels that changed after a version, an amount of 0 meaning
+        the level was removed.
+
+        :param since: The version the client holds.
+        :type since: int
+        :return: The latest amount of the changed levels keyed by side and
+            price, or None if the changes since that version are not kept.
+        :rtype: Optional[Dict[str, Dict[int, int]]]
+        """
+        if since > self.version or not self.history:
+            return None
+        if since < self.history[0][0] - 1:
+            return None
+        changes = {"bids": {}, "asks": {}}
+        for version, version_changes in self.history:
+            if version > since:
+                for side in ("bids", "asks"):
+                    changes[side].update(version_changes[side])
+        return changes
+
+    def format_levels(
+        self, side: str, levels: Iterable[Tuple[int, int]]
+    ) -> list:
+        """
+        Format fixed-point levels as exact decimal strings, best first.
+
+        :param side: "bids" or "asks".
+        :type side: str
+        :param levels: The (price, amount) fixed-point levels.
+        :type levels: Iterable[Tuple[int, int]]
+        :return: The [price, amount] levels.
+        :rtype: list
+        """
+        return [
+            [
+                to_decimal_string(price, self.price_decimals),
+                to_decimal_string(amount, self.amount_decimals),
+            ]
+            for price, amount in sorted(
+                levels, key=lambda level: level[0], reverse=side == "bids"
+            )
+        ]
+
+    def get_levels(self, side: str, depth: Optional[int] = None) -> list:
+        """
+        Get the levels of a side, best first.
+
+        :param side: "bids" or "asks".
+        :type side: str
+        :param depth: The number of levels, defaults to all of them.
+        :type depth: Optional[int]
+        :return: The [price, amount] levels as exact decimal strings.
+        :rtype: list
+        """
+        levels = []
+        for level in self.get_side(side):
+            if depth is not None and len(levels) >= depth:
+                break
+            levels.append((level["price"], level["amount"]))
+        return self.format_levels(side, levels)
+
+    def get_total_price(self, side: str, quantity: Union[str, float, int]) -> str:
+        """
+        Get the total price of taking a quantity from a side of the book.
+
+        :param side: "bids" or "asks".
+        :type side: str
+        :param quantity: The quantity.
+        :type quantity: Union[str, float, int]
+        :return: The total price as an exact decimal string.
+        :rtype: str
+        """
+        cost, _ = self.get_side(side).get_fill(to_fixed(quantity, self.amount_decimals))
+        return to_decimal_string(cost, self.price_decimals + self.amount_decimals)
+
+    def get_depth(self, side: str, price: Union[str, float, int]) -> Dict[str, str]:
+        """
+        Get the quantity and notional available on a side within a price.
+
+        :param side: "bids" or "asks".
+        :type side: str
+        :param price: The limit price.
+        :type price: Union[str, float, int]
+        :return: The quantity and notional as exact decimal strings.
+        :rtype: Dict[str, str]
+        """
+        amount, notional = self.get_side(side).get_depth(
+            to_fixed(price, self.price_decimals)
+        )
+        return {
+            "quantity": to_decimal_string(amount, self.amount_decimals),
+            "notional": to_decimal_string(
+                notional, self.price_decimals + self.amount_decimals
+            ),
+        }
+
+
+def parse_bucket(bucket: str, mid: int, price_decimals: int) -> int:
+    """
+    Parse a depth bucket size, either a price (Ex: "10") or a percentage of
+    the mid price (Ex: "0.1%").
+
+    :param bucket: The bucket size.
+    :type bucket: str
+    :param mid: The fixed-point mid price.
+    :type mid: int
+    :param price_decimals: The number of decimals of the price scale.
+    :type price_decimals: int
+    :raises ValueError: If the size is not positive or finer than the scale.
+    :return: The fixed-point bucket width, at least one tick for percentages.
+    :rtype: int
+    """
+    size = bucket[:-1] if bucket.endswith("%") else bucket
+    try:
+        valid = Decimal(size).is_finite()
+    except InvalidOperation:
+        valid = False
+    if not valid:
+        raise ValueError(f"{bucket} is not a valid bucket size.")
+    if bucket.endswith("%"):
+        percent = to_fixed(size, 8)
+        if percent <= 0:
+            raise ValueError("The bucket size must be positive.")
+        return max(mid * percent // (100 * 10**8), 1)
+    width = to_fixed(bucket, price_decimals)
+    if width <= 0:
+        raise ValueError("The bucket size must be positive.")
+    return width
+
+
+def get_bucketed_depth(
+    order_books: Dict[str, OrderBook], bucket: str, buckets: int
+) -> Dict[str, Any]:
+    """
+    Aggregate the books of several exchanges into price buckets around the
+    consolidated mid price.
+
+    Buckets are aligned on multiples of their width, bids at their lower
+    bound and asks at their upper bound, and count the amounts at their
+    price or better, the first bucket of a side absorbing crossed levels.
+    Every bucket bound is a single logarithmic depth query per book, so the
+    cost grows with the number of buckets rather than with the levels they
+    span, and the levels are never walked.
+
+    :param order_books: The books keyed by exchange name.
+    :type order_books: Dict[str, OrderBook]
+    :param bucket: The bucket size (Ex: "10", "0.1%").
+    :type bucket: str
+    :param buckets: The number of buckets per side.
+    :type buckets: int
+    :raises ValueError: If the bucket size is invalid.
+    :return: The mid price and, per side, the buckets best first with their
+        amount per exchange, their total amount and the cumulative amount.
+    :rtype: Dict[str, Any]
+    """
+    price_decimals = max(
+        (book.price_decimals for book in order_books.values()), default=0
+    )
+    amount_decimals = max(
+        (book.amount_decimals for book in order_books.values()), default=0
+    )
+    best = {}
+    for side, pick in (("bids", max), ("asks", min)):
+        prices = [
+            book.get_side(side).get_best() * 10 ** (price_decimals - book.price_decimals)
+            for book in order_books.values()
+            if len(book.get_side(side))
+        ]
+        best[side] = pick(prices) if prices else None
+    if best["bids"] is None or best["asks"] is None:
+        mid = best["bids"] if best["asks"] is None else best["asks"]
+    else:
+        mid = (best["bids"] + best["asks"]) // 2
+    depth: Dict[str, Any] = {
+        "mid": None if mid is None else to_decimal_string(mid, price_decimals),
+        "bids": [],
+        "asks": [],
+    }
+    if mid is None:
+        return depth
+    width = parse_bucket(bucket, mid, price_decimals)
+
+    for side in ("bids", "asks"):
+        if side == "bids":
+            start = mid // width * width
+            bounds = [start - i * width for i in range(buckets) if start - i * width > 0]
+        else:
+            start = -(-mid // width) * width
+            bounds = [start + i * width for i in range(buckets)]
+        cumulative: Dict[str, List[int]] = {}
+        for exchange_name, book in order_books.items():
+            price_scale = 10 ** (price_decimals - book.price_decimals)
+            amount_scale = 10 ** (amount_decimals - book.amount_decimals)
+            book_side = book.get_side(side)
+            cumulative[exchange_name] = [
+                book_side.get_depth(
+                    -(-bound // price_scale) if side == "bids" else bound // price_scale
+                )[0]
+                * amount_scale
+                for bound in bounds
+            ]
+        previous = dict.fromkeys(order_books, 0)
+        for index, bound in enumerate(bounds):
+            amounts = {}
+            for exchange_name, amounts_within in cumulative.items():
+                amounts[exchange_name] = amounts_within[index] - previous[exchange_name]
+                previous[exchange_name] = amounts_within[index]
+            depth[side].append(
+                {
+                    "price": to_decimal_string(bound, price_decimals),
+                    "amounts": {
+                        exchange_name: to_decimal_string(amount, amount_decimals)
+                        for exchange_name, amount in amounts.items()
+                    },
+                    "amount": to_decimal_string(
+                        sum(amounts.values()), amount_decimals
+                    ),
+                    "cumulative": to_decimal_string(
+                        sum(previous.values()), amount_decimals
+                    ),
+                }
+            )
+    return depth
@@ -0,0 +1,166 @@
+import asyncio
+import hmac
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from custom_exceptions import APIKeyError, SignatureError
+from logger.app_logger import get_logger
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+
+logger = get_logger(__name__)
+
+
+class NonceGenerator:
+    def __init__(self) -> None:
+        """
+        Initializes a NonceGenerator instance, issuing strictly increasing
+        millisecond timestamps.
+
+        Nonces run ahead of the clock when more than one is issued per
+        millisecond, and never go back when the clock does.
+        """
+        self.last = 0
+        self.lock = threading.Lock()
+
+    def next(self) -> int:
+        """
+        Issue the next nonce.
+
+        :return: The nonce.
+        :rtype: int
+        """
+        with self.lock:
+            self.last = max(time.time_ns() // 1_000_000, self.last + 1)
+            return self.last
+
+
+class ApiKey:
+    def __init__(self, api_key: str, secret: bytes, digest: Any) -> None:
+        """
+        Initializes an ApiKey instance, an API key with its decoded secret.
+
+        The HMAC is keyed once, and every signature starts from a copy of it.
+
+        :param api_key: The API key.
+        :type api_key: str
+        :param secret: The decoded secret.
+        :type secret: bytes
+        :param digest: The hash constructor of the signatures (Ex: hashlib.sha512).
+        :type digest: Any
+        """
+        self.api_key = api_key
+        self.mac = hmac.new(secret, digestmod=digest)
+        self.nonces = NonceGenerator()
+
+    def sign(self, message: bytes) -> "hmac.HMAC":
+        """
+        Sign a message.
+
+        :param message: The message.
+        :type message: bytes
+        :return: The HMAC of the message.
+        :rtype: hmac.HMAC
+        """
+        mac = self.mac.copy()
+        mac.update(message)
+        return mac
+
+
+class PrivateClient:
+    def __init__(
+        self,
+        name: str,
+        digest: Any,
+        decode_secret: Callable[[str], bytes],
+        exclusive: bool = True,
+    ) -> None:
+        """
+        Initializes a PrivateClient instance, the API keys of an exchange.
+
+        Keys are read from the comma separated <NAME>_API_KEY and
+        <NAME>_SECRET_KEY environment variables on first use. When the
+        exchange requires every key's nonces to arrive in order, a key is
+        held from the issue of its nonce until its response, so private calls
+        run in parallel across keys. Otherwise keys are used in turn.
+
+        :param name: The exchange name, prefix of the environment variables.
+        :type name: str
+        :param digest: The hash constructor of the signatures.
+        :type digest: Any
+        :param decode_secret: Decodes a secret into the HMAC key.
+        :type decode_secret: Callable[[str], bytes]
+        :param exclusive: Whether a key serves one call at a time.
+        :type exclusive: bool
+        """
+        self.name = name
+        self.digest = digest
+        self.decode_secret = decode_secret
+        self.exclusive = exclusive
+        self.keys: Optional[List[ApiKey]] = None
+        self.idle: Optional[asyncio.Queue] = None
+        self.turns: Optional[Iterator[ApiKey]] = None
+
+    def get_keys(self) -> List[ApiKey]:
+        """
+        Get the API keys, loading them on first use.
+
+        :raises APIKeyError: If the keys are not set.
+        :raises SignatureError: If a secret cannot be decoded.
+        :return: The API keys.
+        :rtype: List[ApiKey]
+        """
+        if self.keys is not None:
+            return self.keys
+        display_name = self.name.capitalize()
+        api_keys = os.environ.get(f"{self.name}_API_KEY", "").split(",")
+        secrets = os.environ.get(f"{self.name}_SECRET_KEY", "").split(",")
+        api_keys = [api_key.strip() for api_key in api_keys if api_key.strip()]
+        secrets = [secret.strip() for secret in secrets if secret.strip()]
+        if not api_keys or len(api_keys) != len(secrets):
+            logger.error(
+                "%s keys needs to be set to be able to make the API call.", display_name
+            )
+            raise APIKeyError(
+                status_code=500,
+                detail=f"{display_name} keys needs to be set to be able to make the API call.",
+            )
+        try:
+            keys = [
+                ApiKey(api_key, self.decode_secret(secret), self.digest)
+                for api_key, secret in zip(api_keys, secrets)
+            ]
+        except Exception:
+            logger.exception("Failed to decode the %s secret keys.", display_name)
+            raise SignatureError(
+                status_code=500,
+                detail=f"Failed to decode the {display_name} secret keys.",
+            )
+        self.keys = keys
+        self.turns = itertools.cycle(keys)
+        return keys
+
+    @asynccontextmanager
+    async def key(self) -> AsyncIterator[ApiKey]:
+        """
+        Use an API key for a private call.
+
+        :return: The API key, held until the context exits when exclusive.
+        :rtype: AsyncIterator[ApiKey]
+        """
+        keys = self.get_keys()
+        if not self.exclusive:
+            yield next(self.turns)
+            return
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+            for api_key in keys:
+                self.idle.put_nowait(api_key)
+        api_key = await self.idle.get()
+        try:
+            yield api_key
+        finally:
+            self.idle.put_nowait(api_key)
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import time
+
+from logger.app_logger import get_logger
+from .exchange_interface import ExchangeInterface
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+
+
+logger = get_logger(__name__)
+
+
+class ExchangeRegistry:
+    def __init__(
+        self,
+        exchanges: Dict[str, Type[ExchangeInterface]],
+        config_path: Optional[str] = None,
+        retry_interval: float = 5,
+    ) -> None:
+        """
+        Initializes an ExchangeRegistry instance, holding one adapter per
+        enabled (exchange, pair) with the exchanges listing each crypto, so
+        request paths look them up instead of rebuilding them.
+
+        The enabled exchanges and pairs are read from a JSON file mapping
+        every enabled exchange to its pairs, or to "*" for every pair it
+        lists (Ex: {"coinbase": "*", "kraken": ["BTC", "ETH/BTC"]}). Without
+        a file, every exchange and pair is enabled. Reloading re-reads the
+        file and swaps the adapters and indices at once.
+
+        :param exchanges: The adapter classes keyed by exchange name, in the
+            order exchanges are listed.
+        :type exchanges: Dict[str, Type[ExchangeInterface]]
+        :param config_path: The path of the JSON file, if any.
+        :type config_path: Optional[str]
+        :param retry_interval: Seconds between two attempts to load the assets
+            of an exchange that failed.
+        :type retry_interval: float
+        """
+        self.exchanges = exchanges
+        self.config_path = config_path
+        self.retry_interval = retry_interval
+        self.config: Dict[str, Optional[Set[str]]] = {name: None for name in exchanges}
+        self.adapters: Dict[Tuple[str, str], ExchangeInterface] = {}
+        self.by_crypto: Dict[str, List[Type[ExchangeInterface]]] = {}
+        self.pending: Set[str] = set(exchanges)
+        self.retried_at = float("-inf")
+        self.reloaded_at: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+    def read_config(self) -> Dict[str, Optional[Set[str]]]:
+        """
+        Read the enabled exchanges and pairs.
+
+        :raises ValueError: If the file is not valid.
+        :return: The enabled pairs keyed by exchange name, None for every pair.
+        :rtype: Dict[str, Optional[Set[str]]]
+        """
+        if not self.config_path:
+            return {name: None for name in self.exchanges}
+        try:
+            with open(self.config_path) as config_file:
+                raw_config = json.load(config_file)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Failed to read {self.config_path}: {e}")
+        if not isinstance(raw_config, dict):
+            raise ValueError(f"{self.config_path} must map exchanges to their pairs.")
+        config = {}
+        for name, pairs in raw_config.items():
+            if name not in self.exchanges:
+                raise ValueError(f"{name} is not a supported exchange.")
+            if pairs == "*":
+                config[name] = None
+            elif isinstance(pairs, list) and all(
+                isinstance(pair, str) for pair in pairs
+            ):
+                config[name] = set(pairs)
+            else:
+                raise ValueError(f'The pairs of {name} must be a list or "*".')
+        # Listing order is kept whatever the order of the file.
+        return {name: config[name] for name in self.exchanges if name in config}
+
+    def build(self, config: Dict[str, Optional[Set[str]]]) -> None:
+        """
+        Build the adapters and indices of the exchanges whose assets are
+        loaded and swap them in.
+
+        :param config: The enabled pairs keyed by exchange name.
+        :type config: Dict[str, Optional[Set[str]]]
+        """
+        adapters = {}
+        by_crypto: Dict[str, List[Type[ExchangeInterface]]] = {}
+        pending = set()
+        for name, pairs in config.items():
+            exchange = self.exchanges[name]
+            if not exchange.assets:
+                pending.add(name)
+                continue
+            for crypto in exchange.assets:
+                if pairs is None or crypto in pairs:
+                    adapters[(name, crypto)] = exchange(crypto)
+                    by_crypto.setdefault(crypto, []).append(exchange)
+        self.config = config
+        self.adapters = adapters
+        self.by_crypto = by_crypto
+        self.pending = pending
+
+    async def load(self, names: List[str], refresh: bool = False) -> None:
+        """
+        Load the assets of exchanges concurrently.
+
+        :param names: The exchange names.
+        :type names: List[str]
+        :param refresh: Whether to fetch assets already loaded again.
+        :type refresh: bool
+        """
+        results = await asyncio.gather(
+            *(self.exchanges[name].get_assets(refresh) for name in names),
+            return_exceptions=True,
+        )
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to load the %s assets: %s", name, result)
+
+    async def reload(self, refresh_assets: bool = False) -> Dict[str, Any]:
+        """
+        Re-read the enabled exchanges and pairs, load the assets of the
+        exchanges newly enabled and rebuild the adapters.
+
+        :param refresh_assets: Whether to fetch the assets of every enabled
+            exchange again, to pick up newly listed pairs.
+        :type refresh_assets: bool
+        :raises ValueError: If the file is not valid, in which case the
+            registry is left unchanged.
+        :return: The state of the registry.
+        :rtype: Dict[str, Any]
+        """
+        async with self.lock:
+            config = self.read_config()
+            names = [
+                name
+                for name in config
+                if refresh_assets or not self.exchanges[name].assets
+            ]
+            await self.load(names, refresh_assets)
+            self.build(config)
+            self.retried_at = time.monotonic()
+            self.reloaded_at = time.time()
+        logger.info(f"Loaded {len(self.adapters)} pairs on {list(config)}.")
+        return self.get_state()
+
+    async def ensure_loaded(self) -> None:
+        """
+        Load the registry on first use when it was not preloaded, and retry
+        the exchanges whose assets failed to load.
+        """
+        if self.reloaded_at is None:
+            async with self.lock:
+                loaded = self.reloaded_at is not None
+            if not loaded:
+                await self.reload()
+        elif self.pending:
+            await self.load_pending()
+
+    async def load_pending(self) -> None:
+        """
+        Retry loading the assets of the enabled exchanges that failed, at
+        most once per retry interval.
+        """
+        if time.monotonic() - self.retried_at < self.retry_interval:
+            return
+        async with self.lock:
+            # Another request may have retried while this one waited.
+            elapsed = time.monotonic() - self.retried_at
+            if not self.pending or elapsed < self.retry_interval:
+                return
+            self.retried_at = time.monotonic()
+            await self.load(sorted(self.pending))
+            self.build(self.config)
+
+    async def get_exchanges(self, crypto: str) -> List[Type[ExchangeInterface]]:
+        """
+        Get the enabled exchanges listing a crypto.
+
+        :param crypto: The cryptocurrency (Ex: "BTC", "ETH/BTC").
+        :type crypto: str
+        :return: The adapter classes, in listing order, shared and not to be
+            modified.
+        :rtype: List[Type[ExchangeInterface]]
+        """
+        await self.ensure_loaded()
+        return self.by_crypto.get(crypto, [])
+
+    def get_adapter(self, exchange_name: str, crypto: str) -> ExchangeInterface:
+        """
+        Get the adapter of an enabled pair.
+
+        :param exchange_name: The exchange name.
+        :type exchange_name: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :raises KeyError: If the pair is not listed or not enabled.
+        :return: The adapter.
+        :rtype: ExchangeInterface
+        """
+        return self.adapters[(exchange_name, crypto)]
+
+    def get_enabled(self) -> List[str]:
+        """
+        Get the enabled exchanges.
+
+        :return: The exchange names, in listing order.
+        :rtype: List[str]
+        """
+        return list(self.config)
+
+    def get_pairs(self, exchange_name: str) -> Optional[List[str]]:
+        """
+        Get the pairs enabled on an exchange.
+
+        :param exchange_name: The exchange name.
+        :type exchange_name: str
+        :return: The cryptocurrencies, None when every pair is enabled.
+        :rtype: Optional[List[str]]
+        """
+        pairs = self.config.get(exchange_name, set())
+        return None if pairs is None else sorted(pairs)
+
+    def is_enabled(self, exchange_name: str, crypto: str) -> bool:
+        """
+        Check whether a crypto is enabled on an exchange, whether or not the
+        exchange lists it.
+
+        :param exchange_name: The exchange name.
+        :type exchange_name: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :return: True when the exchange is enabled with all or this pair.
+        :rtype: bool
+        """
+        if exchange_name not in self.config:
+            return False
+        pairs = self.config[exchange_name]
+        return pairs is None or crypto in pairs
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        Get the enabled exchanges with their pairs.
+
+        :return: The config path, the pairs of every enabled exchange, the
+            exchanges whose assets are not loaded and the time of the last
+            reload.
+        :rtype: Dict[str, Any]
+        """
+        pairs: Dict[str, List[str]] = {name: [] for name in self.config}
+        for name, crypto in self.adapters:
+            pairs[name].append(crypto)
+        return {
+            "config_path": self.config_path,
+            "exchanges": {name: sorted(cryptos) for name, cryptos in pairs.items()},
+            "pending": sorted(self.pending),
+            "reloaded_at": self.reloaded_at,
+        }
@@ -1,20 +1,122 @@
-from copy import deepcopy
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
 
 import aiohttp
 from aiohttp import ClientError, ClientResponseError
 from fastapi import Response
-import requests
 
-from logger.app_logger import logger
-from typing import Any, Dict, Optional, List, Union
+from logger.app_logger import get_logger
+from offload import offloader
+from tracing import span
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Optional,
+    List,
+    Union,
+)
 
 
-individual_trade_response = {
-    "trade_id": None,
-    "side": None,
-    "size": None,
-    "price": None,
-}
+logger = get_logger(__name__)
+
+
+class SharedSession:
+    def __init__(self, limit: int, limit_per_host: int, keepalive_timeout: float):
+        """
+        Initializes a SharedSession instance, the HTTP client session every
+        upstream request goes through, so connections to the venues are kept
+        alive and reused instead of being opened for each request.
+
+        :param limit: Maximum number of open connections, 0 for no limit.
+        :type limit: int
+        :param limit_per_host: Maximum number of open connections to a venue.
+        :type limit_per_host: int
+        :param keepalive_timeout: Seconds an idle connection is kept open.
+        :type keepalive_timeout: float
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.active = 0
+
+    def get(self) -> aiohttp.ClientSession:
+        """
+        Get the session, opening it on first use or when the running event
+        loop changed.
+
+        :return: The session.
+        :rtype: aiohttp.ClientSession
+        """
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=300,
+                )
+            )
+            self.loop = loop
+        return self.session
+
+    @asynccontextmanager
+    async def request(
+        self, method: str, url: str, **kwargs: Any
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        Make a request through the session, counting it as in flight until
+        the response is released.
+
+        :param method: The HTTP method.
+        :type method: str
+        :param url: The URL to make the request to.
+        :type url: str
+        :return: The response.
+        :rtype: AsyncIterator[aiohttp.ClientResponse]
+        """
+        self.active += 1
+        try:
+            async with self.get().request(method, url, **kwargs) as response:
+                yield response
+        finally:
+            self.active -= 1
+
+    async def close(self, timeout: float) -> None:
+        """
+        Wait for the requests in flight to complete, then close the session.
+
+        :param timeout: Seconds to wait for the requests in flight.
+        :type timeout: float
+        """
+        deadline = time.monotonic() + timeout
+        while self.active and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.active:
+            logger.warning(
+                "Closing the session with %s requests in flight.", self.active
+            )
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+shared_session = SharedSession(
+    limit=int(os.environ.get("UPSTREAM_CONNECTION_LIMIT", "100")),
+    limit_per_host=int(os.environ.get("UPSTREAM_CONNECTION_LIMIT_PER_HOST", "0")),
+    keepalive_timeout=float(os.environ.get("UPSTREAM_KEEPALIVE_TIMEOUT", "30")),
+)
 
 
 async def make_request(
@@ -22,10 +124,14 @@ async def make_request(
     method: str = "GET",
     headers: Optional[Dict] = None,
     data: Optional[Dict] = None,
+    transform: Optional[Callable[[Any], Any]] = None,
 ) -> Union[dict, Response]:
     """
     Makes an HTTP request to the specified URL.
 
+    Large response bodies are decoded and normalized by the offload pool, so
+    the transform must be a module level function or a partial of one.
+
     :param url: The URL to make the request to.
     :type url: str
     :param method: The HTTP method to use (GET or POST).
@@ -34,116 +140,223 @@ async def make_request(
     :type headers: Optional[Dict]
     :param data: The data to send in the request body (for POST method).
     :type data: Optional[Dict]
-    :return: The JSON response data.
+    :param transform: Turns the JSON response data into the returned result.
+    :type transform: Optional[Callable[[Any], Any]]
+    :return: The JSON response data, transformed if a transform is given.
     :rtype: Dict[str, Any]
     :raises ClientError: If an error occurs during the request.
     :raises Exception: If an exception occurs during the request.
     """
     try:
-        async with aiohttp.ClientSession() as session:
+        with span("upstream"):
             if method.upper() == "GET":
-                async with session.get(url, headers=headers) as response:
-                    response_json = await response.json()
+                async with shared_session.request(
+                    "GET", url, headers=headers
+                ) as response:
+                    body = await response.read()
                     response.raise_for_status()
             elif method.upper() == "POST":
-                async with session.post(url, headers=headers, data=data) as response:
-                    response_json = await response.json()
+                async with shared_session.request(
+                    "POST", url, headers=headers, data=data
+                ) as response:
+                    body = await response.read()
                     response.raise_for_status()
             else:
                 raise ValueError(
                     "Invalid HTTP method. Only GET and POST are supported."
                 )
 
-            response_json = await response.json()
+        with span("json"):
+            response_json = await offloader.decode(body, transform)
         return response_json
     except ClientResponseError as e:
         raise ClientResponseError(message=str(e), status=response.status)
     except ClientError as e:
-        logger.exception(f"ClientError while making request to {url}")
+        logger.warning("ClientError while making request to %s: %s", url, e)
         raise ClientError(message=str(e), status=response.status)
     except Exception as e:
-        logger.exception(f"Encountered exception while making request to {url}")
+        logger.warning(
+            "Encountered exception while making request to %s: %s", url, e
+        )
         raise Exception(str(e))
 
 
-def make_request_synchronous(
-    url: str, method: str, headers: Optional[Dict] = None, data: Optional[Dict] = None
-) -> Union[dict, Response]:
+async def iter_completed(
+    coroutines: Iterable[Awaitable[Any]], concurrency: int
+) -> AsyncIterator[Any]:
     """
-    Make a synchronous HTTP request to the specified URL.
+    Run coroutines concurrently and yield their results as they complete.
 
-    :param url: The URL to make the request to.
-    :type url: str
-    :param method: The HTTP method to use (POST or GET).
-    :type method: str
-    :param headers: The headers to include in the request.
-    :type headers: Optional[Dict]
-    :param data: The data to include in the request (for POST requests).
-    :type data: Optional[Dict]
-    :return: The JSON response data.
-    :rtype: dict
+    At most concurrency coroutines are in flight and the next ones are only
+    started once a result has been consumed, so a slow consumer holds back
+    the requests instead of buffering their results.
+
+    :param coroutines: The coroutines, created lazily as slots free up.
+    :type coroutines: Iterable[Awaitable[Any]]
+    :param concurrency: The number of coroutines in flight.
+    :type concurrency: int
+    :return: The results in completion order.
+    :rtype: AsyncIterator[Any]
     """
+    coroutines = iter(coroutines)
+    pending = set()
     try:
-        if method.upper() == "POST":
-            response = requests.post(url, headers=headers, data=data)
-        elif method.upper() == "GET":
-            response = response.get(url, headers=headers)
-        status_code = response.status_code
-        response_data = response.json()
-
-        if response_data:
-            return response_data
-        else:
-            return Response(content="No balances to show.", status_code=status_code)
-
-    except requests.RequestException as e:
-        logger.exception(f"RequestException while making request to {url}")
-        raise RequestException(str(e))
-    except Exception as e:
-        logger.exception(f"Encountered exception while making request to {url}")
-        raise Exception(str(e))
+        while True:
+            for coroutine in coroutines:
+                pending.add(asyncio.ensure_future(coroutine))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def iter_in_order(
+    coroutines: Iterable[Awaitable[Any]], concurrency: int
+) -> AsyncIterator[Any]:
+    """
+    Run coroutines concurrently and yield their results in the order the
+    coroutines are given.
+
+    At most concurrency coroutines are in flight. Results completing ahead of
+    an earlier one wait for it, so at most concurrency results are buffered,
+    and closing the iterator only cancels coroutines later in the order.
+
+    :param coroutines: The coroutines, created lazily as slots free up.
+    :type coroutines: Iterable[Awaitable[Any]]
+    :param concurrency: The number of coroutines in flight.
+    :type concurrency: int
+    :return: The results in the order of the coroutines.
+    :rtype: AsyncIterator[Any]
+    """
+    coroutines = iter(coroutines)
+    pending: Deque[asyncio.Future] = deque()
+    try:
+        while True:
+            for coroutine in coroutines:
+                pending.append(asyncio.ensure_future(coroutine))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def compact_levels(levels: List[Any]) -> List[List[Any]]:
+    """
+    Reduce raw book levels to their price and amount.
+
+    :param levels: The levels, either [price, amount, ...] lists or
+        {"price": ..., "amount": ...} dicts.
+    :type levels: List[Any]
+    :return: The [price, amount] levels.
+    :rtype: List[List[Any]]
+    """
+    if levels and isinstance(levels[0], dict):
+        return [[level["price"], level["amount"]] for level in levels]
+    return [level[:2] for level in levels]
+
+
+def compact_book(book: Dict[str, Any]) -> Dict[str, List[List[Any]]]:
+    """
+    Reduce a raw order book to the price and amount of its levels.
+
+    :param book: The order book response.
+    :type book: Dict[str, Any]
+    :return: The [price, amount] levels keyed by side.
+    :rtype: Dict[str, List[List[Any]]]
+    """
+    return {side: compact_levels(book[side]) for side in ("bids", "asks")}
+
+
+def compact_kraken_book(response: Dict[str, Any], pair: str) -> Dict[str, Any]:
+    """
+    Reduce a raw Kraken order book to the price and amount of its levels.
+
+    :param response: The order book response.
+    :type response: Dict[str, Any]
+    :param pair: The Kraken pair.
+    :type pair: str
+    :return: The [price, amount] levels keyed by side.
+    :rtype: Dict[str, List[List[Any]]]
+    """
+    return compact_book(response["result"][pair])
+
+
+def to_epoch_ms(value: str) -> int:
+    """
+    Convert an ISO 8601 timestamp to milliseconds since the epoch.
+
+    :param value: The timestamp (Ex: "2023-06-14T12:00:00.123456Z").
+    :type value: str
+    :return: The milliseconds since the epoch.
+    :rtype: int
+    """
+    return round(datetime.fromisoformat(value).timestamp() * 1000)
 
 
 def structure_coinbase(trades: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Structure trades from Coinbase exchange.
 
+    Trade times are normalized to milliseconds since the epoch.
+
     :param trades: The trades data to be structured.
     :type trades: List[Dict[str, Any]]
     :return: A list of structured trades.
     :rtype: List[Dict[str, Any]]
     """
-    structured_trades = []
-    for trade in trades:
-        for key in individual_trade_response:
-            individual_trade_response[key] = trade[key]
-        structured_trades.append(deepcopy(individual_trade_response))
-    return structured_trades
+    return [
+        {
+            "trade_id": trade["trade_id"],
+            "side": trade["side"],
+            "size": trade["size"],
+            "price": trade["price"],
+            "time": to_epoch_ms(trade["time"]),
+        }
+        for trade in trades
+    ]
 
 
 def structure_gemini(trades: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Structure trades from Gemini exchange.
 
+    Trade times are normalized to milliseconds since the epoch.
+
     :param trades: The trades data to be structured.
     :type trades: List[Dict[str, Any]]
     :return: A list of structured trades.
     :rtype: List[Dict[str, Any]]
     """
-    structured_trades = []
-    for trade in trades:
-        individual_trade_response["trade_id"] = trade["tid"]
-        individual_trade_response["side"] = trade["type"]
-        individual_trade_response["size"] = trade["amount"]
-        individual_trade_response["price"] = trade["price"]
-        structured_trades.append(deepcopy(individual_trade_response))
-    return structured_trades
+    return [
+        {
+            "trade_id": trade["tid"],
+            "side": trade["type"],
+            "size": trade["amount"],
+            "price": trade["price"],
+            "time": trade["timestampms"],
+        }
+        for trade in trades
+    ]
 
 
 def structure_kraken(trades: Dict[str, Any], crypto_pair: str) -> List[Dict[str, Any]]:
     """
     Structure trades from Kraken exchange.
 
+    Trade times are normalized to milliseconds since the epoch.
+
     :param trades: The trades data to be structured.
     :type trades: Dict[str, Any]
     :param crypto_pair: The crypto pair.
@@ -151,12 +364,13 @@ def structure_kraken(trades: Dict[str, Any], crypto_pair: str) -> List[Dict[str,
     :return: A list of structured trades.
     :rtype: List[Dict[str, Any]]
     """
-    trades = trades["result"][crypto_pair]
-    structured_trades = []
-    for trade in trades:
-        individual_trade_response["trade_id"] = trade[6]
-        individual_trade_response["side"] = "buy" if trade[3] == "b" else "sell"
-        individual_trade_response["size"] = trade[1]
-        individual_trade_response["price"] = trade[0]
-        structured_trades.append(deepcopy(individual_trade_response))
-    return structured_trades
+    return [
+        {
+            "trade_id": trade[6],
+            "side": "buy" if trade[3] == "b" else "sell",
+            "size": trade[1],
+            "price": trade[0],
+            "time": round(float(trade[2]) * 1000),
+        }
+        for trade in trades["result"][crypto_pair]
+    ]
@@ -0,0 +1,98 @@
+import asyncio
+import bisect
+import os
+import time
+
+from typing import Any, Dict, List, Optional
+
+
+# Upper bounds in seconds of the lag histogram buckets, the last one is open.
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.05) -> None:
+        """
+        Initializes a LoopMonitor instance.
+
+        A task sleeps for interval seconds in a loop and measures how late it
+        wakes up. The lag is the time the event loop spent blocked by other
+        callbacks, such as decoding a large payload on the loop thread.
+
+        :param interval: Seconds between two measurements.
+        :type interval: float
+        """
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Discard the measurements so far.
+        """
+        self.count = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.buckets: List[int] = [0] * (len(LAG_BUCKETS) + 1)
+        self.started_at = time.time()
+
+    def record(self, lag: float) -> None:
+        """
+        Account for a measurement.
+
+        :param lag: Seconds the wake up was late by.
+        :type lag: float
+        """
+        self.count += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.buckets[bisect.bisect_left(LAG_BUCKETS, lag)] += 1
+
+    async def run(self) -> None:
+        """
+        Measure the event loop lag until cancelled.
+        """
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.record(max(time.perf_counter() - start - self.interval, 0.0))
+
+    def start(self) -> None:
+        """
+        Start measuring in the background.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop measuring.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the lag measured since the last reset.
+
+        :return: The number of measurements, mean and max lag, and the
+            histogram of lags keyed by bucket upper bound.
+        :rtype: Dict[str, Any]
+        """
+        labels = [str(bound) for bound in LAG_BUCKETS] + ["+Inf"]
+        return {
+            "since": self.started_at,
+            "interval": self.interval,
+            "measurements": self.count,
+            "mean_lag": self.total_lag / self.count if self.count else 0.0,
+            "max_lag": self.max_lag,
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+monitor = LoopMonitor(interval=float(os.environ.get("LOOP_MONITOR_INTERVAL", "0.05")))
@@ -1,15 +1,125 @@
+import os
+import time
+
 from aiohttp import ClientError, ClientResponseError
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
-from custom_exceptions import APIKeyError, EncodeError, SignatureError
-from routers import prices, trades, balances
+from custom_exceptions import (
+    APIKeyError,
+    EncodeError,
+    OverloadError,
+    SignatureError,
+)
+from admission import ADMISSION_ENABLED, controller
+from alerts import engine
+from arbitrage import scanner
+from cluster import cluster
+from compression import CompressionMiddleware
+from exchanges.utils import shared_session
+from logger.app_logger import get_logger
+from loop_monitor import monitor
+from offload import offloader
+from profiler import profiler
+from routers import (
+    admin,
+    alerts,
+    prices,
+    trades,
+    balances,
+    arbitrage,
+    book,
+    internal,
+    metrics,
+    scheduler as scheduler_router,
+    tickers,
+)
+from routers.utils import preload_assets, scheduler
+from tracing import TRACING_ENABLED, finish_trace, start_trace
+
+
+logger = get_logger(__name__)
+
+
+# Seconds in flight upstream requests are given to complete on shutdown.
+DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "10"))
 
+# Response bodies smaller than this are sent uncompressed.
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", "1024"))
 
 app = FastAPI()
 app.include_router(prices.router)
 app.include_router(trades.router)
 app.include_router(balances.router)
+app.include_router(arbitrage.router)
+app.include_router(scheduler_router.router)
+app.include_router(tickers.router)
+app.include_router(admin.router)
+app.include_router(alerts.router)
+app.include_router(metrics.router)
+app.include_router(book.router)
+app.include_router(internal.router)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if not TRACING_ENABLED and not profiler.is_armed():
+        return await call_next(request)
+    profiled = profiler.request_started()
+    trace = start_trace(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+    finally:
+        finish_trace(trace)
+        if profiled:
+            profiler.request_finished()
+    if TRACING_ENABLED:
+        response.headers["Server-Timing"] = trace.get_server_timing()
+    return response
+
+
+@app.middleware("http")
+async def admit_requests(request: Request, call_next):
+    prefix = controller.classify(request.url.path) if ADMISSION_ENABLED else None
+    if prefix is None:
+        return await call_next(request)
+    try:
+        async with controller.admit(prefix):
+            return await call_next(request)
+    except OverloadError as err:
+        return handle_overload_error(request, err)
+
+
+@app.on_event("startup")
+async def start_background_polling():
+    started = time.perf_counter()
+    monitor.start()
+    offloader.start()
+    await preload_assets()
+    await cluster.start()
+    if os.environ.get("SCHEDULER_ENABLED", "1") == "1":
+        scheduler.start()
+    if os.environ.get("ARBITRAGE_SCANNER_ENABLED", "1") == "1":
+        scanner.start()
+    if os.environ.get("ALERTS_ENABLED", "1") == "1":
+        engine.start()
+    app.state.startup = {"startup_seconds": time.perf_counter() - started}
+    launched_at = os.environ.get("SERVER_LAUNCHED_AT")
+    if launched_at:
+        app.state.startup["since_launch_seconds"] = time.time() - float(launched_at)
+    logger.info(f"Started in {app.state.startup}.")
+
+
+@app.on_event("shutdown")
+async def stop_background_polling():
+    await cluster.stop()
+    await engine.stop()
+    await scanner.stop()
+    await scheduler.stop()
+    await shared_session.close(DRAIN_TIMEOUT)
+    await monitor.stop()
+    offloader.stop()
 
 
 @app.exception_handler(EncodeError)
@@ -36,6 +146,15 @@ def handle_signature_error(request, err):
     )
 
 
+@app.exception_handler(OverloadError)
+def handle_overload_error(request, err):
+    return JSONResponse(
+        status_code=err.status_code,
+        content={"detail": err.detail},
+        headers={"Retry-After": str(err.retry_after)},
+    )
+
+
 @app.exception_handler(Exception)
 def handle_exception(request, err):
     return JSONResponse(status_code=500, content={"detail": "Internal server error."})
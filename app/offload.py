@@ -0,0 +1,208 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from logger.app_logger import get_logger
+from typing import Any, Callable, Dict, Optional
+
+
+logger = get_logger(__name__)
+
+
+OFFLOAD_MODES = ("off", "thread", "process")
+
+
+def decode_payload(body: bytes, transform: Optional[Callable[[Any], Any]]) -> Any:
+    """
+    Decode a JSON response body and normalize it.
+
+    Runs in the worker when the payload is offloaded, so the transform must be
+    a module level function (or a partial of one) for process pools to pickle.
+
+    :param body: The raw response body.
+    :type body: bytes
+    :param transform: Turns the decoded JSON into the compact result, if any.
+    :type transform: Optional[Callable[[Any], Any]]
+    :return: The decoded and normalized payload.
+    :rtype: Any
+    """
+    payload = json.loads(body)
+    return transform(payload) if transform is not None else payload
+
+
+def ignore_interrupts() -> None:
+    """
+    Leave interrupts to the server process, which shuts the pool down.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Offloader:
+    def __init__(self, mode: str, threshold: int, workers: int) -> None:
+        """
+        Initializes an Offloader instance.
+
+        Response bodies of at least threshold bytes are decoded and normalized
+        in a worker pool rather than on the event loop thread. The standard
+        json codec holds the GIL, so only the process pool keeps the loop
+        free; the thread pool is meant for codecs that release it.
+
+        :param mode: "off", "thread" or "process".
+        :type mode: str
+        :param threshold: Payload size in bytes from which decoding is offloaded.
+        :type threshold: int
+        :param workers: Number of pool workers.
+        :type workers: int
+        :raises ValueError: If the mode is unknown.
+        """
+        if mode not in OFFLOAD_MODES:
+            raise ValueError(f"Offload mode must be one of {', '.join(OFFLOAD_MODES)}.")
+        self.mode = mode
+        self.threshold = threshold
+        self.workers = workers
+        self.executor: Optional[Executor] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Discard the counters so far.
+        """
+        self.stats = {
+            "inline": {"count": 0, "bytes": 0, "seconds": 0.0, "max_seconds": 0.0},
+            "offloaded": {"count": 0, "bytes": 0, "seconds": 0.0, "max_seconds": 0.0},
+            "failures": 0,
+        }
+
+    def get_executor(self) -> Executor:
+        """
+        Get the worker pool, creating it on first use.
+
+        Worker processes are spawned rather than forked, as the server process
+        runs threads of its own.
+
+        :return: The pool.
+        :rtype: Executor
+        """
+        if self.executor is None:
+            if self.mode == "process":
+                self.executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=ignore_interrupts,
+                )
+            else:
+                self.executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="offload"
+                )
+        return self.executor
+
+    def should_offload(self, size: int) -> bool:
+        """
+        Check whether a payload is large enough to be decoded in the pool.
+
+        :param size: The payload size in bytes.
+        :type size: int
+        :return: Whether the payload is offloaded.
+        :rtype: bool
+        """
+        return self.mode != "off" and size >= self.threshold
+
+    def record(self, path: str, size: int, seconds: float) -> None:
+        """
+        Account for a decoded payload.
+
+        :param path: "inline" or "offloaded".
+        :type path: str
+        :param size: The payload size in bytes.
+        :type size: int
+        :param seconds: The decoding time, or the round trip to the pool.
+        :type seconds: float
+        """
+        stats = self.stats[path]
+        stats["count"] += 1
+        stats["bytes"] += size
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    async def decode(
+        self, body: bytes, transform: Optional[Callable[[Any], Any]] = None
+    ) -> Any:
+        """
+        Decode and normalize a response body, in the pool if it is large.
+
+        When the pool breaks the payload is decoded inline, and the pool is
+        recreated on the next offload.
+
+        :param body: The raw response body.
+        :type body: bytes
+        :param transform: Turns the decoded JSON into the compact result, if any.
+        :type transform: Optional[Callable[[Any], Any]]
+        :return: The decoded and normalized payload.
+        :rtype: Any
+        """
+        size = len(body)
+        if self.should_offload(size):
+            start = time.perf_counter()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.get_executor(), decode_payload, body, transform
+                )
+            except BrokenProcessPool:
+                logger.warning("Offload pool broke, decoding the payload inline.")
+                self.stats["failures"] += 1
+                self.executor = None
+            else:
+                self.record("offloaded", size, time.perf_counter() - start)
+                return result
+
+        start = time.perf_counter()
+        result = decode_payload(body, transform)
+        self.record("inline", size, time.perf_counter() - start)
+        return result
+
+    def start(self) -> None:
+        """
+        Start the pool workers ahead of the first large payload.
+        """
+        if self.mode == "off":
+            return
+        executor = self.get_executor()
+        for _ in range(self.workers):
+            executor.submit(decode_payload, b"null", None)
+
+    def stop(self) -> None:
+        """
+        Shut the pool down.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the settings and counters of the offloader.
+
+        Inline seconds are spent blocking the event loop, while offloaded
+        seconds are round trips to the pool the loop was free during.
+
+        :return: The settings and counters.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "workers": self.workers,
+            **self.stats,
+        }
+
+
+offloader = Offloader(
+    mode=os.environ.get("OFFLOAD_MODE", "process"),
+    threshold=int(os.environ.get("OFFLOAD_THRESHOLD", str(256 * 1024))),
+    workers=int(os.environ.get("OFFLOAD_WORKERS", "2")),
+)
@@ -0,0 +1,121 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+from typing import Optional
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005) -> None:
+        """
+        Initializes a SamplingProfiler instance.
+
+        :param interval: Seconds between two stack samples.
+        :type interval: float
+        """
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.samples: Counter = Counter()
+        self.remaining_requests = 0
+        self.active_requests = 0
+        self.deadline: Optional[float] = None
+        self.thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def is_armed(self) -> bool:
+        """
+        Check whether the profiler is waiting for or sampling requests.
+
+        :return: Whether the profiler is armed.
+        :rtype: bool
+        """
+        return self.thread is not None
+
+    def arm(self, requests: Optional[int] = None, seconds: Optional[float] = None):
+        """
+        Sample the event loop thread during the next requests or a time window.
+
+        Must be called from the event loop thread. Samples of a previous run
+        are discarded.
+
+        :param requests: Number of upcoming requests to profile.
+        :type requests: Optional[int]
+        :param seconds: Length of the time window to profile.
+        :type seconds: Optional[float]
+        """
+        with self.lock:
+            self.samples = Counter()
+            self.remaining_requests = requests or 0
+            self.deadline = time.monotonic() + seconds if seconds else None
+            self.thread_id = threading.get_ident()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def request_started(self) -> bool:
+        """
+        Count a request towards the armed budget.
+
+        :return: Whether the request is profiled.
+        :rtype: bool
+        """
+        with self.lock:
+            if self.remaining_requests <= 0:
+                return False
+            self.remaining_requests -= 1
+            self.active_requests += 1
+            return True
+
+    def request_finished(self) -> None:
+        """
+        Mark a profiled request as done.
+        """
+        with self.lock:
+            self.active_requests -= 1
+
+    def run(self) -> None:
+        """
+        Sample the stack of the event loop thread until the profiler disarms.
+        """
+        while True:
+            with self.lock:
+                in_window = (
+                    self.deadline is not None and time.monotonic() < self.deadline
+                )
+                if not (in_window or self.remaining_requests or self.active_requests):
+                    self.thread = None
+                    return
+                sampling = in_window or self.active_requests > 0
+            if sampling:
+                self.sample()
+            time.sleep(self.interval)
+
+    def sample(self) -> None:
+        """
+        Record the current stack of the event loop thread.
+        """
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            with self.lock:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def get_profile(self) -> str:
+        """
+        Get the samples in collapsed stack format, readable by flamegraph.pl
+        and speedscope.
+
+        :return: One "frame;frame;frame count" line per distinct stack.
+        :rtype: str
+        """
+        with self.lock:
+            samples = list(self.samples.items())
+        return "\n".join(f"{stack} {count}" for stack, count in samples) + "\n"
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,143 @@
+import hashlib
+import os
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from typing import Any, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Snapshot versions are only meaningful within a process, so entity tags also
+# tell apart the workers and restarts that produced them.
+INSTANCE_ID = os.urandom(8).hex()
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def wants_msgpack(request: Request) -> bool:
+    """
+    Check whether the client asked for MessagePack and it can be produced.
+
+    :param request: The request object.
+    :type request: Request
+    :return: Whether to encode the response with MessagePack.
+    :rtype: bool
+    """
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(
+        media_type in accept for media_type in MSGPACK_MEDIA_TYPES
+    )
+
+
+def get_etag(request: Request, *versions: Any) -> str:
+    """
+    Build the entity tag of a response from the versions of the snapshots it
+    is computed from, the query and the negotiated encoding.
+
+    :param request: The request object.
+    :type request: Request
+    :param versions: The snapshot versions.
+    :type versions: Any
+    :return: The weak entity tag.
+    :rtype: str
+    """
+    key = repr(
+        (
+            INSTANCE_ID,
+            request.url.path,
+            sorted(request.query_params.multi_items()),
+            wants_msgpack(request),
+            versions,
+        )
+    )
+    return f'W/"{hashlib.blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+
+def get_version_token(version: int) -> str:
+    """
+    Get the token clients hold for a snapshot version, qualified with the
+    instance that produced it.
+
+    :param version: The snapshot version.
+    :type version: int
+    :return: The version token (Ex: "9f1c2a7e5b3d4c6a.42").
+    :rtype: str
+    """
+    return f"{INSTANCE_ID}.{version}"
+
+
+def parse_version_token(token: str) -> Optional[int]:
+    """
+    Get the snapshot version of a token produced by this instance.
+
+    :param token: The version token.
+    :type token: str
+    :return: The snapshot version, None if the token is malformed or was
+        produced by another worker or before a restart.
+    :rtype: Optional[int]
+    """
+    instance_id, _, version = token.rpartition(".")
+    if instance_id != INSTANCE_ID or not version.isdigit():
+        return None
+    return int(version)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    Check whether the client already holds the response with an entity tag.
+
+    :param request: The request object.
+    :type request: Request
+    :param etag: The entity tag of the response.
+    :type etag: str
+    :return: Whether the If-None-Match header matches the entity tag.
+    :rtype: bool
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Build a 304 response.
+
+    :param etag: The entity tag of the response.
+    :type etag: str
+    :return: The empty response.
+    :rtype: Response
+    """
+    return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept"})
+
+
+def render(request: Request, content: Any, etag: Optional[str] = None) -> Response:
+    """
+    Encode a response body with MessagePack or JSON, as negotiated.
+
+    :param request: The request object.
+    :type request: Request
+    :param content: The response content.
+    :type content: Any
+    :param etag: The entity tag of the response, if any.
+    :type etag: Optional[str]
+    :return: The response.
+    :rtype: Response
+    """
+    headers = {"Vary": "Accept"}
+    if etag is not None:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+    if wants_msgpack(request):
+        return Response(
+            msgpack.packb(content), media_type="application/msgpack", headers=headers
+        )
+    return JSONResponse(content, headers=headers)
@@ -0,0 +1,107 @@
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from profiler import profiler
+from tracing import get_otlp_export
+from .utils import registry
+from typing import Optional
+
+
+router = APIRouter(prefix="/admin")
+
+
+def require_admin(request: Request) -> None:
+    """
+    Reject requests that do not carry the admin token.
+
+    :param request: The request object.
+    :type request: Request
+    :raises HTTPException: If ADMIN_TOKEN is not set or does not match the
+        X-Admin-Token header.
+    """
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    token = request.headers.get("X-Admin-Token", "")
+    if not admin_token or not hmac.compare_digest(token, admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+
+@router.post("/profile", dependencies=[Depends(require_admin)])
+async def start_profiling(
+    requests: Optional[int] = None, seconds: Optional[float] = None
+) -> dict:
+    """
+    Attach the sampling profiler to the next requests or to a time window.
+
+    :param requests: Number of upcoming requests to profile.
+    :type requests: Optional[int]
+    :param seconds: Length of the time window to profile.
+    :type seconds: Optional[float]
+    :return: The profiling settings.
+    :rtype: dict
+    """
+    if not requests and not seconds:
+        raise HTTPException(
+            status_code=422, detail="Either requests or seconds is required."
+        )
+    profiler.arm(requests, seconds)
+    return {"requests": requests, "seconds": seconds}
+
+
+@router.get("/profile", dependencies=[Depends(require_admin)])
+async def download_profile() -> PlainTextResponse:
+    """
+    Download the samples of the last profiling run in collapsed stack format.
+
+    :return: The profile.
+    :rtype: PlainTextResponse
+    """
+    return PlainTextResponse(
+        profiler.get_profile(),
+        headers={
+            "Content-Disposition": "attachment; filename=profile.folded",
+            "X-Profiler-Armed": str(profiler.is_armed()).lower(),
+        },
+    )
+
+
+@router.get("/traces", dependencies=[Depends(require_admin)])
+async def export_traces() -> dict:
+    """
+    Export the buffered request traces in OTLP JSON format.
+
+    :return: The OTLP export request.
+    :rtype: dict
+    """
+    return get_otlp_export()
+
+
+@router.get("/exchanges", dependencies=[Depends(require_admin)])
+async def get_exchanges() -> dict:
+    """
+    Get the enabled exchanges and pairs.
+
+    :return: The state of the exchange registry.
+    :rtype: dict
+    """
+    return registry.get_state()
+
+
+@router.post("/exchanges/reload", dependencies=[Depends(require_admin)])
+async def reload_exchanges(refresh_assets: bool = False) -> dict:
+    """
+    Re-read the enabled exchanges and pairs from EXCHANGES_CONFIG and rebuild
+    the exchange adapters.
+
+    :param refresh_assets: Whether to fetch the assets of the enabled
+        exchanges again, to pick up newly listed pairs.
+    :type refresh_assets: bool
+    :return: The state of the exchange registry.
+    :rtype: dict
+    """
+    try:
+        return await registry.reload(refresh_assets)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from alerts import engine
+from models.schemas import AlertRequest
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+router = APIRouter()
+limiter = Limiter(key_func=get_remote_address)
+
+
+@router.post("/alerts")
+@limiter.limit("30/minute")
+async def create_alert(request: Request, alert: AlertRequest) -> dict:
+    """
+    Register a price alert.
+
+    :param request: The request object.
+    :type request: Request
+    :param alert: The alert to register.
+    :type alert: AlertRequest
+    :return: The registered alert.
+    :rtype: dict
+    """
+    try:
+        return await engine.add(alert.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/alerts")
+async def get_alerts(request: Request) -> dict:
+    """
+    List the registered alerts.
+
+    :param request: The request object.
+    :type request: Request
+    :return: The alerts.
+    :rtype: dict
+    """
+    return {"alerts": engine.get_alerts()}
+
+
+@router.delete("/alerts/{alert_id}")
+async def delete_alert(request: Request, alert_id: str) -> dict:
+    """
+    Remove a price alert.
+
+    :param request: The request object.
+    :type request: Request
+    :param alert_id: The alert id.
+    :type alert_id: str
+    :return: The removed alert id.
+    :rtype: dict
+    """
+    if not engine.remove(alert_id):
+        raise HTTPException(status_code=404, detail="Alert not found.")
+    return {"id": alert_id}
+
+
+@router.get("/alerts/stream")
+async def stream_alerts(request: Request) -> StreamingResponse:
+    """
+    Push fired alerts to the client as server-sent events.
+
+    :param request: The request object.
+    :type request: Request
+    :return: The event stream.
+    :rtype: StreamingResponse
+    """
+    queue = engine.subscribe()
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            engine.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from arbitrage import scanner
+from models.schemas import Crypto
+from typing import Optional
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+router = APIRouter()
+limiter = Limiter(key_func=get_remote_address)
+
+
+@router.get("/arbitrage")
+@limiter.limit("5/minute")
+async def get_arbitrage_opportunities(
+    request: Request, crypto: Optional[Crypto] = None
+) -> dict:
+    """
+    Get the cross-exchange arbitrage opportunities that are currently open.
+
+    :param request: The request object.
+    :type request: Request
+    :param crypto: Restrict the opportunities to a cryptocurrency.
+    :type crypto: Optional[Crypto]
+    :return: The open opportunities and the detection latency statistics.
+    :rtype: dict
+    """
+    return {
+        "opportunities": scanner.get_opportunities(crypto.value if crypto else None),
+        "fees": scanner.fees,
+        "detection_latency": scanner.get_latency_stats(),
+    }
+
+
+@router.get("/arbitrage/stream")
+async def stream_arbitrage_opportunities(request: Request) -> StreamingResponse:
+    """
+    Push arbitrage signals to the client as server-sent events.
+
+    :param request: The request object.
+    :type request: Request
+    :return: The event stream.
+    :rtype: StreamingResponse
+    """
+    queue = scanner.subscribe()
+
+    async def event_stream():
+        try:
+            for opportunity in scanner.get_opportunities():
+                yield f"data: {json.dumps(opportunity)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    signal = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(signal)}\n\n"
+        finally:
+            scanner.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
@@ -0,0 +1,139 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from models.schemas import Crypto, Exchange
+from responses import (
+    get_etag,
+    get_version_token,
+    is_not_modified,
+    not_modified,
+    parse_version_token,
+    render,
+)
+from .utils import (
+    EXCHANGE_MAP,
+    get_consolidated_depth,
+    get_maintained_order_book,
+    get_supported_exchanges,
+)
+from typing import Optional
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+router = APIRouter()
+limiter = Limiter(key_func=get_remote_address)
+
+# Largest number of buckets per side of a depth chart.
+MAX_BUCKETS = 1000
+
+
+@router.get("/book/{crypto}", response_model=None)
+@limiter.limit("30/minute")
+async def get_depth(
+    request: Request, crypto: Crypto, bucket: str = "0.1%", buckets: int = 20
+) -> Response:
+    """
+    Get the consolidated book of a cryptocurrency across the exchanges,
+    aggregated into price buckets around the mid price.
+
+    :param request: The request object.
+    :type request: Request
+    :param crypto: The cryptocurrency.
+    :type crypto: Crypto
+    :param bucket: The bucket size, a price (Ex: "10") or a percentage of the
+        mid price (Ex: "0.1%").
+    :type bucket: str
+    :param buckets: The number of buckets per side.
+    :type buckets: int
+    :return: The mid price and the buckets of each side best first, with their
+        amount per exchange, total amount and cumulative amount.
+    :rtype: Response
+    """
+    if not 1 <= buckets <= MAX_BUCKETS:
+        raise HTTPException(
+            status_code=422, detail=f"buckets must be between 1 and {MAX_BUCKETS}."
+        )
+    try:
+        versions, depth = await get_consolidated_depth(crypto.value, bucket, buckets)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    etag = get_etag(request, versions)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    content = {
+        "crypto": crypto.value,
+        "bucket": bucket,
+        "versions": dict(versions),
+    }
+    content.update(depth)
+    return render(request, content, etag)
+
+
+@router.get("/book/{crypto}/{exchange}", response_model=None)
+@limiter.limit("30/minute")
+async def get_book(
+    request: Request,
+    crypto: Crypto,
+    exchange: Exchange,
+    depth: Optional[int] = None,
+    since: Optional[str] = None,
+) -> Response:
+    """
+    Get the order book of a cryptocurrency on an exchange, or only the levels
+    that changed since a version of it.
+
+    Responses carry the book version in their entity tag, so polling with
+    If-None-Match returns 304 until the book changes.
+
+    :param request: The request object.
+    :type request: Request
+    :param crypto: The cryptocurrency.
+    :type crypto: Crypto
+    :param exchange: The exchange.
+    :type exchange: Exchange
+    :param depth: The number of levels per side of full books, defaults to all.
+    :type depth: Optional[int]
+    :param since: The version token held by the client. When it was produced
+        by this worker and its changes are still kept, only the levels changed
+        since are returned, an amount of "0" meaning the level was removed.
+        Otherwise the full book is returned.
+    :type since: Optional[str]
+    :return: The levels best first as [price, amount] decimal strings, with the
+        version of the book and whether it is full.
+    :rtype: Response
+    """
+    supported = [EXCHANGE_MAP[item] for item in await get_supported_exchanges(crypto)]
+    if exchange.value not in supported:
+        raise HTTPException(
+            status_code=404, detail=f"{crypto.value} is not listed on {exchange.value}."
+        )
+    order_book = await get_maintained_order_book(exchange.value, crypto.value)
+    # The body is rendered from the book as it stands here, without awaiting,
+    # so it matches the version the tag is built from.
+    version = order_book.version
+    etag = get_etag(request, version)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    content = {
+        "crypto": crypto.value,
+        "exchange": exchange.value,
+        "version": get_version_token(version),
+    }
+    # Versions count the snapshots of this worker only, tokens of other
+    # workers or of a previous run get the full book.
+    since_version = parse_version_token(since) if since is not None else None
+    changes = (
+        order_book.get_changes(since_version) if since_version is not None else None
+    )
+    if changes is None:
+        content["full"] = True
+        for side in ("bids", "asks"):
+            content[side] = order_book.get_levels(side, depth)
+    else:
+        content["full"] = False
+        content["since"] = since
+        for side in ("bids", "asks"):
+            content[side] = order_book.format_levels(side, changes[side].items())
+    return render(request, content, etag)
@@ -0,0 +1,138 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+
+from cluster import cluster, encode_snapshot, serving_locally
+from models.schemas import ClusterNode, Exchange, SnapshotKind
+from responses import render
+from .utils import (
+    EXCHANGE_CLASSES,
+    TRADES_SNAPSHOT_LIMIT,
+    get_order_book,
+    get_tickers_snapshot,
+    get_trades,
+)
+from typing import Optional
+
+
+router = APIRouter(prefix="/internal")
+
+
+def require_cluster(request: Request) -> None:
+    """
+    Reject requests when clustering is disabled or that do not carry the
+    cluster token.
+
+    :param request: The request object.
+    :type request: Request
+    :raises HTTPException: If CLUSTER_SELF is not set, or CLUSTER_TOKEN is set
+        and does not match the X-Cluster-Token header.
+    """
+    if not cluster.is_enabled():
+        raise HTTPException(status_code=404, detail="Clustering is disabled.")
+    if not cluster.check_token(request.headers.get("X-Cluster-Token", "")):
+        raise HTTPException(status_code=403, detail="Cluster token required.")
+
+
+@router.get("/health", dependencies=[Depends(require_cluster)])
+async def get_health() -> dict:
+    """
+    Get the membership of the cluster as seen by this node.
+
+    :return: The node, the known and live nodes, and the routing counters.
+    :rtype: dict
+    """
+    return cluster.get_state()
+
+
+@router.get("/owner/{exchange}/{crypto:path}", dependencies=[Depends(require_cluster)])
+async def get_owner(exchange: Exchange, crypto: str) -> dict:
+    """
+    Get the node owning a pair.
+
+    :param exchange: The exchange.
+    :type exchange: Exchange
+    :param crypto: The cryptocurrency, "*" for the tickers of the exchange.
+    :type crypto: str
+    :return: The owner's URL.
+    :rtype: dict
+    """
+    return {
+        "exchange": exchange.value,
+        "crypto": crypto,
+        "owner": cluster.get_owner(exchange.value, crypto),
+    }
+
+
+@router.post("/join", dependencies=[Depends(require_cluster)])
+async def join(member: ClusterNode) -> dict:
+    """
+    Add a node that started to the ring.
+
+    :param member: The node.
+    :type member: ClusterNode
+    :return: The membership of the cluster.
+    :rtype: dict
+    """
+    cluster.add_node(member.node)
+    return cluster.get_state()
+
+
+@router.post("/leave", dependencies=[Depends(require_cluster)])
+async def leave(member: ClusterNode) -> dict:
+    """
+    Take a node that is stopping out of the ring.
+
+    :param member: The node.
+    :type member: ClusterNode
+    :return: The membership of the cluster.
+    :rtype: dict
+    """
+    cluster.remove_node(member.node)
+    return cluster.get_state()
+
+
+@router.get(
+    "/snapshot/{kind}/{exchange}/{crypto:path}",
+    response_model=None,
+    dependencies=[Depends(require_cluster)],
+)
+async def get_snapshot(
+    request: Request,
+    kind: SnapshotKind,
+    exchange: Exchange,
+    crypto: str,
+    limit: Optional[int] = None,
+) -> Response:
+    """
+    Get the freshest polled snapshot of a resource for another node.
+
+    The resource is fetched from the venue, never from another node, and
+    counts towards the demand it is polled with.
+
+    :param request: The request object.
+    :type request: Request
+    :param kind: The resource kind.
+    :type kind: SnapshotKind
+    :param exchange: The exchange.
+    :type exchange: Exchange
+    :param crypto: The cryptocurrency, "*" for tickers.
+    :type crypto: str
+    :param limit: The number of trades.
+    :type limit: Optional[int]
+    :return: The resource.
+    :rtype: Response
+    """
+    token = serving_locally.set(True)
+    try:
+        if kind == SnapshotKind.book:
+            data = await get_order_book(EXCHANGE_CLASSES[exchange.value], crypto)
+        elif kind == SnapshotKind.trades:
+            data = await get_trades(
+                EXCHANGE_CLASSES[exchange.value], crypto, limit or TRADES_SNAPSHOT_LIMIT
+            )
+        else:
+            data = (await get_tickers_snapshot(exchange.value))["data"]
+    finally:
+        serving_locally.reset(token)
+    cluster.served += 1
+    return render(request, encode_snapshot(kind.value, data))
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Request
+
+from admission import ADMISSION_ENABLED, controller
+from loop_monitor import monitor
+from offload import offloader
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+router = APIRouter()
+limiter = Limiter(key_func=get_remote_address)
+
+
+@router.get("/metrics/loop")
+@limiter.limit("30/minute")
+async def get_loop_metrics(request: Request, reset: bool = False) -> dict:
+    """
+    Get how long the event loop was blocked, and how much payload decoding
+    ran on the loop rather than in the offload pool.
+
+    :param request: The request object.
+    :type request: Request
+    :param reset: Whether to start a new measurement window after reading.
+    :type reset: bool
+    :return: The event loop lag and the decoding counters.
+    :rtype: dict
+    """
+    metrics = {"loop": monitor.get_stats(), "decoding": offloader.get_stats()}
+    if reset:
+        monitor.reset()
+        offloader.reset()
+    return metrics
+
+
+@router.get("/metrics/startup")
+@limiter.limit("30/minute")
+async def get_startup_metrics(request: Request) -> dict:
+    """
+    Get how long the server took to start.
+
+    :param request: The request object.
+    :type request: Request
+    :return: The seconds spent in the startup hook preloading state, and since
+        the launcher started the server when it was launched with it.
+    :rtype: dict
+    """
+    return getattr(request.app.state, "startup", {})
+
+
+@router.get("/metrics/admission")
+@limiter.limit("30/minute")
+async def get_admission_metrics(request: Request) -> dict:
+    """
+    Get the admission control occupancy and shedding counters.
+
+    :param request: The request object.
+    :type request: Request
+    :return: Whether admission control is enabled, the requests running and
+        queued, and what was shed for which reason, per route class, along
+        with the upstream slots of every exchange.
+    :rtype: dict
+    """
+    return {"enabled": ADMISSION_ENABLED, **controller.get_stats()}
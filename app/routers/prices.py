@@ -2,9 +2,13 @@ from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import Response
 
 from models.schemas import Crypto, ViewType
+from responses import get_etag, is_not_modified, not_modified, render
 from .utils import (
+    get_book_versions,
     get_consolidated_prices,
     get_all_exchanges_prices,
+    get_cross_prices,
+    read_book_versions,
 )
 from slowapi.errors import RateLimitExceeded
 from slowapi import Limiter
@@ -15,35 +19,85 @@ router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
 
-@router.get("/prices/{crypto}")
+@router.get("/prices/{crypto}", response_model=None)
 @limiter.limit("5/minute")
 async def get_prices(
     request: Request, crypto: Crypto, quantity: int, view: ViewType
-) -> dict:
+) -> Response:
     """
     Retrieves the buying and selling prices for a given cryptocurrency.
     Rate limit is 5 requests per minute
+    Responses carry the versions of the books they are computed from in their
+    entity tag, so polling with If-None-Match returns 304 until a book changes.
     :param crypto: The cryptocurrency.
     :type crypto: Crypto
     :param quantity: The quantity of the cryptocurrency.
     :type quantity: int
     :return: A dictionary containing the crypto, quantity, buying price, and selling price
     if no error is encountered. Else it returns the error message and 500 status code.
-    :rtype: dict
+    :rtype: Response
     """
+    versions = await get_book_versions(crypto.value)
+    etag = get_etag(request, versions)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
     if view == ViewType.consolidated:
-        buying_price, selling_price = await get_consolidated_prices(crypto, quantity)
-        return {
-            "crypto": crypto,
+        buying_price, selling_price = await get_consolidated_prices(
+            crypto.value, quantity
+        )
+        response = {
+            "crypto": crypto.value,
             "quantity": quantity,
             "buying_price": buying_price,
             "selling_price": selling_price,
         }
     elif view == ViewType.individual:
-        prices = await get_all_exchanges_prices(crypto, quantity)
+        prices = await get_all_exchanges_prices(crypto.value, quantity)
         response = {
-            "crypto": crypto,
+            "crypto": crypto.value,
             "quantity": quantity,
         }
         response.update(prices)
-        return response
+    # A book refreshed while the prices were computed would send them under
+    # the tag of other versions, such responses go out untagged.
+    if read_book_versions(crypto.value) != versions:
+        etag = None
+    return render(request, response, etag)
+
+
+@router.get("/prices/{base}/{quote}", response_model=None)
+@limiter.limit("5/minute")
+async def get_cross_pair_prices(
+    request: Request, base: Crypto, quote: Crypto, quantity: float
+) -> Response:
+    """
+    Get the buying and selling prices of a cryptocurrency in another one.
+
+    Each price is taken from the better of the pair listed directly and the
+    pair synthesized from both USD books, and reports the route it used.
+
+    :param request: The request object.
+    :type request: Request
+    :param base: The cryptocurrency priced.
+    :type base: Crypto
+    :param quote: The cryptocurrency it is priced in.
+    :type quote: Crypto
+    :param quantity: The quantity of the base cryptocurrency.
+    :type quantity: float
+    :return: The total buying and selling prices in the quote with their
+        routes, and the prices of every route.
+    :rtype: Response
+    """
+    if base == quote:
+        raise HTTPException(
+            status_code=422, detail="The base and quote must be different."
+        )
+    cryptos = (base.value, quote.value, f"{base.value}/{quote.value}")
+    versions = [await get_book_versions(crypto) for crypto in cryptos]
+    etag = get_etag(request, versions)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    prices = await get_cross_prices(base.value, quote.value, quantity)
+    if [read_book_versions(crypto) for crypto in cryptos] != versions:
+        etag = None
+    return render(request, prices, etag)
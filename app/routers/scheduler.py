@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Request
+
+from .utils import scheduler
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+router = APIRouter()
+limiter = Limiter(key_func=get_remote_address)
+
+
+@router.get("/scheduler")
+@limiter.limit("5/minute")
+async def get_scheduler_state(request: Request) -> dict:
+    """
+    Get the state of the background polling scheduler.
+
+    :param request: The request object.
+    :type request: Request
+    :return: The poll interval, last refresh and demand score of every
+        (exchange, crypto) pair, along with the remaining request budgets.
+    :rtype: dict
+    """
+    return {
+        "budgets": scheduler.budgets,
+        "tokens": scheduler.tokens,
+        "entries": scheduler.get_state(),
+    }
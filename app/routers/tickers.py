@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Request
+
+from .utils import get_all_exchanges_tickers
+from typing import Optional
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+router = APIRouter()
+limiter = Limiter(key_func=get_remote_address)
+
+
+@router.get("/tickers")
+@limiter.limit("5/minute")
+async def get_tickers(request: Request, cryptos: Optional[str] = None) -> dict:
+    """
+    Get the best bid, best ask and last price of many cryptocurrencies.
+
+    :param request: The request object.
+    :type request: Request
+    :param cryptos: Comma separated tickers (Ex: BTC,ETH), defaults to every
+        USD pair listed by the exchanges.
+    :type cryptos: Optional[str]
+    :return: The tickers keyed by crypto, then by exchange.
+    :rtype: dict
+    """
+    if cryptos is not None:
+        cryptos = [crypto.strip().upper() for crypto in cryptos.split(",")]
+    tickers = await get_all_exchanges_tickers(cryptos)
+    return {"tickers": tickers}
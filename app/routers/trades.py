@@ -1,25 +1,50 @@
-from fastapi import APIRouter, Request
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 
-from models.schemas import Crypto
+from models.schemas import Crypto, ViewType
+from responses import render
 from .utils import (
     get_consolidated_prices,
     get_all_exchanges_trades,
     get_all_exchanges_prices,
+    get_trade_tape,
+    stream_all_exchanges_trades,
 )
 from slowapi.errors import RateLimitExceeded
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from typing import Optional, Union
 
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
 
-@router.get("/trades/{crypto}")
+@router.get("/trades/{crypto}", response_model=None)
 @limiter.limit("5/minute")
-async def get_trades(request: Request, crypto: Crypto, limit: int) -> dict:
-    response = {"crypto": crypto}
-    trades = await get_all_exchanges_trades(crypto, limit)
+async def get_trades(
+    request: Request,
+    crypto: Crypto,
+    limit: int,
+    stream: bool = False,
+    view: ViewType = ViewType.individual,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> Union[Response, StreamingResponse]:
+    if view == ViewType.consolidated:
+        if stream:
+            raise HTTPException(
+                status_code=422, detail="The consolidated tape cannot be streamed."
+            )
+        response = {"crypto": crypto.value}
+        response.update(await get_trade_tape(crypto.value, limit, start, end))
+        return render(request, response)
+    if stream:
+        return StreamingResponse(
+            stream_all_exchanges_trades(crypto.value, limit),
+            media_type="application/x-ndjson",
+        )
+    response = {"crypto": crypto.value}
+    trades = await get_all_exchanges_trades(crypto.value, limit)
     response.update(trades)
-    return response
+    return render(request, response)
@@ -1,15 +1,189 @@
+import asyncio
+import bisect
+import heapq
+import json
+import os
+from collections import OrderedDict
+from contextlib import aclosing
+from decimal import Decimal
+from fractions import Fraction
+from operator import itemgetter
+
+from admission import controller, current_admission
+from cluster import cluster
+from custom_exceptions import OverloadError
 from exchanges.coinbase import Coinbase
 from exchanges.exchange_interface import ExchangeInterface
+from exchanges.fixed_point import (
+    DEFAULT_DECIMALS,
+    iter_rescaled,
+    to_decimal_string,
+    to_fixed,
+)
 from exchanges.kraken import Kraken
+from exchanges.order_book import OrderBook, get_bucketed_depth
 from exchanges.gemini import Gemini
-from logger.app_logger import logger
-from typing import Any, Dict, List, Optional, Tuple, Type
+from exchanges.registry import ExchangeRegistry
+from logger.app_logger import get_logger
+from scheduler import PollingScheduler, REQUEST_BUDGETS
+from tracing import span
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+
+logger = get_logger(__name__)
 
 
 EXCHANGE_MAP = {Coinbase: "coinbase", Gemini: "gemini", Kraken: "kraken"}
+EXCHANGE_CLASSES = {name: exchange for exchange, name in EXCHANGE_MAP.items()}
+
+# One adapter per enabled pair, with the exchanges listing each crypto.
+registry = ExchangeRegistry(
+    EXCHANGE_CLASSES,
+    os.environ.get("EXCHANGES_CONFIG"),
+    float(os.environ.get("ASSETS_RETRY_INTERVAL", "5")),
+)
+
+# Placeholder crypto of the resources covering every listed pair.
+UNIVERSE = "*"
+
+# Polled snapshots older than this are refetched on the request path.
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", "10"))
+
+# Number of book versions whose changes are kept for delta responses.
+BOOK_HISTORY = int(os.environ.get("BOOK_HISTORY", "100"))
+
+# Number of consolidated depth charts cached, by crypto and bucketing.
+DEPTH_CACHE_SIZE = int(os.environ.get("DEPTH_CACHE_SIZE", "256"))
 
+# Largest trade pull served from polled snapshots, about one exchange page.
+TRADES_SNAPSHOT_LIMIT = int(os.environ.get("TRADES_SNAPSHOT_LIMIT", "1000"))
 
-async def get_consolidated_prices(crypto: str, quantity: float) -> Tuple[float, float]:
+
+async def fetch_order_book(
+    exchange_name: str, crypto: str, limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Fetch the sorted order book of a cryptocurrency for the polling scheduler.
+
+    :param exchange_name: The exchange name.
+    :type exchange_name: str
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :param limit: Unused, books are always fetched in full.
+    :type limit: Optional[int]
+    :return: The sorted order book.
+    :rtype: Dict[str, Any]
+    """
+    return await get_sorted_order_book(EXCHANGE_CLASSES[exchange_name], crypto)
+
+
+async def fetch_trades(
+    exchange_name: str, crypto: str, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fetch the recent trades of a cryptocurrency for the polling scheduler.
+
+    :param exchange_name: The exchange name.
+    :type exchange_name: str
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :param limit: The number of trades.
+    :type limit: Optional[int]
+    :return: The structured trades.
+    :rtype: List[Dict[str, Any]]
+    """
+    return await registry.get_adapter(exchange_name, crypto).get_trades(limit)
+
+
+async def fetch_tickers(
+    exchange_name: str, crypto: str, limit: Optional[int] = None
+) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Fetch the tickers of the USD pairs enabled on an exchange for the polling
+    scheduler.
+
+    Exchanges fanning the fetch out into one request per pair are throttled
+    to their request budget, as the scheduler only charges the first one.
+
+    :param exchange_name: The exchange name.
+    :type exchange_name: str
+    :param crypto: Unused, every enabled pair is fetched at once.
+    :type crypto: str
+    :param limit: Unused.
+    :type limit: Optional[int]
+    :return: The tickers keyed by crypto.
+    :rtype: Dict[str, Dict[str, Optional[str]]]
+    """
+    return await EXCHANGE_CLASSES[exchange_name].get_tickers(
+        registry.get_pairs(exchange_name),
+        lambda: scheduler.acquire(exchange_name),
+    )
+
+
+# Every server worker polls on its own, so the venue budgets are split evenly.
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# In a cluster, the resources owned by other nodes are read from their
+# snapshots rather than polled from the venues.
+scheduler = PollingScheduler(
+    {
+        "book": cluster.route("book", fetch_order_book),
+        "trades": cluster.route("trades", fetch_trades),
+        "tickers": cluster.route("tickers", fetch_tickers),
+    },
+    {exchange: budget / WORKERS for exchange, budget in REQUEST_BUDGETS.items()},
+    base_interval=float(os.environ.get("SCHEDULER_BASE_INTERVAL", "30")),
+    min_interval=float(os.environ.get("SCHEDULER_MIN_INTERVAL", "1")),
+    max_interval=float(os.environ.get("SCHEDULER_MAX_INTERVAL", "60")),
+)
+
+
+# Incrementally maintained books, brought in line with every polled snapshot.
+order_books: Dict[Tuple[str, str], OrderBook] = {}
+
+
+def update_order_book(
+    exchange_name: str, crypto: str, kind: str, snapshot: Dict[str, Any]
+) -> None:
+    """
+    Apply a refreshed book snapshot to the incrementally maintained book.
+
+    :param exchange_name: The exchange name.
+    :type exchange_name: str
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :param kind: The resource kind, only books are applied.
+    :type kind: str
+    :param snapshot: The scheduler snapshot.
+    :type snapshot: Dict[str, Any]
+    """
+    if kind != "book":
+        return
+    data = snapshot["data"]
+    order_book = order_books.get((exchange_name, crypto))
+    if order_book is None:
+        order_book = order_books[(exchange_name, crypto)] = OrderBook(
+            data["price_decimals"], data["amount_decimals"], BOOK_HISTORY
+        )
+    elif order_book.version == snapshot["version"]:
+        return
+    order_book.apply_snapshot(data, snapshot["version"])
+
+
+scheduler.add_listener(update_order_book)
+
+
+async def get_consolidated_prices(crypto: str, quantity: float) -> Tuple[str, str]:
     """
     Get consolidated buying and selling prices across all supported exchanges.
 
@@ -17,17 +191,21 @@ async def get_consolidated_prices(crypto: str, quantity: float) -> Tuple[float,
     :type crypto: str
     :param quantity: The quantity.
     :type quantity: float
-    :return: The buying price and selling price.
-    :rtype: Tuple[float, float]
+    :return: The buying price and selling price as exact decimal strings.
+    :rtype: Tuple[str, str]
     """
     exchanges = await get_supported_exchanges(crypto)
+    order_books = [await get_order_book(exchange, crypto) for exchange in exchanges]
+    order_book = merge_order_books(order_books)
+    price_decimals = order_book["price_decimals"]
+    amount_decimals = order_book["amount_decimals"]
 
-    for exchange in exchanges:
-        bids = await get_sorted_exchange_prices(exchange, crypto, True)
-        asks = await get_sorted_exchange_prices(exchange, crypto, False)
-
-    buying_price = compute_total_price(asks, quantity)
-    selling_price = compute_total_price(bids, quantity)
+    buying_price = compute_total_price(
+        order_book["asks"], quantity, price_decimals, amount_decimals
+    )
+    selling_price = compute_total_price(
+        order_book["bids"], quantity, price_decimals, amount_decimals
+    )
 
     return buying_price, selling_price
 
@@ -38,6 +216,9 @@ async def get_all_exchanges_prices(
     """
     Get prices from all supported exchanges.
 
+    Prices are read from the incrementally maintained books, so a quote takes
+    O(log n) time in the depth of the book.
+
     :param crypto: The cryptocurrency.
     :type crypto: str
     :param quantity: The quantity.
@@ -51,14 +232,15 @@ async def get_all_exchanges_prices(
     for exchange in exchanges:
         if exchange in EXCHANGE_MAP:
             exchange_key = EXCHANGE_MAP[exchange]
-            buying_price = await get_sorted_exchange_prices(exchange, crypto, True)
-            selling_price = await get_sorted_exchange_prices(exchange, crypto, False)
-            response[exchange_key]["buying_price"] = compute_total_price(
-                buying_price, quantity
-            )
-            response[exchange_key]["selling_price"] = compute_total_price(
-                selling_price, quantity
-            )
+            await get_order_book(exchange, crypto)
+            order_book = order_books[(exchange_key, crypto)]
+            with span("compute"):
+                response[exchange_key]["buying_price"] = order_book.get_total_price(
+                    "bids", quantity
+                )
+                response[exchange_key]["selling_price"] = order_book.get_total_price(
+                    "asks", quantity
+                )
 
     return response
 
@@ -74,86 +256,584 @@ async def get_all_exchanges_trades(crypto: str, limit: int) -> Dict[str, Any]:
     :return: The trades from all exchanges.
     :rtype: Dict[str, Any]
     """
-    import copy
-
     exchanges = await get_supported_exchanges(crypto)
     trades = {}
     for exchange in exchanges:
         if exchange in EXCHANGE_MAP:
-            exchange_key = EXCHANGE_MAP[exchange]
-            response = await exchange(crypto).get_trades(limit)
-            trades[exchange_key] = copy.deepcopy(response)
+            trades[EXCHANGE_MAP[exchange]] = await get_trades(exchange, crypto, limit)
     return trades
 
 
-async def get_supported_exchanges(crypto: str) -> List[Type[ExchangeInterface]]:
+def get_trades_window(
+    trades: List[Dict[str, Any]], start: Optional[int], end: Optional[int]
+) -> List[Dict[str, Any]]:
     """
-    Get the supported exchanges for a given cryptocurrency.
+    Get the trades of a time window, by bisecting the trades newest first.
+
+    :param trades: The trades, newest first.
+    :type trades: List[Dict[str, Any]]
+    :param start: The start of the window in milliseconds since the epoch.
+    :type start: Optional[int]
+    :param end: The end of the window in milliseconds since the epoch, excluded.
+    :type end: Optional[int]
+    :return: The trades of the window, oldest first.
+    :rtype: List[Dict[str, Any]]
+    """
+    first = 0 if end is None else bisect.bisect_right(
+        trades, -end, key=lambda trade: -trade["time"]
+    )
+    last = len(trades) if start is None else bisect.bisect_right(
+        trades, -start, key=lambda trade: -trade["time"]
+    )
+    return trades[first:last][::-1]
+
+
+def summarize_trades(trades: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Get the number of trades, volume and volume weighted average price.
+
+    :param trades: The trades.
+    :type trades: Iterable[Dict[str, Any]]
+    :return: The summary, with the volume and VWAP as exact decimal strings.
+    :rtype: Dict[str, Any]
+    """
+    count = 0
+    volume = Decimal(0)
+    notional = Decimal(0)
+    for trade in trades:
+        size = Decimal(trade["size"])
+        count += 1
+        volume += size
+        notional += size * Decimal(trade["price"])
+    return {
+        "trades": count,
+        "volume": str(volume),
+        "vwap": str(notional / volume) if volume else None,
+    }
+
+
+def tag_trades(
+    exchange_name: str, trades: Iterable[Dict[str, Any]]
+) -> Iterator[Dict[str, Any]]:
+    """
+    Tag trades with their exchange, as they are read.
+
+    :param exchange_name: The exchange name.
+    :type exchange_name: str
+    :param trades: The trades.
+    :type trades: Iterable[Dict[str, Any]]
+    :return: The tagged trades.
+    :rtype: Iterator[Dict[str, Any]]
+    """
+    return ({"exchange": exchange_name, **trade} for trade in trades)
+
+
+async def get_trade_tape(
+    crypto: str, limit: int, start: Optional[int] = None, end: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Get the trades of all supported exchanges as a single chronological tape.
+
+    The trades of every exchange are already ordered, so the window is cut by
+    bisection and the exchanges are merged in a single pass rather than
+    sorting the combined trades.
 
     :param crypto: The cryptocurrency.
     :type crypto: str
-    :return: The supported exchanges.
-    :rtype: List[Type[ExchangeInterface]]
+    :param limit: The maximum number of trades per exchange.
+    :type limit: int
+    :param start: The start of the window in milliseconds since the epoch.
+    :type start: Optional[int]
+    :param end: The end of the window in milliseconds since the epoch, excluded.
+    :type end: Optional[int]
+    :return: The trades oldest first, tagged with their exchange, with their
+        volume and VWAP per exchange and overall.
+    :rtype: Dict[str, Any]
     """
-    assets = await get_assets()
-    exchanges = []
-    for exchange in EXCHANGE_MAP:
+    exchanges = [
+        exchange
+        for exchange in await get_supported_exchanges(crypto)
+        if exchange in EXCHANGE_MAP
+    ]
+    windows = {
+        EXCHANGE_MAP[exchange]: get_trades_window(trades, start, end)
+        for exchange, trades in zip(
+            exchanges,
+            await asyncio.gather(
+                *(get_trades(exchange, crypto, limit) for exchange in exchanges)
+            ),
+        )
+    }
+    with span("compute"):
+        tape = list(
+            heapq.merge(
+                *(
+                    tag_trades(exchange_name, trades)
+                    for exchange_name, trades in windows.items()
+                ),
+                key=itemgetter("time"),
+            )
+        )
+        summary = {
+            exchange_name: summarize_trades(trades)
+            for exchange_name, trades in windows.items()
+        }
+        summary["all"] = summarize_trades(tape)
+    return {"trades": tape, "summary": summary}
+
+
+async def stream_all_exchanges_trades(crypto: str, limit: int) -> AsyncIterator[bytes]:
+    """
+    Stream trades from all supported exchanges as newline delimited JSON.
+
+    Exchanges are paginated concurrently and every page is written out as
+    soon as it arrives, one trade per line tagged with its exchange. The
+    queue between the exchanges and the client is bounded, so pages are only
+    fetched as fast as the client reads them. An exchange that fails writes
+    a single line with its error.
+
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :param limit: The maximum number of trades per exchange.
+    :type limit: int
+    :return: The NDJSON chunks.
+    :rtype: AsyncIterator[bytes]
+    """
+    # Streams are paced by the client rather than bound by the request deadline.
+    current_admission.set(None)
+    exchanges = [
+        exchange
+        for exchange in await get_supported_exchanges(crypto)
+        if exchange in EXCHANGE_MAP
+    ]
+    pages = asyncio.Queue(maxsize=len(exchanges) or 1)
+
+    async def produce(exchange: Type[ExchangeInterface]) -> None:
         exchange_name = EXCHANGE_MAP[exchange]
-        if crypto in assets[exchange_name]:
-            exchanges.append(exchange)
+        try:
+            if limit <= TRADES_SNAPSHOT_LIMIT:
+                await pages.put(
+                    (exchange_name, await get_trades(exchange, crypto, limit), None)
+                )
+            else:
+                # Exchange slots are only held while a page is fetched, not
+                # while it waits for the client.
+                trades = registry.get_adapter(exchange_name, crypto).iter_trades(limit)
+                async with aclosing(trades):
+                    while True:
+                        async with controller.exchange_slot(exchange_name):
+                            page = await anext(trades, None)
+                        if page is None:
+                            break
+                        await pages.put((exchange_name, page, None))
+        except Exception as e:
+            logger.warning("Failed to stream %s trades: %s", exchange_name, e)
+            await pages.put((exchange_name, None, str(e)))
+        await pages.put((exchange_name, None, None))
 
-    return exchanges
+    producers = [asyncio.create_task(produce(exchange)) for exchange in exchanges]
+    try:
+        finished = 0
+        while finished < len(producers):
+            exchange_name, page, error = await pages.get()
+            if error is not None:
+                yield (
+                    json.dumps({"exchange": exchange_name, "error": error}) + "\n"
+                ).encode()
+            elif page is None:
+                finished += 1
+            else:
+                yield "".join(
+                    json.dumps({"exchange": exchange_name, **trade}) + "\n"
+                    for trade in page
+                ).encode()
+    finally:
+        for producer in producers:
+            producer.cancel()
 
 
-async def get_assets() -> Dict[str, Dict[str, Any]]:
+async def get_trades(
+    exchange: Type[ExchangeInterface], crypto: str, limit: int
+) -> List[Dict[str, Any]]:
     """
-    Get the assets from all exchanges.
+    Get the most recent trades of a given cryptocurrency on an exchange.
 
-    :return: The assets from all exchanges.
-    :rtype: Dict[str, Dict[str, Any]]
+    Limits up to TRADES_SNAPSHOT_LIMIT are served from the polling
+    scheduler's snapshots, larger pulls paginate the exchange directly so
+    they are not polled in the background.
+
+    :param exchange: The exchange.
+    :type exchange: Type[ExchangeInterface]
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :param limit: The number of trades.
+    :type limit: int
+    :return: The structured trades, shared with the snapshot and not to be
+        modified.
+    :rtype: List[Dict[str, Any]]
     """
-    assets = {}
-    for exchange in EXCHANGE_MAP:
-        exchange_name = EXCHANGE_MAP[exchange]
-        assets[exchange_name] = await exchange.get_assets()
-    return assets
+    exchange_name = EXCHANGE_MAP[exchange]
+    if limit > TRADES_SNAPSHOT_LIMIT:
+        async with controller.exchange_slot(exchange_name):
+            return await registry.get_adapter(exchange_name, crypto).get_trades(limit)
+    scheduler.record_demand(exchange_name, crypto, "trades", limit)
+    snapshot = scheduler.get_snapshot(
+        exchange_name, crypto, "trades", SNAPSHOT_MAX_AGE, limit
+    )
+    if snapshot is None:
+        async with controller.exchange_slot(exchange_name):
+            snapshot = await scheduler.fetch(exchange_name, crypto, "trades", limit)
+    return snapshot["data"][:limit]
+
+
+async def get_all_exchanges_tickers(
+    cryptos: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Dict[str, Optional[str]]]]:
+    """
+    Get the best bid, best ask and last price from all exchanges.
+
+    The enabled USD pairs of every exchange are fetched at once and shared
+    through the polling scheduler. On exchanges with a multi-pair ticker API,
+    the number of upstream requests does not grow with the number of cryptos.
+    Coinbase needs one request per pair, throttled to its budget.
+
+    :param cryptos: The cryptocurrencies, defaults to every listed one.
+    :type cryptos: Optional[List[str]]
+    :return: The tickers keyed by crypto, then by exchange.
+    :rtype: Dict[str, Dict[str, Dict[str, Optional[str]]]]
+    """
+    await registry.ensure_loaded()
+    exchange_names = registry.get_enabled()
+    for exchange_name in exchange_names:
+        scheduler.record_demand(exchange_name, UNIVERSE, "tickers")
+    snapshots = await asyncio.gather(
+        *(get_tickers_snapshot(exchange_name) for exchange_name in exchange_names),
+        return_exceptions=True,
+    )
+    tickers = {}
+    for exchange_name, snapshot in zip(exchange_names, snapshots):
+        if isinstance(snapshot, Exception):
+            logger.warning("Failed to fetch %s tickers: %s", exchange_name, snapshot)
+            continue
+        for crypto, ticker in snapshot["data"].items():
+            if cryptos is not None and crypto not in cryptos:
+                continue
+            if registry.is_enabled(exchange_name, crypto):
+                tickers.setdefault(crypto, {})[exchange_name] = ticker
+    return tickers
+
+
+async def get_tickers_snapshot(exchange_name: str) -> Dict[str, Any]:
+    """
+    Get the freshest polled tickers of an exchange, fetching them if needed.
+
+    :param exchange_name: The exchange name.
+    :type exchange_name: str
+    :return: The tickers snapshot.
+    :rtype: Dict[str, Any]
+    """
+    snapshot = scheduler.get_snapshot(
+        exchange_name, UNIVERSE, "tickers", SNAPSHOT_MAX_AGE
+    )
+    if snapshot is None:
+        async with controller.exchange_slot(exchange_name):
+            snapshot = await scheduler.fetch(exchange_name, UNIVERSE, "tickers")
+    return snapshot
+
+
+async def get_supported_exchanges(crypto: str) -> List[Type[ExchangeInterface]]:
+    """
+    Get the supported exchanges for a given cryptocurrency.
+
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :return: The supported exchanges, shared and not to be modified.
+    :rtype: List[Type[ExchangeInterface]]
+    """
+    return await registry.get_exchanges(crypto)
+
+
+async def preload_assets() -> None:
+    """
+    Load the asset maps and scales of every enabled exchange concurrently and
+    build their adapters, ahead of the first request.
+    """
+    await registry.reload()
 
 
 def compute_total_price(
-    offers: List[Dict[str, Any]], required_quantity: float
-) -> float:
+    offers: Iterable[Dict[str, int]],
+    required_quantity: float,
+    price_decimals: int,
+    amount_decimals: int,
+) -> str:
     """
     Compute the total price based on the offers and required quantity.
 
-    :param offers: The offers.
-    :type offers: List[Dict[str, Any]]
+    Offers are fixed-point integers, so the fill is computed exactly in
+    integer arithmetic and only formatted back to a decimal at the end. The
+    walk stops at the level that fills the quantity, so lazily decoded offers
+    beyond it are never read.
+
+    :param offers: The offers, best first.
+    :type offers: Iterable[Dict[str, int]]
     :param required_quantity: The required quantity.
     :type required_quantity: float
-    :return: The total price.
-    :rtype: float
+    :param price_decimals: The number of decimals of the offer prices.
+    :type price_decimals: int
+    :param amount_decimals: The number of decimals of the offer amounts.
+    :type amount_decimals: int
+    :return: The total price as an exact decimal string.
+    :rtype: str
+    """
+    with span("compute"):
+        quantity_left = to_fixed(required_quantity, amount_decimals)
+        total_price = 0
+        if quantity_left > 0:
+            for offer in offers:
+                current_quantity = min(offer["amount"], quantity_left)
+                total_price += current_quantity * offer["price"]
+                quantity_left -= current_quantity
+                if quantity_left <= 0:
+                    break
+        return to_decimal_string(total_price, price_decimals + amount_decimals)
+
+
+def compute_total_prices(
+    offers: Iterable[Dict[str, int]],
+    required_quantities: List[float],
+    price_decimals: int,
+    amount_decimals: int,
+) -> List[str]:
     """
-    quantity_so_far = 0
-    total_price = 0
-    required_quantity = float(required_quantity)
+    Compute the total prices of several quantities in a single walk of the
+    offers, with the semantics of compute_total_price.
+
+    The quantities are filled smallest first, each one resuming the walk
+    where the previous one stopped, so the offers are read once up to the
+    level filling the largest quantity.
+
+    :param offers: The offers, best first.
+    :type offers: Iterable[Dict[str, int]]
+    :param required_quantities: The required quantities.
+    :type required_quantities: List[float]
+    :param price_decimals: The number of decimals of the offer prices.
+    :type price_decimals: int
+    :param amount_decimals: The number of decimals of the offer amounts.
+    :type amount_decimals: int
+    :return: The total prices as exact decimal strings, in the order of the
+        quantities.
+    :rtype: List[str]
+    """
+    with span("compute"):
+        targets = sorted(
+            (to_fixed(quantity, amount_decimals), index)
+            for index, quantity in enumerate(required_quantities)
+        )
+        total_prices = [0] * len(targets)
+        # Amount and notional of the levels taken whole so far.
+        filled = 0
+        filled_price = 0
+        offers = iter(offers)
+        offer = next(offers, None)
+        for target, index in targets:
+            while offer is not None and filled + offer["amount"] < target:
+                filled += offer["amount"]
+                filled_price += offer["amount"] * offer["price"]
+                offer = next(offers, None)
+            total_price = filled_price
+            if offer is not None and target > filled:
+                total_price += (target - filled) * offer["price"]
+            total_prices[index] = total_price
+        return [
+            to_decimal_string(total_price, price_decimals + amount_decimals)
+            for total_price in total_prices
+        ]
+
+
+def fill_quantity(
+    offers: Iterable[Dict[str, int]],
+    quantity: Fraction,
+    price_decimals: int,
+    amount_decimals: int,
+) -> Optional[Fraction]:
+    """
+    Get the notional of taking a quantity from the best offers.
+
+    :param offers: The fixed-point offers, best first.
+    :type offers: Iterable[Dict[str, int]]
+    :param quantity: The quantity.
+    :type quantity: Fraction
+    :param price_decimals: The number of decimals of the offer prices.
+    :type price_decimals: int
+    :param amount_decimals: The number of decimals of the offer amounts.
+    :type amount_decimals: int
+    :return: The exact notional, None if the offers are too thin.
+    :rtype: Optional[Fraction]
+    """
+    notional = Fraction(0)
+    quantity_left = quantity
     for offer in offers:
-        current_price = offer["price"]
-        current_quantity = offer["amount"]
-        if quantity_so_far <= required_quantity:
-            if current_quantity > required_quantity - quantity_so_far:
-                total_price += (required_quantity - quantity_so_far) * current_price
-                break
-            else:
-                total_price += current_quantity * current_price
-                quantity_so_far += current_quantity
-    return total_price
+        if quantity_left <= 0:
+            break
+        taken = min(Fraction(offer["amount"], 10**amount_decimals), quantity_left)
+        notional += taken * Fraction(offer["price"], 10**price_decimals)
+        quantity_left -= taken
+    return notional if quantity_left <= 0 else None
 
 
-def empty_prices_response() -> Dict[str, Dict[str, Optional[float]]]:
+def fill_notional(
+    offers: Iterable[Dict[str, int]],
+    notional: Fraction,
+    price_decimals: int,
+    amount_decimals: int,
+) -> Optional[Fraction]:
+    """
+    Get the quantity that a notional takes from the best offers.
+
+    :param offers: The fixed-point offers, best first.
+    :type offers: Iterable[Dict[str, int]]
+    :param notional: The notional.
+    :type notional: Fraction
+    :param price_decimals: The number of decimals of the offer prices.
+    :type price_decimals: int
+    :param amount_decimals: The number of decimals of the offer amounts.
+    :type amount_decimals: int
+    :return: The exact quantity, None if the offers are too thin.
+    :rtype: Optional[Fraction]
+    """
+    quantity = Fraction(0)
+    notional_left = notional
+    for offer in offers:
+        if notional_left <= 0:
+            break
+        price = Fraction(offer["price"], 10**price_decimals)
+        amount = Fraction(offer["amount"], 10**amount_decimals)
+        if amount * price >= notional_left:
+            return quantity + notional_left / price
+        quantity += amount
+        notional_left -= amount * price
+    return quantity if notional_left <= 0 else None
+
+
+def format_fraction(value: Optional[Fraction], round_up: bool) -> Optional[str]:
+    """
+    Format an exact amount as a decimal string on the default scale.
+
+    :param value: The amount.
+    :type value: Optional[Fraction]
+    :param round_up: Whether to round up rather than down.
+    :type round_up: bool
+    :return: The decimal string, None if there is no amount.
+    :rtype: Optional[str]
+    """
+    if value is None:
+        return None
+    scaled = value * 10**DEFAULT_DECIMALS
+    fixed = -(-scaled.numerator // scaled.denominator) if round_up else int(scaled)
+    return to_decimal_string(fixed, DEFAULT_DECIMALS)
+
+
+async def get_merged_order_book(crypto: str) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Get the order book of a pair merged across the exchanges listing it.
+
+    :param crypto: The crypto (Ex: "ETH") or cross pair (Ex: "ETH/BTC").
+    :type crypto: str
+    :return: The exchange names and the merged order book.
+    :rtype: Tuple[List[str], Dict[str, Any]]
+    """
+    exchanges = await get_supported_exchanges(crypto)
+    order_books = [await get_order_book(exchange, crypto) for exchange in exchanges]
+    return [EXCHANGE_MAP[exchange] for exchange in exchanges], merge_order_books(
+        order_books
+    )
+
+
+async def get_cross_prices(base: str, quote: str, quantity: float) -> Dict[str, Any]:
+    """
+    Get the prices of a quantity of a crypto in another, through the pair
+    listed directly or synthesized from both USD books, whichever is better.
+
+    Buying the base synthetically buys it with USD and raises the USD by
+    selling the quote, and selling it sells it for USD and buys the quote
+    with the proceeds. Both routes are priced exactly from the polled books,
+    merged across the exchanges listing each pair.
+
+    :param base: The crypto priced.
+    :type base: str
+    :param quote: The crypto it is priced in.
+    :type quote: str
+    :param quantity: The quantity of the base.
+    :type quantity: float
+    :return: The best buying and selling prices in the quote with the route
+        of each, and the prices of every route, None where too thin.
+    :rtype: Dict[str, Any]
+    """
+    exact_quantity = Fraction(str(quantity))
+    pair = f"{base}/{quote}"
+    routes = {}
+
+    exchanges, book = await get_merged_order_book(pair)
+    if exchanges:
+        with span("compute"):
+            decimals = (book["price_decimals"], book["amount_decimals"])
+            routes["direct"] = {
+                "pairs": [pair],
+                "exchanges": exchanges,
+                "buying_price": fill_quantity(book["asks"], exact_quantity, *decimals),
+                "selling_price": fill_quantity(
+                    book["bids"], exact_quantity, *decimals
+                ),
+            }
+
+    base_exchanges, base_book = await get_merged_order_book(base)
+    quote_exchanges, quote_book = await get_merged_order_book(quote)
+    if base_exchanges and quote_exchanges:
+        with span("compute"):
+            base_decimals = (base_book["price_decimals"], base_book["amount_decimals"])
+            quote_decimals = (
+                quote_book["price_decimals"],
+                quote_book["amount_decimals"],
+            )
+            cost = fill_quantity(base_book["asks"], exact_quantity, *base_decimals)
+            proceeds = fill_quantity(base_book["bids"], exact_quantity, *base_decimals)
+            routes["synthetic"] = {
+                "pairs": [f"{base}/USD", f"{quote}/USD"],
+                "exchanges": sorted(set(base_exchanges) | set(quote_exchanges)),
+                "buying_price": None
+                if cost is None
+                else fill_notional(quote_book["bids"], cost, *quote_decimals),
+                "selling_price": None
+                if proceeds is None
+                else fill_notional(quote_book["asks"], proceeds, *quote_decimals),
+            }
+
+    response = {"base": base, "quote": quote, "quantity": quantity}
+    for side, pick in (("buying_price", min), ("selling_price", max)):
+        priced = [name for name, route in routes.items() if route[side] is not None]
+        best = pick(priced, key=lambda name: routes[name][side], default=None)
+        response[side] = format_fraction(
+            routes[best][side] if best else None, side == "buying_price"
+        )
+        response[side.replace("price", "route")] = best
+    response["routes"] = {
+        name: {
+            **route,
+            "buying_price": format_fraction(route["buying_price"], True),
+            "selling_price": format_fraction(route["selling_price"], False),
+        }
+        for name, route in routes.items()
+    }
+    return response
+
+
+def empty_prices_response() -> Dict[str, Dict[str, Optional[str]]]:
     """
     Create an empty prices response.
 
     :return: The empty prices response.
-    :rtype: Dict[str, Dict[str, Optional[float]]]
+    :rtype: Dict[str, Dict[str, Optional[str]]]
     """
     return {
         "coinbase": {"buying_price": None, "selling_price": None},
@@ -162,28 +842,199 @@ def empty_prices_response() -> Dict[str, Dict[str, Optional[float]]]:
     }
 
 
-async def get_sorted_exchange_prices(
-    exchange: Type[ExchangeInterface], crypto: str, is_buying_price: bool
-) -> List[Dict[str, Any]]:
+async def get_order_book(
+    exchange: Type[ExchangeInterface], crypto: str
+) -> Dict[str, Any]:
     """
-    Get sorted exchange prices for a given cryptocurrency.
+    Get the freshest polled order book of a given cryptocurrency.
+
+    The book is only fetched on the request path when the polling scheduler
+    has no recent enough snapshot of it, and the request counts towards the
+    demand that decides how often it is polled. When the exchange is
+    saturated past the request's deadline, an older snapshot is used.
 
     :param exchange: The exchange.
     :type exchange: Type[ExchangeInterface]
     :param crypto: The cryptocurrency.
     :type crypto: str
-    :param is_buying_price: Indicates whether it's a buying price or not.
-    :type is_buying_price: bool
-    :return: The sorted exchange prices.
-    :rtype: List[Dict[str, Any]]
+    :return: The sorted order book with its price and amount decimals.
+    :rtype: Dict[str, Any]
+    """
+    exchange_name = EXCHANGE_MAP[exchange]
+    scheduler.record_demand(exchange_name, crypto, "book")
+    snapshot = scheduler.get_snapshot(exchange_name, crypto, "book", SNAPSHOT_MAX_AGE)
+    if snapshot is None:
+        try:
+            async with controller.exchange_slot(exchange_name):
+                snapshot = await scheduler.fetch(exchange_name, crypto, "book")
+        except OverloadError:
+            # Quote from an older book rather than failing while the exchange
+            # is saturated.
+            snapshot = scheduler.get_snapshot(exchange_name, crypto, "book")
+            if snapshot is None:
+                raise
+    return snapshot["data"]
+
+
+async def get_book_versions(crypto: str) -> Tuple[Tuple[str, int], ...]:
+    """
+    Bring the books of a cryptocurrency up to date and get their versions, the
+    sequence numbers of the snapshots they were last brought in line with.
+
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :return: The (exchange name, version) pairs.
+    :rtype: Tuple[Tuple[str, int], ...]
+    """
+    for exchange in await get_supported_exchanges(crypto):
+        await get_order_book(exchange, crypto)
+    # Read together once every book is refreshed, so a book updated while
+    # another was fetched is not reported at its earlier version.
+    return read_book_versions(crypto)
+
+
+def read_book_versions(crypto: str) -> Tuple[Tuple[str, Optional[int]], ...]:
+    """
+    Get the current versions of the books of a cryptocurrency, without
+    refreshing them.
+
+    Routes compare them with the versions their entity tag was built from
+    after computing their body, as books may be refreshed in the meantime.
+
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :return: The (exchange name, version) pairs, None for books not polled yet.
+    :rtype: Tuple[Tuple[str, Optional[int]], ...]
+    """
+    versions = []
+    for exchange in registry.by_crypto.get(crypto, []):
+        exchange_name = EXCHANGE_MAP[exchange]
+        order_book = order_books.get((exchange_name, crypto))
+        versions.append(
+            (exchange_name, None if order_book is None else order_book.version)
+        )
+    return tuple(versions)
+
+
+async def get_maintained_order_book(exchange_name: str, crypto: str) -> OrderBook:
+    """
+    Get the incrementally maintained book of a cryptocurrency on an exchange,
+    brought up to date.
+
+    :param exchange_name: The exchange name.
+    :type exchange_name: str
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :return: The order book.
+    :rtype: OrderBook
+    """
+    await get_order_book(EXCHANGE_CLASSES[exchange_name], crypto)
+    return order_books[(exchange_name, crypto)]
+
+
+# Consolidated depth charts keyed by crypto, bucket size and number of
+# buckets, with the book versions they were computed from.
+depth_charts: "OrderedDict[Tuple[str, str, int], Tuple[tuple, Dict[str, Any]]]" = (
+    OrderedDict()
+)
+
+
+async def get_consolidated_depth(
+    crypto: str, bucket: str, buckets: int
+) -> Tuple[Tuple[Tuple[str, int], ...], Dict[str, Any]]:
+    """
+    Get the consolidated book of a cryptocurrency aggregated into price
+    buckets around the mid price.
+
+    Charts are computed once per version of the underlying books and shared
+    by every client asking for the same bucketing.
+
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+    :param bucket: The bucket size (Ex: "10", "0.1%").
+    :type bucket: str
+    :param buckets: The number of buckets per side.
+    :type buckets: int
+    :raises ValueError: If the bucket size is invalid.
+    :return: The versions of the books and the depth chart.
+    :rtype: Tuple[Tuple[Tuple[str, int], ...], Dict[str, Any]]
+    """
+    versions = await get_book_versions(crypto)
+    key = (crypto, bucket, buckets)
+    cached = depth_charts.get(key)
+    if cached is not None and cached[0] == versions:
+        depth_charts.move_to_end(key)
+        return cached
+    with span("compute"):
+        depth = get_bucketed_depth(
+            {
+                exchange_name: order_books[(exchange_name, crypto)]
+                for exchange_name, _ in versions
+            },
+            bucket,
+            buckets,
+        )
+    depth_charts[key] = (versions, depth)
+    depth_charts.move_to_end(key)
+    while len(depth_charts) > DEPTH_CACHE_SIZE:
+        depth_charts.popitem(last=False)
+    return versions, depth
+
+
+async def get_sorted_order_book(
+    exchange: Type[ExchangeInterface], crypto: str
+) -> Dict[str, Any]:
+    """
+    Get the order book of a given cryptocurrency with both sides sorted best first.
+
+    Venues deliver their books best level first, so sides are only sorted,
+    lazily, when that turns out not to be the case.
+
+    :param exchange: The exchange.
+    :type exchange: Type[ExchangeInterface]
+    :param crypto: The cryptocurrency.
+    :type crypto: str
+
+    :return: The sorted order book with its price and amount decimals.
+    :rtype: Dict[str, Any]
     """
-    prices = (
-        await exchange(crypto).get_bid_price()
-        if is_buying_price
-        else await exchange(crypto).get_ask_price()
+    return await registry.get_adapter(EXCHANGE_MAP[exchange], crypto).get_order_book()
+
+
+def merge_order_books(order_books: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the order books of several exchanges into a single sorted book.
+
+    Books are moved to the finest price and amount scale among them, so the
+    merge is exact. Sides are merged lazily, so walking the merged book only
+    decodes and rescales the levels it reaches, and can be read only once.
+
+    :param order_books: The order books with their price and amount decimals.
+    :type order_books: List[Dict[str, Any]]
+    :return: The merged order book.
+    :rtype: Dict[str, Any]
+    """
+    price_decimals = max(
+        (book["price_decimals"] for book in order_books), default=DEFAULT_DECIMALS
+    )
+    amount_decimals = max(
+        (book["amount_decimals"] for book in order_books), default=DEFAULT_DECIMALS
     )
-    sort_prices(prices, is_buying_price)
-    return prices
+    merged = {"price_decimals": price_decimals, "amount_decimals": amount_decimals}
+    for side, descending in (("bids", True), ("asks", False)):
+        merged[side] = heapq.merge(
+            *(
+                iter_rescaled(
+                    order_book[side],
+                    10 ** (price_decimals - order_book["price_decimals"]),
+                    10 ** (amount_decimals - order_book["amount_decimals"]),
+                )
+                for order_book in order_books
+            ),
+            key=itemgetter("price"),
+            reverse=descending,
+        )
+    return merged
 
 
 def sort_prices(prices: List[Dict[str, Any]], reverse: bool = False) -> None:
@@ -195,11 +1046,9 @@ def sort_prices(prices: List[Dict[str, Any]], reverse: bool = False) -> None:
     :param reverse: Indicates whether to sort in reverse order or not.
     :type reverse: bool, optional
     """
-    prices.sort(key=lambda x: x["price"], reverse=reverse)
+    with span("sort"):
+        prices.sort(key=lambda x: x["price"], reverse=reverse)
 
 
 async def get_balance_details(exchange):
-    for exchange_class in EXCHANGE_MAP:
-        if exchange == EXCHANGE_MAP[exchange_class]:
-            response = await exchange_class.get_balance_details()
-    return response
+    return await EXCHANGE_CLASSES[exchange].get_balance_details()
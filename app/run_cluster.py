@@ -0,0 +1,94 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from typing import Dict, List
+
+
+APP_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_node_env(port: int, nodes: List[str], stand_in: str) -> Dict[str, str]:
+    """
+    Get the environment of a node, pointed at the stand-in exchanges.
+
+    :param port: The port the node serves on.
+    :type port: int
+    :param nodes: The URLs of every node of the cluster.
+    :type nodes: List[str]
+    :param stand_in: The URL of the stand-in exchange server.
+    :type stand_in: str
+    :return: The environment.
+    :rtype: Dict[str, str]
+    """
+    paths = [os.path.dirname(APP_DIRECTORY), APP_DIRECTORY]
+    if os.environ.get("PYTHONPATH"):
+        paths.append(os.environ["PYTHONPATH"])
+    env = dict(os.environ)
+    env.update(
+        {
+            "PORT": str(port),
+            "WORKERS": "1",
+            "PYTHONPATH": os.pathsep.join(paths),
+            "CLUSTER_SELF": f"http://127.0.0.1:{port}",
+            "CLUSTER_NODES": ",".join(nodes),
+            "COINBASE_BASE_URL": f"{stand_in}/coinbase",
+            "GEMINI_BASE_URL": f"{stand_in}/gemini/v1",
+            "KRAKEN_BASE_URL": f"{stand_in}/kraken/0",
+        }
+    )
+    return env
+
+
+def main() -> None:
+    """
+    Run the stand-in exchange server and a cluster of CLUSTER_SIZE nodes
+    (default 3) as local processes, serving on PORT (default 8000) and the
+    following ports, until interrupted or the stand-in exits.
+    """
+    size = int(os.environ.get("CLUSTER_SIZE", "3"))
+    base_port = int(os.environ.get("PORT", "8000"))
+    stand_in_port = int(os.environ.get("STAND_IN_PORT", "9000"))
+    stand_in = f"http://127.0.0.1:{stand_in_port}"
+    ports = [base_port + index for index in range(size)]
+    nodes = [f"http://127.0.0.1:{port}" for port in ports]
+
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "stand_in.py"],
+            cwd=APP_DIRECTORY,
+            env=dict(os.environ, STAND_IN_PORT=str(stand_in_port)),
+        )
+    ]
+    time.sleep(1)
+    for port in ports:
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, "server.py"],
+                cwd=APP_DIRECTORY,
+                env=get_node_env(port, nodes, stand_in),
+            )
+        )
+    print(f"Stand-in exchanges at {stand_in}, nodes at {', '.join(nodes)}.")
+    try:
+        # Nodes may be stopped and restarted by hand to watch the cluster
+        # rebalance, only the stand-in going away ends the run.
+        while processes[0].poll() is None:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in reversed(processes):
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
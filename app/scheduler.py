@@ -0,0 +1,485 @@
+import asyncio
+import time
+
+from logger.app_logger import get_logger
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+logger = get_logger(__name__)
+
+
+# Public requests per second each venue tolerates before rate limiting us.
+REQUEST_BUDGETS = {"coinbase": 10.0, "gemini": 2.0, "kraken": 1.0}
+
+
+class PollingScheduler:
+    def __init__(
+        self,
+        fetchers: Dict[str, Callable[..., Awaitable[Any]]],
+        budgets: Dict[str, float],
+        base_interval: float = 30.0,
+        min_interval: float = 1.0,
+        max_interval: float = 60.0,
+        half_life: float = 60.0,
+        idle_demand: float = 0.05,
+        tick: float = 0.1,
+    ) -> None:
+        """
+        Initializes a PollingScheduler instance.
+
+        :param fetchers: Coroutine functions fetching a resource kind
+            ("book", "trades") given the exchange, crypto and limit.
+        :type fetchers: Dict[str, Callable[..., Awaitable[Any]]]
+        :param budgets: Requests per second allowed for every exchange.
+        :type budgets: Dict[str, float]
+        :param base_interval: Poll interval of a pair requested once a half-life.
+        :type base_interval: float
+        :param min_interval: Shortest poll interval of the hottest pairs.
+        :type min_interval: float
+        :param max_interval: Longest poll interval of pairs still in demand.
+        :type max_interval: float
+        :param half_life: Seconds after which the demand score halves.
+        :type half_life: float
+        :param idle_demand: Demand score below which a pair is not polled.
+        :type idle_demand: float
+        :param tick: Seconds between two scheduling rounds.
+        :type tick: float
+        """
+        self.fetchers = fetchers
+        self.budgets = budgets
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.half_life = half_life
+        self.idle_demand = idle_demand
+        self.tick = tick
+        self.entries: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.tokens = dict(budgets)
+        self.refilled_at = time.monotonic()
+        self.fetches: Dict[Tuple[str, str, str, Optional[int]], asyncio.Future] = {}
+        self.listeners: List[Callable[[str, str, str, Dict[str, Any]], None]] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def get_entry(self, exchange: str, crypto: str, kind: str) -> Dict[str, Any]:
+        """
+        Get the scheduling entry of a resource, creating it if needed.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind ("book" or "trades").
+        :type kind: str
+        :return: The scheduling entry.
+        :rtype: Dict[str, Any]
+        """
+        # Entries keep plain strings, the fetches they drive are routed on them.
+        crypto = getattr(crypto, "value", crypto)
+        key = (exchange, crypto, kind)
+        if key not in self.entries:
+            self.entries[key] = {
+                "exchange": exchange,
+                "crypto": crypto,
+                "kind": kind,
+                "limit": None,
+                "demand": 0.0,
+                "demand_at": time.monotonic(),
+                "pinned_interval": None,
+                "last_refresh": None,
+                "failures": 0,
+                "in_flight": False,
+                "snapshot": None,
+            }
+        return self.entries[key]
+
+    def get_demand(self, entry: Dict[str, Any], now: float) -> float:
+        """
+        Get the demand score of an entry decayed to the given time.
+
+        :param entry: The scheduling entry.
+        :type entry: Dict[str, Any]
+        :param now: Monotonic time.
+        :type now: float
+        :return: The decayed demand score.
+        :rtype: float
+        """
+        elapsed = now - entry["demand_at"]
+        return entry["demand"] * 0.5 ** (elapsed / self.half_life)
+
+    def record_demand(
+        self, exchange: str, crypto: str, kind: str, limit: Optional[int] = None
+    ) -> None:
+        """
+        Record that a client asked for a resource.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind ("book" or "trades").
+        :type kind: str
+        :param limit: The number of items requested, for trades.
+        :type limit: Optional[int]
+        """
+        entry = self.get_entry(exchange, crypto, kind)
+        now = time.monotonic()
+        entry["demand"] = self.get_demand(entry, now) + 1
+        entry["demand_at"] = now
+        if limit is not None:
+            entry["limit"] = max(entry["limit"] or 0, limit)
+
+    def pin(self, exchange: str, crypto: str, kind: str, interval: float) -> None:
+        """
+        Keep a resource polled at least every interval, regardless of demand.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind ("book" or "trades").
+        :type kind: str
+        :param interval: The longest poll interval in seconds.
+        :type interval: float
+        """
+        self.get_entry(exchange, crypto, kind)["pinned_interval"] = interval
+
+    def add_listener(
+        self, listener: Callable[[str, str, str, Dict[str, Any]], None]
+    ) -> None:
+        """
+        Register a callback invoked with every refreshed snapshot.
+
+        :param listener: Callback taking the exchange, crypto, kind and snapshot.
+        :type listener: Callable[[str, str, str, Dict[str, Any]], None]
+        """
+        self.listeners.append(listener)
+
+    def get_interval(self, entry: Dict[str, Any], now: float) -> Optional[float]:
+        """
+        Get the poll interval of an entry, or None if it should not be polled.
+
+        :param entry: The scheduling entry.
+        :type entry: Dict[str, Any]
+        :param now: Monotonic time.
+        :type now: float
+        :return: The poll interval in seconds.
+        :rtype: Optional[float]
+        """
+        demand = self.get_demand(entry, now)
+        interval = None
+        if demand >= self.idle_demand:
+            interval = min(
+                max(self.base_interval / demand, self.min_interval), self.max_interval
+            )
+        if entry["pinned_interval"] is not None:
+            interval = min(
+                interval or entry["pinned_interval"], entry["pinned_interval"]
+            )
+        if interval is not None and entry["failures"]:
+            interval = min(interval * 2 ** entry["failures"], self.max_interval)
+        return interval
+
+    def get_snapshot(
+        self,
+        exchange: str,
+        crypto: str,
+        kind: str,
+        max_age: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get the freshest polled snapshot of a resource.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind ("book" or "trades").
+        :type kind: str
+        :param max_age: Reject snapshots older than this many seconds.
+        :type max_age: Optional[float]
+        :param limit: Reject trade snapshots holding fewer items than this.
+        :type limit: Optional[int]
+        :return: The snapshot or None if there is no usable one.
+        :rtype: Optional[Dict[str, Any]]
+        """
+        entry = self.entries.get((exchange, crypto, kind))
+        if entry is None or entry["snapshot"] is None:
+            return None
+        snapshot = entry["snapshot"]
+        if max_age is not None and time.monotonic() - snapshot["received_at"] > max_age:
+            return None
+        if limit is not None and (snapshot["limit"] or 0) < limit:
+            return None
+        return snapshot
+
+    def store(
+        self,
+        exchange: str,
+        crypto: str,
+        kind: str,
+        data: Any,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Store a freshly fetched resource and notify the listeners.
+
+        The snapshot version only moves forward when the data changed.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind ("book" or "trades").
+        :type kind: str
+        :param data: The fetched resource.
+        :type data: Any
+        :param limit: The number of items requested, for trades.
+        :type limit: Optional[int]
+        :return: The stored snapshot.
+        :rtype: Dict[str, Any]
+        """
+        entry = self.get_entry(exchange, crypto, kind)
+        previous = entry["snapshot"]
+        version = previous["version"] if previous else 0
+        if previous is None or previous["data"] != data:
+            version += 1
+        snapshot = {
+            "data": data,
+            "limit": limit,
+            "version": version,
+            "refreshed_at": time.time(),
+            "received_at": time.monotonic(),
+        }
+        entry["snapshot"] = snapshot
+        entry["last_refresh"] = snapshot["received_at"]
+        entry["failures"] = 0
+        for listener in self.listeners:
+            try:
+                listener(exchange, crypto, kind, snapshot)
+            except Exception:
+                logger.exception("Scheduler listener failed.")
+        return snapshot
+
+    async def fetch(
+        self,
+        exchange: str,
+        crypto: str,
+        kind: str,
+        limit: Optional[int] = None,
+        charge: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Fetch a resource right away and store it as the latest snapshot.
+
+        Concurrent fetches of the same resource share a single upstream
+        fetch. Starting one spends a request token of the exchange, running
+        into debt rather than waiting, so the polling of the exchange is held
+        back until the budget is repaid.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind ("book" or "trades").
+        :type kind: str
+        :param limit: The number of items requested, for trades.
+        :type limit: Optional[int]
+        :param charge: Whether to spend a token when starting a fetch, refreshes
+            being charged when they are scheduled.
+        :type charge: bool
+        :return: The stored snapshot.
+        :rtype: Dict[str, Any]
+        """
+        key = (exchange, crypto, kind, limit)
+        future = self.fetches.get(key)
+        if future is None:
+            if charge and exchange in self.tokens:
+                self.refill(time.monotonic())
+                self.tokens[exchange] -= 1
+            future = asyncio.ensure_future(
+                self.fetch_and_store(exchange, crypto, kind, limit)
+            )
+            self.fetches[key] = future
+
+            def forget(done: asyncio.Future) -> None:
+                self.fetches.pop(key, None)
+                # Marks a failure as retrieved when every caller gave up.
+                if not done.cancelled():
+                    done.exception()
+
+            future.add_done_callback(forget)
+        # A caller giving up must not cancel the fetch the others wait for.
+        return await asyncio.shield(future)
+
+    async def fetch_and_store(
+        self, exchange: str, crypto: str, kind: str, limit: Optional[int]
+    ) -> Dict[str, Any]:
+        """
+        Fetch a resource from upstream and store it as the latest snapshot.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        :param crypto: The cryptocurrency.
+        :type crypto: str
+        :param kind: The resource kind ("book" or "trades").
+        :type kind: str
+        :param limit: The number of items requested, for trades.
+        :type limit: Optional[int]
+        :return: The stored snapshot.
+        :rtype: Dict[str, Any]
+        """
+        data = await self.fetchers[kind](exchange, crypto, limit)
+        return self.store(exchange, crypto, kind, data, limit)
+
+    async def refresh(self, entry: Dict[str, Any]) -> None:
+        """
+        Refresh an entry in the background.
+
+        :param entry: The scheduling entry.
+        :type entry: Dict[str, Any]
+        """
+        entry["in_flight"] = True
+        try:
+            await self.fetch(
+                entry["exchange"],
+                entry["crypto"],
+                entry["kind"],
+                entry["limit"],
+                charge=False,
+            )
+        except Exception as e:
+            entry["failures"] += 1
+            entry["last_refresh"] = time.monotonic()
+            logger.warning(
+                "Failed to refresh %s of %s on %s: %s",
+                entry["kind"],
+                entry["crypto"],
+                entry["exchange"],
+                e,
+            )
+        finally:
+            entry["in_flight"] = False
+
+    def refill(self, now: float) -> None:
+        """
+        Add the request tokens earned by every exchange since the last refill,
+        up to one second of its budget.
+
+        :param now: Monotonic time.
+        :type now: float
+        """
+        elapsed = max(now - self.refilled_at, 0)
+        self.refilled_at = now
+        for exchange, budget in self.budgets.items():
+            self.tokens[exchange] = min(
+                self.tokens[exchange] + elapsed * budget, budget
+            )
+
+    async def acquire(self, exchange: str) -> None:
+        """
+        Wait for a request token of an exchange and spend it, so requests
+        fanned out by a single fetch stay within the exchange's budget.
+
+        :param exchange: The exchange.
+        :type exchange: str
+        """
+        budget = self.budgets.get(exchange)
+        if not budget:
+            return
+        while True:
+            self.refill(time.monotonic())
+            if self.tokens[exchange] >= 1:
+                self.tokens[exchange] -= 1
+                return
+            await asyncio.sleep((1 - self.tokens[exchange]) / budget)
+
+    def schedule(self, now: float) -> List[Dict[str, Any]]:
+        """
+        Pick the entries due for a refresh within each exchange's budget.
+
+        :param now: Monotonic time.
+        :type now: float
+        :return: The entries to refresh, hottest first.
+        :rtype: List[Dict[str, Any]]
+        """
+        self.refill(now)
+        due = []
+        for entry in self.entries.values():
+            key = (entry["exchange"], entry["crypto"], entry["kind"], entry["limit"])
+            # Entries already being fetched by a request are left to it.
+            if entry["in_flight"] or key in self.fetches:
+                continue
+            interval = self.get_interval(entry, now)
+            if interval is None:
+                continue
+            if entry["last_refresh"] is None or now - entry["last_refresh"] >= interval:
+                due.append((self.get_demand(entry, now), entry))
+        due.sort(key=lambda x: x[0], reverse=True)
+
+        selected = []
+        for _, entry in due:
+            exchange = entry["exchange"]
+            if self.tokens.get(exchange, 0) >= 1:
+                self.tokens[exchange] -= 1
+                selected.append(entry)
+        return selected
+
+    async def run(self) -> None:
+        """
+        Refresh due entries forever.
+        """
+        while True:
+            for entry in self.schedule(time.monotonic()):
+                asyncio.create_task(self.refresh(entry))
+            await asyncio.sleep(self.tick)
+
+    def start(self) -> None:
+        """
+        Start polling in the background.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background polling.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def get_state(self) -> List[Dict[str, Any]]:
+        """
+        Get the scheduling state of every entry.
+
+        :return: The interval, last refresh and demand score of every entry.
+        :rtype: List[Dict[str, Any]]
+        """
+        now = time.monotonic()
+        state = []
+        for entry in self.entries.values():
+            snapshot = entry["snapshot"]
+            state.append(
+                {
+                    "exchange": entry["exchange"],
+                    "crypto": entry["crypto"],
+                    "kind": entry["kind"],
+                    "limit": entry["limit"],
+                    "demand": self.get_demand(entry, now),
+                    "interval": self.get_interval(entry, now),
+                    "pinned_interval": entry["pinned_interval"],
+                    "seconds_since_refresh": (
+                        now - entry["last_refresh"] if entry["last_refresh"] else None
+                    ),
+                    "last_refreshed_at": snapshot["refreshed_at"] if snapshot else None,
+                    "version": snapshot["version"] if snapshot else None,
+                    "failures": entry["failures"],
+                }
+            )
+        state.sort(key=lambda x: x["demand"], reverse=True)
+        return state
@@ -0,0 +1,48 @@
+import importlib.util
+import os
+import time
+
+import uvicorn
+
+
+def get_config() -> dict:
+    """
+    Get the uvicorn settings from the environment.
+
+    uvloop and httptools are used when they are installed, falling back to
+    the pure Python event loop and HTTP parser otherwise.
+
+    :return: The keyword arguments of uvicorn.run.
+    :rtype: dict
+    """
+    limit_concurrency = os.environ.get("LIMIT_CONCURRENCY")
+    return {
+        "host": os.environ.get("HOST", "127.0.0.1"),
+        "port": int(os.environ.get("PORT", "8000")),
+        "workers": int(os.environ.get("WORKERS", "1")),
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+        "backlog": int(os.environ.get("BACKLOG", "2048")),
+        "timeout_keep_alive": int(os.environ.get("KEEP_ALIVE_TIMEOUT", "5")),
+        "limit_concurrency": int(limit_concurrency) if limit_concurrency else None,
+        "timeout_graceful_shutdown": int(
+            os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", "30")
+        ),
+        "lifespan": "on",
+        "access_log": os.environ.get("ACCESS_LOG", "0") == "1",
+    }
+
+
+def main() -> None:
+    """
+    Serve the app.
+
+    Workers are separate processes, each running the startup hook that
+    preloads the asset maps, the upstream session and the offload pool.
+    """
+    os.environ["SERVER_LAUNCHED_AT"] = str(time.time())
+    uvicorn.run("main:app", **get_config())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import os
+import random
+import time
+from decimal import Decimal
+
+import uvicorn
+from fastapi import APIRouter, FastAPI, HTTPException
+
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Reference prices the markets start from, quoted in USD unless the pair is
+# a cross, with the price tick of each market.
+MARKETS: Dict[Tuple[str, str], Tuple[float, str]] = {
+    ("BTC", "USD"): (30000, "0.01"),
+    ("ETH", "USD"): (2000, "0.01"),
+    ("SOL", "USD"): (20, "0.001"),
+    ("XRP", "USD"): (0.5, "0.00001"),
+    ("LRC", "USD"): (0.2, "0.00001"),
+    ("ETH", "BTC"): (0.0666, "0.00001"),
+}
+
+# Kraken names BTC "XBT" and keys its oldest markets by their legacy names.
+KRAKEN_PAIRS = {
+    ("BTC", "USD"): "XXBTZUSD",
+    ("ETH", "USD"): "XETHZUSD",
+    ("ETH", "BTC"): "XETHXXBT",
+}
+
+# Levels per side of the books.
+BOOK_DEPTH = int(os.environ.get("STAND_IN_BOOK_DEPTH", "50"))
+
+# Seconds between two steps of the prices' random walk.
+TICK = float(os.environ.get("STAND_IN_TICK", "1"))
+
+
+class Market:
+    def __init__(self, base: str, quote: str, price: float, tick: str) -> None:
+        """
+        Initializes a Market instance, a pair whose price follows a random
+        walk and trades once per second.
+
+        :param base: The base currency.
+        :type base: str
+        :param quote: The quote currency.
+        :type quote: str
+        :param price: The starting price.
+        :type price: float
+        :param tick: The price tick.
+        :type tick: str
+        """
+        self.base = base
+        self.quote = quote
+        self.price = price
+        self.tick = Decimal(tick)
+        self.stepped_at = time.monotonic()
+
+    def get_mid(self) -> float:
+        """
+        Get the mid price, walking it one step per elapsed tick.
+
+        :return: The mid price.
+        :rtype: float
+        """
+        steps = int((time.monotonic() - self.stepped_at) / TICK)
+        if steps:
+            self.stepped_at += steps * TICK
+            for _ in range(min(steps, 100)):
+                self.price *= 1 + random.gauss(0, 0.0005)
+        return self.price
+
+    def format_price(self, price: float) -> str:
+        """
+        Round a price to the tick.
+
+        :param price: The price.
+        :type price: float
+        :return: The price as a decimal string.
+        :rtype: str
+        """
+        return str(Decimal(price).quantize(self.tick))
+
+    def get_levels(self, side: str) -> List[Tuple[str, str]]:
+        """
+        Get one side of the book, best level first.
+
+        :param side: "bids" or "asks".
+        :type side: str
+        :return: The [price, amount] levels as decimal strings.
+        :rtype: List[Tuple[str, str]]
+        """
+        mid = self.get_mid()
+        spacing = max(mid * 0.0002, float(self.tick))
+        sign = -1 if side == "bids" else 1
+        return [
+            (
+                self.format_price(mid + sign * spacing * (index + 1)),
+                f"{random.uniform(0.1, 2):.8f}",
+            )
+            for index in range(BOOK_DEPTH)
+        ]
+
+    def get_trades(self, limit: int, before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get the trades of the last seconds, one per second, newest first.
+
+        :param limit: The number of trades.
+        :type limit: int
+        :param before: Only return trades older than this second.
+        :type before: Optional[int]
+        :return: The trades with their second, price, amount and side.
+        :rtype: List[Dict[str, Any]]
+        """
+        newest = int(time.time()) if before is None else before - 1
+        mid = self.get_mid()
+        return [
+            {
+                "second": second,
+                "price": self.format_price(mid),
+                "amount": "0.25",
+                "side": "buy" if second % 2 else "sell",
+            }
+            for second in range(newest, newest - limit, -1)
+        ]
+
+
+markets = {pair: Market(*pair, *spec) for pair, spec in MARKETS.items()}
+
+
+def get_market(base: str, quote: str) -> Market:
+    """
+    Get a market, as venues answer unknown pairs.
+
+    :param base: The base currency.
+    :type base: str
+    :param quote: The quote currency.
+    :type quote: str
+    :raises HTTPException: If the pair is not listed.
+    :return: The market.
+    :rtype: Market
+    """
+    market = markets.get((base.upper(), quote.upper()))
+    if market is None:
+        raise HTTPException(status_code=404, detail="NotFound")
+    return market
+
+
+coinbase = APIRouter(prefix="/coinbase")
+
+
+def get_coinbase_market(product_id: str) -> Market:
+    base, _, quote = product_id.partition("-")
+    return get_market(base, quote)
+
+
+@coinbase.get("/products")
+async def get_coinbase_products() -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"{market.base}-{market.quote}",
+            "base_currency": market.base,
+            "quote_currency": market.quote,
+            "quote_increment": str(market.tick),
+            "base_increment": "0.00000001",
+        }
+        for market in markets.values()
+    ]
+
+
+@coinbase.get("/products/{product_id}/book")
+async def get_coinbase_book(product_id: str, level: int = 2) -> Dict[str, Any]:
+    market = get_coinbase_market(product_id)
+    return {
+        "bids": [[price, amount, 1] for price, amount in market.get_levels("bids")],
+        "asks": [[price, amount, 1] for price, amount in market.get_levels("asks")],
+    }
+
+
+@coinbase.get("/products/{product_id}/ticker")
+async def get_coinbase_ticker(product_id: str) -> Dict[str, Any]:
+    market = get_coinbase_market(product_id)
+    return {
+        "bid": market.get_levels("bids")[0][0],
+        "ask": market.get_levels("asks")[0][0],
+        "price": market.format_price(market.get_mid()),
+    }
+
+
+@coinbase.get("/products/{product_id}/trades")
+async def get_coinbase_trades(
+    product_id: str, limit: int = 100, after: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    market = get_coinbase_market(product_id)
+    return [
+        {
+            "trade_id": trade["second"],
+            "side": trade["side"],
+            "size": trade["amount"],
+            "price": trade["price"],
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(trade["second"])),
+        }
+        for trade in market.get_trades(min(limit, 1000), after)
+    ]
+
+
+gemini = APIRouter(prefix="/gemini/v1")
+
+
+def get_gemini_market(symbol: str) -> Market:
+    symbol = symbol.upper()
+    for base, quote in markets:
+        if symbol == base + quote:
+            return markets[(base, quote)]
+    raise HTTPException(status_code=404, detail="InvalidSymbol")
+
+
+@gemini.get("/symbols")
+async def get_gemini_symbols() -> List[str]:
+    return [(base + quote).lower() for base, quote in markets]
+
+
+@gemini.get("/symbols/details/{symbol}")
+async def get_gemini_symbol_details(symbol: str) -> Dict[str, Any]:
+    market = get_gemini_market(symbol)
+    return {
+        "symbol": symbol.upper(),
+        "tick_size": 1e-08,
+        "quote_increment": float(market.tick),
+    }
+
+
+@gemini.get("/pricefeed")
+async def get_gemini_pricefeed() -> List[Dict[str, Any]]:
+    return [
+        {
+            "pair": market.base + market.quote,
+            "price": market.format_price(market.get_mid()),
+            "percentChange24h": "0.0000",
+        }
+        for market in markets.values()
+    ]
+
+
+@gemini.get("/book/{symbol}")
+async def get_gemini_book(symbol: str) -> Dict[str, Any]:
+    market = get_gemini_market(symbol)
+    return {
+        side: [
+            {"price": price, "amount": amount, "timestamp": str(int(time.time()))}
+            for price, amount in market.get_levels(side)
+        ]
+        for side in ("bids", "asks")
+    }
+
+
+@gemini.get("/trades/{symbol}")
+async def get_gemini_trades(symbol: str, limit_trades: int = 50) -> List[Dict[str, Any]]:
+    market = get_gemini_market(symbol)
+    return [
+        {
+            "tid": trade["second"],
+            "timestamp": trade["second"],
+            "timestampms": trade["second"] * 1000,
+            "type": trade["side"],
+            "amount": trade["amount"],
+            "price": trade["price"],
+        }
+        for trade in market.get_trades(min(limit_trades, 500))
+    ]
+
+
+kraken = APIRouter(prefix="/kraken/0")
+
+
+def get_kraken_pair(base: str, quote: str) -> str:
+    return KRAKEN_PAIRS.get((base, quote), base + quote)
+
+
+def get_kraken_market(pair: str) -> Market:
+    for (base, quote), market in markets.items():
+        if pair in (get_kraken_pair(base, quote), base + quote):
+            return market
+    raise HTTPException(status_code=404, detail="EQuery:Unknown asset pair")
+
+
+def get_kraken_name(currency: str) -> str:
+    return "XBT" if currency == "BTC" else currency
+
+
+@kraken.get("/public/AssetPairs")
+async def get_kraken_asset_pairs() -> Dict[str, Any]:
+    result = {}
+    for (base, quote), market in markets.items():
+        base_name, quote_name = get_kraken_name(base), get_kraken_name(quote)
+        result[get_kraken_pair(base, quote)] = {
+            "altname": base_name + quote_name,
+            "wsname": f"{base_name}/{quote_name}",
+            "pair_decimals": -market.tick.as_tuple().exponent,
+            "lot_decimals": 8,
+        }
+    return {"error": [], "result": result}
+
+
+@kraken.get("/public/Ticker")
+async def get_kraken_ticker(pair: Optional[str] = None) -> Dict[str, Any]:
+    pairs = {get_kraken_pair(*key): market for key, market in markets.items()}
+    if pair is not None:
+        pairs = {name: pairs[name] for name in pair.split(",") if name in pairs}
+    result = {}
+    for name, market in pairs.items():
+        bid = market.get_levels("bids")[0][0]
+        ask = market.get_levels("asks")[0][0]
+        result[name] = {
+            "a": [ask, "1", "1.000"],
+            "b": [bid, "1", "1.000"],
+            "c": [market.format_price(market.get_mid()), "0.25"],
+        }
+    return {"error": [], "result": result}
+
+
+@kraken.get("/public/Depth")
+async def get_kraken_depth(pair: str, count: int = 100) -> Dict[str, Any]:
+    market = get_kraken_market(pair)
+    now = int(time.time())
+    return {
+        "error": [],
+        "result": {
+            pair: {
+                side: [[price, amount, now] for price, amount in market.get_levels(side)]
+                for side in ("bids", "asks")
+            }
+        },
+    }
+
+
+@kraken.get("/public/Trades")
+async def get_kraken_trades(
+    pair: str, count: int = 1000, since: Optional[int] = None
+) -> Dict[str, Any]:
+    market = get_kraken_market(pair)
+    count = min(count, 1000)
+    if since is None:
+        trades = market.get_trades(count)[::-1]
+    else:
+        # Kraken pages forward in time from a nanosecond timestamp.
+        start = since // 10**9 + 1
+        end = min(start + count, int(time.time()) + 1)
+        trades = market.get_trades(max(end - start, 0), end)[::-1]
+    entries = [
+        [
+            trade["price"],
+            trade["amount"],
+            float(trade["second"]),
+            "b" if trade["side"] == "buy" else "s",
+            "l",
+            "",
+            trade["second"],
+        ]
+        for trade in trades
+    ]
+    last = str(trades[-1]["second"] * 10**9) if trades else str(since or 0)
+    return {"error": [], "result": {pair: entries, "last": last}}
+
+
+app = FastAPI()
+app.include_router(coinbase)
+app.include_router(gemini)
+app.include_router(kraken)
+
+
+def main() -> None:
+    """
+    Serve the stand-in exchanges on STAND_IN_PORT (default 9000), under
+    /coinbase, /gemini/v1 and /kraken/0.
+    """
+    uvicorn.run(
+        app,
+        host=os.environ.get("HOST", "127.0.0.1"),
+        port=int(os.environ.get("STAND_IN_PORT", "9000")),
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
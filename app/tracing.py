@@ -0,0 +1,204 @@
+import os
+import secrets
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1") == "1"
+TRACE_EXPORT_ENABLED = os.environ.get("TRACE_EXPORT_ENABLED", "0") == "1"
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "crypto-price-track")
+
+# Shared no-op context manager handed out when no trace is recording.
+NO_SPAN = nullcontext()
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "start", "start_ns", "end", "spans")
+
+    def __init__(self, name: str) -> None:
+        """
+        Initializes a Trace instance.
+
+        :param name: The name of the traced operation (Ex: "GET /prices/{crypto}").
+        :type name: str
+        """
+        self.trace_id = secrets.token_hex(16)
+        self.name = name
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.end: Optional[float] = None
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def finish(self) -> None:
+        """
+        Mark the traced operation as done.
+        """
+        self.end = time.perf_counter()
+
+    def get_durations(self) -> Dict[str, float]:
+        """
+        Get the time spent in every stage, in milliseconds.
+
+        Concurrent spans of the same stage are added up.
+
+        :return: The duration of every stage.
+        :rtype: Dict[str, float]
+        """
+        durations = {}
+        for name, start, end in self.spans:
+            durations[name] = durations.get(name, 0.0) + (end - start) * 1000
+        return durations
+
+    def get_server_timing(self) -> str:
+        """
+        Get the stage durations as a Server-Timing header value.
+
+        :return: The header value.
+        :rtype: str
+        """
+        metrics = [
+            f"{name};dur={duration:.3f}"
+            for name, duration in self.get_durations().items()
+        ]
+        if self.end is not None:
+            metrics.append(f"total;dur={(self.end - self.start) * 1000:.3f}")
+        return ", ".join(metrics)
+
+    def to_otlp_spans(self) -> List[Dict[str, Any]]:
+        """
+        Convert the trace to OpenTelemetry (OTLP JSON) spans.
+
+        :return: The root span followed by one child span per stage.
+        :rtype: List[Dict[str, Any]]
+        """
+        root_id = secrets.token_hex(8)
+        end = self.end if self.end is not None else time.perf_counter()
+
+        def to_ns(timestamp: float) -> str:
+            return str(self.start_ns + int((timestamp - self.start) * 1e9))
+
+        spans = [
+            {
+                "traceId": self.trace_id,
+                "spanId": root_id,
+                "name": self.name,
+                "kind": 2,
+                "startTimeUnixNano": to_ns(self.start),
+                "endTimeUnixNano": to_ns(end),
+            }
+        ]
+        for name, start, stop in self.spans:
+            spans.append(
+                {
+                    "traceId": self.trace_id,
+                    "spanId": secrets.token_hex(8),
+                    "parentSpanId": root_id,
+                    "name": name,
+                    "kind": 1,
+                    "startTimeUnixNano": to_ns(start),
+                    "endTimeUnixNano": to_ns(stop),
+                }
+            )
+        return spans
+
+
+class Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str) -> None:
+        """
+        Initializes a Span instance.
+
+        :param trace: The trace the span belongs to.
+        :type trace: Trace
+        :param name: The stage name (Ex: "upstream").
+        :type name: str
+        """
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.trace.spans.append((self.name, self.start, time.perf_counter()))
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+exported_traces: Deque[Trace] = deque(
+    maxlen=int(os.environ.get("TRACE_BUFFER_SIZE", "1000"))
+)
+
+
+def span(name: str) -> Any:
+    """
+    Time a stage of the current request.
+
+    Outside of a traced request this returns a shared no-op context manager,
+    so instrumented code pays a single context variable lookup.
+
+    :param name: The stage name (Ex: "upstream", "json", "parse").
+    :type name: str
+    :return: The span context manager.
+    :rtype: Any
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return NO_SPAN
+    return Span(trace, name)
+
+
+def start_trace(name: str) -> Trace:
+    """
+    Start recording the spans of the current request.
+
+    :param name: The name of the traced operation.
+    :type name: str
+    :return: The trace.
+    :rtype: Trace
+    """
+    trace = Trace(name)
+    current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: Trace) -> None:
+    """
+    Finish a trace and keep it for export when exporting is enabled.
+
+    :param trace: The trace.
+    :type trace: Trace
+    """
+    trace.finish()
+    current_trace.set(None)
+    if TRACE_EXPORT_ENABLED:
+        exported_traces.append(trace)
+
+
+def get_otlp_export() -> Dict[str, Any]:
+    """
+    Get the buffered traces as an OTLP JSON export request.
+
+    :return: The export request, ready to be posted to an OTLP/HTTP collector.
+    :rtype: Dict[str, Any]
+    """
+    spans = []
+    for trace in list(exported_traces):
+        spans.extend(trace.to_otlp_spans())
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+            }
+        ]
+    }
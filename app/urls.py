@@ -1,22 +1,35 @@
-# Base URLs
-COINBASE_BASE_URL = "https://api.pro.coinbase.com"
-GEMINI_BASE_URL = "https://api.gemini.com/v1"
-KRAKEN_BASE_URL = "https://api.kraken.com/0"
+import os
+
+
+# Base URLs, overridden to point the adapters at a stand-in exchange server
+COINBASE_BASE_URL = os.environ.get("COINBASE_BASE_URL", "https://api.pro.coinbase.com")
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL", "https://api.gemini.com/v1")
+KRAKEN_BASE_URL = os.environ.get("KRAKEN_BASE_URL", "https://api.kraken.com/0")
 
 # URLs to get supported assets
 COINBASE_ASSETS_URL = COINBASE_BASE_URL + "/products"
 GEMINI_ASSETS_URL = GEMINI_BASE_URL + "/symbols"
 KRAKEN_ASSETS_URL = KRAKEN_BASE_URL + "/public/AssetPairs"
 
+# URLs to get the price tick and lot size of supported assets
+GEMINI_SYMBOL_DETAILS_URL = GEMINI_BASE_URL + "/symbols/details/{}"
+
 # URLs to get price of supported assets
 COINBASE_PRICE_URL = COINBASE_ASSETS_URL + "/{}/book?level=2"
 GEMINI_PRICE_URL = GEMINI_BASE_URL + "/book/{}"
 KRAKEN_PRICE_URL = KRAKEN_BASE_URL + "/public/Depth?pair={}"
 
+# URLs to get the top of book of many assets at once
+COINBASE_TICKER_URL = COINBASE_ASSETS_URL + "/{}/ticker"
+GEMINI_PRICEFEED_URL = GEMINI_BASE_URL + "/pricefeed"
+KRAKEN_TICKER_URL = KRAKEN_BASE_URL + "/public/Ticker"
+
 # URLs to get recent trades
 COINBASE_TRADES_URL = COINBASE_ASSETS_URL + "/{}/trades?limit={}"
 GEMINI_TRADES_URL = GEMINI_BASE_URL + "/trades/{}?limit_trades={}"
 KRAKEN_TRADES_URL = KRAKEN_BASE_URL + "/public/Trades?pair={}&count={}"
+COINBASE_TRADES_AFTER_URL = COINBASE_TRADES_URL + "&after={}"
+KRAKEN_TRADES_SINCE_URL = KRAKEN_TRADES_URL + "&since={}"
 
 # URLs to get balance details
 COINBASE_BALANCES_URL = COINBASE_BASE_URL + "/accounts"
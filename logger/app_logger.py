@@ -1,13 +1,176 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
 
-# Set the log level
-logging.basicConfig(level=logging.INFO)
+from typing import Dict, Optional, Tuple
+
+
+# Attributes every LogRecord carries, anything else was passed through extra.
+RESERVED_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Format a record as a single line JSON object.
+
+        :param record: The log record.
+        :type record: logging.LogRecord
+        :return: The JSON line.
+        :rtype: str
+        """
+        entry = {
+            "timestamp": self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst: int, window: float) -> None:
+        """
+        Initializes a RateLimitFilter instance.
+
+        :param burst: Number of identical records let through per window.
+        :type burst: int
+        :param window: Length of the window in seconds.
+        :type window: float
+        """
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.lock = threading.Lock()
+        self.windows: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Let through the first warnings and errors of every window for a given
+        message and drop the rest, reporting how many were dropped on the next
+        one. Records below WARNING are never sampled.
+
+        :param record: The log record.
+        :type record: logging.LogRecord
+        :return: Whether the record should be logged.
+        :rtype: bool
+        """
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = record.created
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.window:
+                suppressed = window[2] if window else 0
+                self.windows[key] = [now, 1, 0]
+                if len(self.windows) > 10000:
+                    self.windows = {key: self.windows[key]}
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Enqueue records untouched so formatting happens on the listener thread.
+
+        :param record: The log record.
+        :type record: logging.LogRecord
+        :return: The log record.
+        :rtype: logging.LogRecord
+        """
+        return record
 
-# Create a logger instance
-logger = logging.getLogger()
 
-# Set the log format
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-handler = logging.StreamHandler()
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+def parse_levels(levels: str) -> Dict[str, str]:
+    """
+    Parse per-module log levels (Ex: "exchanges=WARNING,scheduler=DEBUG").
+
+    :param levels: The comma separated module=level pairs.
+    :type levels: str
+    :return: The level of every module.
+    :rtype: Dict[str, str]
+    """
+    parsed = {}
+    for entry in levels.split(","):
+        if "=" in entry:
+            name, level = entry.split("=", 1)
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """
+    Route every log record through a queue to a background thread that formats
+    and writes it, so logging never blocks the event loop on I/O.
+
+    :return: The listener writing the records.
+    :rtype: logging.handlers.QueueListener
+    """
+    if os.environ.get("LOG_FORMAT", "json") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    burst, _, window = os.environ.get("LOG_RATE_LIMIT", "5/60").partition("/")
+    queue_handler.addFilter(RateLimitFilter(int(burst), float(window or 60)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    for name, level in parse_levels(os.environ.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def get_logger(name: Optional[str] = None) -> logging.Logger:
+    """
+    Get a module logger, whose level can be set through LOG_LEVELS.
+
+    :param name: The module name, defaults to the root logger.
+    :type name: Optional[str]
+    :return: The logger.
+    :rtype: logging.Logger
+    """
+    return logging.getLogger(name)
+
+
+listener = configure_logging()
+
+# Create a logger instance
+logger = get_logger()
@@ -1,5 +1,9 @@
+from decimal import Decimal
 from enum import Enum
 
+from pydantic import BaseModel
+from typing import Optional
+
 
 class Crypto(str, Enum):
     BTC = "BTC"
@@ -18,3 +22,38 @@ class Exchange(str, Enum):
     coinbase = "coinbase"
     kraken = "kraken"
     gemini = "gemini"
+
+
+class AlertMetric(str, Enum):
+    buy_price = "buy_price"
+    sell_price = "sell_price"
+    spread = "spread"
+
+
+class AlertDirection(str, Enum):
+    above = "above"
+    below = "below"
+
+
+class AlertRequest(BaseModel):
+    crypto: Crypto
+    metric: AlertMetric
+    quantity: float
+    threshold: Decimal
+    direction: AlertDirection
+    exchange: Optional[Exchange] = None
+    other_exchange: Optional[Exchange] = None
+    webhook: Optional[str] = None
+
+    class Config:
+        use_enum_values = True
+
+
+class SnapshotKind(str, Enum):
+    book = "book"
+    trades = "trades"
+    tickers = "tickers"
+
+
+class ClusterNode(BaseModel):
+    node: str
@@ -0,0 +1,10 @@
+import os
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app modules import each other from the app directory, and the logger
+# and models packages from the repository root.
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+os.environ.setdefault("OFFLOAD_MODE", "off")
@@ -0,0 +1,79 @@
+import random
+from decimal import Decimal
+
+import alerts
+from alerts import AlertEngine
+from exchanges.order_book import OrderBook
+from routers.utils import compute_total_price, compute_total_prices
+
+
+def get_offers(rng, count, descending):
+    prices = sorted(rng.sample(range(1, 10**6), count), reverse=descending)
+    return [{"price": price, "amount": rng.randint(1, 10**8)} for price in prices]
+
+
+def test_total_prices_match_one_walk_per_quantity():
+    rng = random.Random(35)
+    for descending in (False, True):
+        offers = get_offers(rng, 200, descending)
+        available = sum(offer["amount"] for offer in offers)
+        quantities = [
+            rng.randint(0, available * 6 // 5) / 10**8 for _ in range(50)
+        ]
+        quantities += [0, available / 10**8, available / 10**7, quantities[0]]
+
+        assert compute_total_prices(offers, quantities, 2, 8) == [
+            compute_total_price(offers, quantity, 2, 8) for quantity in quantities
+        ]
+
+
+def test_total_prices_of_an_empty_side_are_zero():
+    assert compute_total_prices([], [1, 2], 2, 8) == ["0", "0"]
+
+
+def make_book(mid):
+    order_book = OrderBook(2, 8)
+    order_book.apply_snapshot(
+        {
+            "price_decimals": 2,
+            "amount_decimals": 8,
+            "bids": [
+                {"price": mid - step * 100, "amount": 10**8} for step in range(1, 6)
+            ],
+            "asks": [
+                {"price": mid + step * 100, "amount": 10**8} for step in range(1, 6)
+            ],
+        }
+    )
+    return order_book
+
+
+def test_values_of_every_quantity_are_computed_from_one_fill(monkeypatch):
+    monkeypatch.setattr(
+        alerts,
+        "order_books",
+        {
+            ("coinbase", "BTC"): make_book(3000000),
+            ("kraken", "BTC"): make_book(3010000),
+        },
+    )
+    engine = AlertEngine()
+    keys = [
+        ("BTC", quantity, metric, "coinbase", None)
+        for quantity in (0.5, 1, 2.5, 10)
+        for metric in ("buy_price", "sell_price")
+    ] + [("BTC", 1, "spread", "kraken", "coinbase")]
+
+    total_prices = engine.get_total_prices("BTC", engine.get_quantities(keys))
+
+    assert {key[1:] for key in total_prices} == {
+        (side, quantity)
+        for side in ("asks", "bids")
+        for quantity in (0.5, 1, 2.5, 10)
+    } | {("asks", 1), ("bids", 1)}
+    assert engine.compute(keys[0], total_prices) == Decimal("15000.5")
+    assert engine.compute(keys[5], total_prices) == Decimal("74995.5")
+    # Beyond the book, only the available levels are counted.
+    assert engine.compute(keys[6], total_prices) == Decimal("150015")
+    assert round(engine.compute(keys[-1]), 6) == Decimal("0.333333")
+    assert engine.compute(("BTC", 1, "buy_price", "gemini", None)) is None
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+import aiohttp
+import pytest
+
+from exchanges import utils
+from logger.app_logger import RateLimitFilter
+
+
+class Capture(logging.Handler):
+    def __init__(self, burst, window):
+        super().__init__()
+        self.records = []
+        self.addFilter(RateLimitFilter(burst, window))
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class FailingSession:
+    def request(self, method, url, headers=None, data=None):
+        raise aiohttp.ClientConnectionError(f"Cannot connect to {url}")
+
+
+@pytest.fixture
+def capture():
+    logger = logging.getLogger(utils.__name__)
+    handler = Capture(burst=3, window=60)
+    logger.addHandler(handler)
+    yield handler
+    logger.removeHandler(handler)
+
+
+def test_repeated_upstream_errors_are_sampled(monkeypatch, capture):
+    monkeypatch.setattr(utils, "shared_session", FailingSession())
+
+    async def fail_many():
+        for index in range(50):
+            with pytest.raises(Exception):
+                await utils.make_request(f"https://venue.test/pairs/{index}")
+
+    asyncio.run(fail_many())
+
+    assert len(capture.records) == 3
+    assert [record.getMessage() for record in capture.records] == [
+        f"ClientError while making request to https://venue.test/pairs/{index}: "
+        f"Cannot connect to https://venue.test/pairs/{index}"
+        for index in range(3)
+    ]
+
+
+def test_suppressed_records_are_reported_on_the_next_window():
+    rate_limit = RateLimitFilter(burst=2, window=60)
+
+    def make_record(url, created):
+        record = logging.makeLogRecord(
+            {
+                "name": "exchanges.utils",
+                "levelno": logging.WARNING,
+                "msg": "ClientError while making request to %s: %s",
+                "args": (url, "timeout"),
+                "created": created,
+            }
+        )
+        return rate_limit.filter(record), record
+
+    results = [make_record(f"https://venue.test/{index}", 0) for index in range(10)]
+    assert [allowed for allowed, _ in results] == [True] * 2 + [False] * 8
+
+    allowed, record = make_record("https://venue.test/next", 61)
+    assert allowed
+    assert record.suppressed == 8
+    assert len(rate_limit.windows) == 1
+
+
+def test_records_below_warning_are_never_sampled():
+    rate_limit = RateLimitFilter(burst=1, window=60)
+    record = logging.makeLogRecord({"levelno": logging.INFO, "msg": "polled"})
+
+    assert all(rate_limit.filter(record) for _ in range(10))
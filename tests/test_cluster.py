@@ -0,0 +1,85 @@
+from cluster import Cluster, HashRing, decode_snapshot, encode_snapshot
+from exchanges.fixed_point import LazyLevels
+from models.schemas import Crypto
+
+
+NODES = [f"http://127.0.0.1:{port}" for port in range(8000, 8004)]
+CRYPTOS = ["BTC", "ETH", "SOL", "XRP", "LRC", "ETH/BTC", "*"]
+KEYS = [
+    f"{exchange}:{crypto}"
+    for exchange in ("coinbase", "gemini", "kraken")
+    for crypto in CRYPTOS
+] + [f"venue:{index}" for index in range(500)]
+
+
+def get_owners(ring):
+    return {key: ring.get_owner(key) for key in KEYS}
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing([]).get_owner("coinbase:BTC") is None
+
+
+def test_ownership_does_not_depend_on_node_order():
+    assert get_owners(HashRing(NODES)) == get_owners(HashRing(NODES[::-1]))
+
+
+def test_only_the_keys_of_a_removed_node_move():
+    before = get_owners(HashRing(NODES))
+    after = get_owners(HashRing(NODES[:-1]))
+
+    for key, owner in before.items():
+        if owner != NODES[-1]:
+            assert after[key] == owner
+        else:
+            assert after[key] in NODES[:-1]
+
+
+def test_only_keys_taken_by_an_added_node_move():
+    before = get_owners(HashRing(NODES[:-1]))
+    after = get_owners(HashRing(NODES))
+
+    moved = [key for key in KEYS if after[key] != before[key]]
+    assert moved
+    assert all(after[key] == NODES[-1] for key in moved)
+    # Virtual nodes spread the load, the new node takes about its share.
+    assert len(moved) < len(KEYS) / 2
+
+
+def test_every_node_owns_keys():
+    assert set(get_owners(HashRing(NODES)).values()) == set(NODES)
+
+
+def test_crypto_enums_hash_like_their_value():
+    cluster = Cluster(NODES[0], NODES)
+    cluster.set_live(set(NODES))
+
+    for crypto in Crypto:
+        for exchange in ("coinbase", "gemini", "kraken"):
+            assert cluster.get_owner(exchange, crypto) == cluster.get_owner(
+                exchange, crypto.value
+            )
+
+
+def test_remote_owner_is_none_for_own_keys():
+    cluster = Cluster(NODES[0], NODES)
+    cluster.set_live(set(NODES))
+
+    for key, owner in get_owners(cluster.ring).items():
+        exchange, _, crypto = key.partition(":")
+        expected = None if owner == NODES[0] else owner
+        assert cluster.get_remote_owner(exchange, crypto) == expected
+
+
+def test_book_snapshots_round_trip():
+    book = {
+        "bids": LazyLevels([["101.5", "2"], ["101", "1"]], 2, 8, True),
+        "asks": LazyLevels([["102", "0.5"], ["103", "1"]], 2, 8, False),
+        "price_decimals": 2,
+        "amount_decimals": 8,
+    }
+
+    decoded = decode_snapshot("book", encode_snapshot("book", book))
+
+    assert decoded == book
+    assert list(decoded["bids"]) == list(book["bids"])
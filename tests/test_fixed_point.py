@@ -0,0 +1,82 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from exchanges.fixed_point import (
+    decimals_from_increment,
+    parse_fixed,
+    to_decimal_string,
+    to_fixed,
+)
+
+
+def test_decimal_strings_round_trip():
+    rng = random.Random(27)
+    for decimals in range(0, 13):
+        for _ in range(200):
+            value = rng.randint(-(10**15), 10**15)
+            text = to_decimal_string(value, decimals)
+            assert to_fixed(text, decimals) == value
+            assert parse_fixed(text, decimals) == value
+            assert Decimal(text) == Decimal(value).scaleb(-decimals)
+
+
+def test_strings_printed_at_the_scale_round_trip():
+    rng = random.Random(270)
+    for decimals in range(1, 13):
+        for _ in range(200):
+            value = rng.randint(-(10**15), 10**15)
+            text = format(Decimal(value).scaleb(-decimals), f".{decimals}f")
+            assert parse_fixed(text, decimals) == value
+            assert to_decimal_string(parse_fixed(text, decimals), decimals) == (
+                to_decimal_string(value, decimals)
+            )
+
+
+@pytest.mark.parametrize(
+    "value, decimals, expected",
+    [
+        ("30000.12", 2, 3000012),
+        ("30000.1200", 2, 3000012),
+        ("0.00000001", 8, 1),
+        ("-0.5", 2, -50),
+        (".5", 1, 5),
+        ("12.", 0, 12),
+        ("12.000", 0, 12),
+        ("1e-05", 8, 1000),
+        ("1E+3", 0, 1000),
+        (0.1, 8, 10000000),
+        (1e-05, 8, 1000),
+        (42, 3, 42000),
+    ],
+)
+def test_values_are_parsed_exactly(value, decimals, expected):
+    assert to_fixed(value, decimals) == expected
+    assert parse_fixed(value, decimals) == expected
+
+
+@pytest.mark.parametrize(
+    "value, decimals", [("0.001", 2), ("1.5", 0), (0.125, 2), ("1e-09", 8)]
+)
+def test_excess_precision_is_rejected(value, decimals):
+    with pytest.raises(ValueError):
+        to_fixed(value, decimals)
+    with pytest.raises(ValueError):
+        parse_fixed(value, decimals)
+
+
+@pytest.mark.parametrize(
+    "value, decimals, expected",
+    [(0, 8, "0"), (1, 8, "0.00000001"), (-5, 2, "-0.05"), (3000012, 2, "30000.12")],
+)
+def test_values_are_formatted_without_trailing_zeros(value, decimals, expected):
+    assert to_decimal_string(value, decimals) == expected
+
+
+@pytest.mark.parametrize(
+    "increment, expected",
+    [("0.01", 2), ("0.010", 2), (1e-08, 8), ("1", 0), ("10", 0), (0.5, 1)],
+)
+def test_decimals_from_increment(increment, expected):
+    assert decimals_from_increment(increment) == expected
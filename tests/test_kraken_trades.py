@@ -0,0 +1,70 @@
+import asyncio
+
+from exchanges import kraken
+from exchanges.kraken import Kraken
+from exchanges.utils import structure_kraken
+
+
+PAIR = "XXBTZUSD"
+# One trade a second, the trade id being its second.
+HISTORY = [
+    [f"{30000 + second}", "1", f"{second}", "b", "l", "", second]
+    for second in range(1, 5001)
+]
+
+
+def make_kraken(monkeypatch, page_size=10, concurrency=3):
+    monkeypatch.setattr(Kraken, "trades_page_size", page_size)
+    monkeypatch.setattr(Kraken, "max_trade_page_requests", concurrency)
+    exchange = Kraken.__new__(Kraken)
+    exchange.pair = PAIR
+
+    async def request_helper(url, method):
+        return {"result": {PAIR: HISTORY[-page_size:], "last": "0"}}
+
+    async def get_trades_between(pair, start, end):
+        # Newer windows are the slowest, so windows complete oldest first.
+        await asyncio.sleep(end / 10**7)
+        return structure_kraken(
+            {
+                "result": {
+                    pair: [
+                        trade for trade in HISTORY if start <= float(trade[2]) < end
+                    ]
+                }
+            },
+            pair,
+        )
+
+    monkeypatch.setattr(kraken, "request_helper", request_helper)
+    exchange.get_trades_between = get_trades_between
+    return exchange
+
+
+def test_trades_are_the_newest_without_gaps(monkeypatch):
+    exchange = make_kraken(monkeypatch)
+
+    for limit in (5, 10, 11, 47, 200, 1234):
+        trades = asyncio.run(exchange.get_trades(limit))
+        assert [trade["trade_id"] for trade in trades] == list(
+            range(5000, 5000 - limit, -1)
+        )
+
+
+def test_pages_are_yielded_newest_first(monkeypatch):
+    exchange = make_kraken(monkeypatch)
+
+    async def get_pages():
+        return [page async for page in exchange.iter_trades(95)]
+
+    pages = asyncio.run(get_pages())
+    ids = [trade["trade_id"] for page in pages for trade in reversed(page)]
+    assert ids == list(range(5000, 4905, -1))
+
+
+def test_history_running_out_stops_the_pull(monkeypatch):
+    exchange = make_kraken(monkeypatch)
+
+    trades = asyncio.run(exchange.get_trades(10000))
+
+    assert [trade["trade_id"] for trade in trades] == list(range(5000, 0, -1))
@@ -0,0 +1,186 @@
+import random
+from decimal import Decimal
+
+from exchanges.fixed_point import LazyLevels
+from exchanges.order_book import OrderBook, OrderBookSide, get_bucketed_depth
+
+
+def make_book(rng, mid, price_decimals, amount_decimals, levels=300):
+    """
+    Build a random book around a mid price, crossed by a few levels.
+    """
+    scale = 10**price_decimals
+    prices = rng.sample(range(mid * scale // 2, mid * scale * 3 // 2), levels * 2)
+    bids = [price for price in prices[:levels] if price < mid * scale * 101 // 100]
+    asks = [price for price in prices[levels:] if price > mid * scale * 99 // 100]
+    order_book = OrderBook(price_decimals, amount_decimals)
+    order_book.apply_snapshot(
+        {
+            "price_decimals": price_decimals,
+            "amount_decimals": amount_decimals,
+            "bids": [
+                {"price": price, "amount": rng.randint(1, 10**amount_decimals)}
+                for price in bids
+            ],
+            "asks": [
+                {"price": price, "amount": rng.randint(1, 10**amount_decimals)}
+                for price in asks
+            ],
+        }
+    )
+    return order_book
+
+
+def get_linear_buckets(order_books, side, bounds):
+    """
+    Sum the amounts of every level within each bucket by scanning all levels.
+    """
+    buckets = []
+    for index, bound in enumerate(bounds):
+        amounts = {}
+        for exchange_name, book in order_books.items():
+            total = Decimal(0)
+            for level in book.get_side(side):
+                price = Decimal(level["price"]) / 10**book.price_decimals
+                amount = Decimal(level["amount"]) / 10**book.amount_decimals
+                previous = bounds[index - 1] if index else None
+                if side == "bids":
+                    within = price >= bound and (previous is None or price < previous)
+                else:
+                    within = price <= bound and (previous is None or price > previous)
+                if within:
+                    total += amount
+            amounts[exchange_name] = total
+        buckets.append(amounts)
+    return buckets
+
+
+def test_buckets_match_a_linear_scan():
+    rng = random.Random(40)
+    order_books = {
+        "coinbase": make_book(rng, 30000, 2, 8),
+        "gemini": make_book(rng, 30000, 2, 6),
+        "kraken": make_book(rng, 30000, 1, 8),
+    }
+    for bucket, buckets in (("10", 20), ("0.5%", 30), ("1000", 40), ("0.01", 5)):
+        depth = get_bucketed_depth(order_books, bucket, buckets)
+        for side in ("bids", "asks"):
+            bounds = [Decimal(item["price"]) for item in depth[side]]
+            expected = get_linear_buckets(order_books, side, bounds)
+            cumulative = Decimal(0)
+            for item, amounts in zip(depth[side], expected):
+                assert {
+                    name: Decimal(amount) for name, amount in item["amounts"].items()
+                } == amounts
+                cumulative += sum(amounts.values())
+                assert Decimal(item["amount"]) == sum(amounts.values())
+                assert Decimal(item["cumulative"]) == cumulative
+
+
+def test_bid_buckets_stop_at_zero():
+    order_book = OrderBook(2, 8)
+    order_book.apply_snapshot(
+        {
+            "price_decimals": 2,
+            "amount_decimals": 8,
+            "bids": [{"price": 150, "amount": 10**8}],
+            "asks": [{"price": 250, "amount": 10**8}],
+        }
+    )
+
+    depth = get_bucketed_depth({"coinbase": order_book}, "1", 10)
+
+    assert [item["price"] for item in depth["bids"]] == ["2", "1"]
+    assert [item["amount"] for item in depth["bids"]] == ["0", "1"]
+    assert [item["amount"] for item in depth["asks"][:2]] == ["0", "1"]
+
+
+def get_linear_fill(levels, quantity):
+    """
+    Fill a quantity by walking the levels best first.
+    """
+    cost = 0
+    quantity_left = quantity
+    for price, amount in levels:
+        taken = min(amount, quantity_left)
+        cost += taken * price
+        quantity_left -= taken
+    return cost, quantity - quantity_left
+
+
+def get_linear_depth(levels, price, descending):
+    """
+    Sum the levels at a price or better by scanning them all.
+    """
+    within = [
+        (level_price, amount)
+        for level_price, amount in levels
+        if (level_price >= price if descending else level_price <= price)
+    ]
+    return (
+        sum(amount for _, amount in within),
+        sum(level_price * amount for level_price, amount in within),
+    )
+
+
+def test_treap_fills_and_depth_match_a_linear_scan():
+    rng = random.Random(34)
+    for descending in (False, True):
+        side = OrderBookSide(descending)
+        amounts = {}
+        for _ in range(3000):
+            price = rng.randint(1, 500)
+            # Mostly insertions and changes, with removals of levels that may
+            # or may not exist.
+            amount = 0 if rng.random() < 0.3 else rng.randint(1, 1000)
+            side.update(price, amount)
+            if amount:
+                amounts[price] = amount
+            else:
+                amounts.pop(price, None)
+
+            if rng.random() < 0.1:
+                levels = sorted(amounts.items(), reverse=descending)
+                assert [
+                    (level["price"], level["amount"]) for level in side
+                ] == levels
+                assert len(side) == len(levels)
+                assert side.get_best() == (levels[0][0] if levels else None)
+                total = sum(amounts.values())
+                for quantity in (0, 1, rng.randint(0, total + 1), total, total + 5):
+                    assert side.get_fill(quantity) == get_linear_fill(
+                        levels, quantity
+                    )
+                for limit in (0, rng.randint(1, 500), 501):
+                    assert side.get_depth(limit) == get_linear_depth(
+                        levels, limit, descending
+                    )
+
+
+def test_snapshots_apply_only_the_changes():
+    order_book = OrderBook(2, 8, history=2)
+    first = {
+        "price_decimals": 2,
+        "amount_decimals": 8,
+        "bids": LazyLevels([["100", "1"], ["99.5", "2"]], 2, 8, True),
+        "asks": LazyLevels([["101", "1"], ["102", "3"]], 2, 8, False),
+    }
+    second = {
+        **first,
+        "bids": LazyLevels([["100", "1"], ["99.5", "4"]], 2, 8, True),
+        "asks": LazyLevels([["102", "3"]], 2, 8, False),
+    }
+
+    assert order_book.apply_snapshot(first) == 4
+    assert order_book.apply_snapshot(second) == 2
+    assert order_book.get_levels("bids") == [["100", "1"], ["99.5", "4"]]
+    assert order_book.get_levels("asks") == [["102", "3"]]
+    assert order_book.get_changes(1) == {
+        "bids": {9950: 4 * 10**8},
+        "asks": {10100: 0},
+    }
+    assert order_book.get_changes(2) == {"bids": {}, "asks": {}}
+    order_book.apply_snapshot(second)
+    order_book.apply_snapshot(second)
+    assert order_book.get_changes(1) is None
+    assert order_book.get_total_price("asks", "1.5") == "153"
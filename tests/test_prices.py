@@ -0,0 +1,49 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers import prices
+
+
+def get_client(monkeypatch, refresh_during_compute):
+    state = {"version": 1}
+
+    async def get_book_versions(crypto):
+        return (("coinbase", state["version"]),)
+
+    def read_book_versions(crypto):
+        return (("coinbase", state["version"]),)
+
+    async def get_consolidated_prices(crypto, quantity):
+        if refresh_during_compute:
+            state["version"] += 1
+        return "100", "99"
+
+    monkeypatch.setattr(prices, "get_book_versions", get_book_versions)
+    monkeypatch.setattr(prices, "read_book_versions", read_book_versions)
+    monkeypatch.setattr(prices, "get_consolidated_prices", get_consolidated_prices)
+    app = FastAPI()
+    app.state.limiter = prices.limiter
+    app.include_router(prices.router)
+    return TestClient(app)
+
+
+def test_prices_are_tagged_with_their_book_versions(monkeypatch):
+    client = get_client(monkeypatch, refresh_during_compute=False)
+
+    response = client.get("/prices/BTC?quantity=1&view=consolidated")
+    etag = response.headers["etag"]
+    assert response.json()["buying_price"] == "100"
+
+    response = client.get(
+        "/prices/BTC?quantity=1&view=consolidated", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+
+def test_prices_computed_across_a_book_refresh_are_not_tagged(monkeypatch):
+    client = get_client(monkeypatch, refresh_during_compute=True)
+
+    response = client.get("/prices/BTC?quantity=1&view=consolidated")
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
@@ -0,0 +1,46 @@
+import hashlib
+import hmac
+import threading
+
+from exchanges import private
+from exchanges.private import ApiKey, NonceGenerator
+
+
+def test_nonces_strictly_increase_across_threads():
+    nonces = NonceGenerator()
+    issued = [[] for _ in range(8)]
+    start = threading.Barrier(len(issued))
+
+    def issue(out):
+        start.wait()
+        for _ in range(5000):
+            out.append(nonces.next())
+
+    threads = [threading.Thread(target=issue, args=(out,)) for out in issued]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for out in issued:
+        assert all(earlier < later for earlier, later in zip(out, out[1:]))
+    every_nonce = [nonce for out in issued for nonce in out]
+    assert len(set(every_nonce)) == len(every_nonce)
+    assert nonces.next() > max(every_nonce)
+
+
+def test_nonces_do_not_go_back_with_the_clock(monkeypatch):
+    clock = iter([5_000_000_000, 4_000_000_000, 4_000_000_000, 6_000_000_000])
+    monkeypatch.setattr(private.time, "time_ns", lambda: next(clock))
+    nonces = NonceGenerator()
+
+    assert [nonces.next() for _ in range(4)] == [5000, 5001, 5002, 6000]
+
+
+def test_signatures_match_a_fresh_hmac():
+    key = ApiKey("key", b"secret", hashlib.sha512)
+
+    for message in (b"", b"/0/private/Balance", b"nonce=1"):
+        assert key.sign(message).digest() == (
+            hmac.new(b"secret", message, hashlib.sha512).digest()
+        )
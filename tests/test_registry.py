@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import pytest
+
+from exchanges.registry import ExchangeRegistry
+
+
+def make_exchange(name, cryptos, failures=0):
+    class Exchange:
+        assets = {}
+        attempts = 0
+
+        def __init__(self, crypto):
+            self.crypto = crypto
+
+        @classmethod
+        async def get_assets(cls, refresh=False):
+            cls.attempts += 1
+            if cls.attempts <= failures:
+                raise ConnectionError(f"{name} is down")
+            if refresh or not cls.assets:
+                cls.assets = {crypto: crypto for crypto in cryptos}
+            return cls.assets
+
+    Exchange.__name__ = name
+    return Exchange
+
+
+def make_registry(tmp_path, config, **exchanges):
+    path = tmp_path / "exchanges.json"
+    path.write_text(json.dumps(config))
+    exchanges = exchanges or {
+        "coinbase": make_exchange("Coinbase", ["BTC", "ETH", "ETH/BTC"]),
+        "kraken": make_exchange("Kraken", ["BTC", "ETH"]),
+    }
+    return path, ExchangeRegistry(exchanges, str(path), retry_interval=0)
+
+
+def test_config_filters_exchanges_and_pairs(tmp_path):
+    _, registry = make_registry(tmp_path, {"kraken": ["BTC"], "coinbase": "*"})
+
+    state = asyncio.run(registry.reload())
+
+    assert state["exchanges"] == {
+        "coinbase": ["BTC", "ETH", "ETH/BTC"],
+        "kraken": ["BTC"],
+    }
+    assert registry.get_enabled() == ["coinbase", "kraken"]
+    assert [cls.__name__ for cls in registry.by_crypto["BTC"]] == [
+        "Coinbase",
+        "Kraken",
+    ]
+    assert registry.get_adapter("kraken", "BTC").crypto == "BTC"
+    with pytest.raises(KeyError):
+        registry.get_adapter("kraken", "ETH")
+    assert registry.is_enabled("kraken", "BTC")
+    assert not registry.is_enabled("kraken", "ETH")
+
+
+@pytest.mark.parametrize(
+    "bad_config",
+    [
+        "{not json",
+        json.dumps(["coinbase"]),
+        json.dumps({"binance": "*"}),
+        json.dumps({"kraken": "BTC"}),
+        json.dumps({"kraken": ["BTC", 1]}),
+    ],
+)
+def test_bad_config_leaves_the_registry_unchanged(tmp_path, bad_config):
+    path, registry = make_registry(tmp_path, {"coinbase": ["BTC"], "kraken": "*"})
+    asyncio.run(registry.reload())
+    state = registry.get_state()
+    adapters = dict(registry.adapters)
+    by_crypto = {
+        crypto: list(classes) for crypto, classes in registry.by_crypto.items()
+    }
+
+    path.write_text(bad_config)
+    with pytest.raises(ValueError):
+        asyncio.run(registry.reload())
+
+    assert registry.get_state() == state
+    assert registry.adapters == adapters
+    assert registry.by_crypto == by_crypto
+    assert registry.get_enabled() == ["coinbase", "kraken"]
+
+
+def test_missing_config_leaves_the_registry_unchanged(tmp_path):
+    path, registry = make_registry(tmp_path, {"kraken": "*"})
+    asyncio.run(registry.reload())
+    state = registry.get_state()
+
+    path.unlink()
+    with pytest.raises(ValueError):
+        asyncio.run(registry.reload())
+
+    assert registry.get_state() == state
+
+
+def test_reload_swaps_in_a_new_config(tmp_path):
+    path, registry = make_registry(tmp_path, {"kraken": "*"})
+    asyncio.run(registry.reload())
+
+    path.write_text(json.dumps({"coinbase": ["ETH/BTC"]}))
+    state = asyncio.run(registry.reload())
+
+    assert state["exchanges"] == {"coinbase": ["ETH/BTC"]}
+    assert registry.by_crypto == {"ETH/BTC": [registry.exchanges["coinbase"]]}
+
+
+def test_failed_exchanges_are_retried(tmp_path):
+    _, registry = make_registry(
+        tmp_path,
+        {"gemini": "*", "kraken": "*"},
+        gemini=make_exchange("Gemini", ["BTC"], failures=1),
+        kraken=make_exchange("Kraken", ["BTC"]),
+    )
+
+    async def load():
+        await registry.ensure_loaded()
+        pending = registry.get_state()["pending"]
+        exchanges = await registry.get_exchanges("BTC")
+        return pending, [cls.__name__ for cls in exchanges]
+
+    assert asyncio.run(load()) == (["gemini"], ["Gemini", "Kraken"])
+    assert registry.get_state()["pending"] == []
@@ -0,0 +1,16 @@
+from responses import INSTANCE_ID, get_version_token, parse_version_token
+
+
+def test_version_tokens_round_trip():
+    for version in (0, 1, 42, 10**12):
+        assert parse_version_token(get_version_token(version)) == version
+
+
+def test_tokens_of_other_instances_are_rejected():
+    assert parse_version_token("0123456789abcdef.42") is None
+    assert parse_version_token("42") is None
+
+
+def test_malformed_tokens_are_rejected():
+    for token in ("", ".", f"{INSTANCE_ID}.", f"{INSTANCE_ID}.-1", f"{INSTANCE_ID}.x"):
+        assert parse_version_token(token) is None
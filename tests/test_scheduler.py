@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from scheduler import PollingScheduler
+
+
+def make_scheduler(fail=False):
+    calls = []
+
+    async def fetch_book(exchange, crypto, limit):
+        calls.append((exchange, crypto, limit))
+        await asyncio.sleep(0.05)
+        if fail:
+            raise ConnectionError("venue is down")
+        return {"bids": [], "asks": [], "call": len(calls)}
+
+    scheduler = PollingScheduler({"book": fetch_book}, {"kraken": 1.0})
+    return scheduler, calls
+
+
+def test_concurrent_fetches_share_one_upstream_call():
+    scheduler, calls = make_scheduler()
+
+    async def burst():
+        return await asyncio.gather(
+            *(scheduler.fetch("kraken", "BTC", "book") for _ in range(50))
+        )
+
+    snapshots = asyncio.run(burst())
+
+    assert len(calls) == 1
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert scheduler.get_snapshot("kraken", "BTC", "book") is snapshots[0]
+    # Only the shared fetch is charged, from a full one second budget.
+    assert scheduler.tokens["kraken"] < 0.5
+    assert not scheduler.fetches
+
+
+def test_later_fetches_go_upstream_again():
+    scheduler, calls = make_scheduler()
+
+    async def twice():
+        first = await scheduler.fetch("kraken", "BTC", "book")
+        second = await scheduler.fetch("kraken", "BTC", "book")
+        return first, second
+
+    first, second = asyncio.run(twice())
+
+    assert len(calls) == 2
+    assert first["data"]["call"] == 1 and second["data"]["call"] == 2
+    # Request path fetches run into debt rather than waiting.
+    assert scheduler.tokens["kraken"] < 0
+
+
+def test_a_failure_reaches_every_waiting_caller():
+    scheduler, calls = make_scheduler(fail=True)
+
+    async def burst():
+        return await asyncio.gather(
+            *(scheduler.fetch("kraken", "BTC", "book") for _ in range(5)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(burst())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert not scheduler.fetches
+
+
+def test_a_caller_giving_up_does_not_cancel_the_others():
+    scheduler, calls = make_scheduler()
+
+    async def cancel_one():
+        impatient = asyncio.ensure_future(scheduler.fetch("kraken", "BTC", "book"))
+        patient = asyncio.ensure_future(scheduler.fetch("kraken", "BTC", "book"))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return await patient
+
+    snapshot = asyncio.run(cancel_one())
+
+    assert len(calls) == 1
+    assert snapshot["data"]["call"] == 1
+
+
+def test_resources_fetched_by_requests_are_not_scheduled():
+    scheduler, calls = make_scheduler()
+    scheduler.record_demand("kraken", "BTC", "book")
+
+    async def fetch_and_schedule():
+        fetch = asyncio.ensure_future(scheduler.fetch("kraken", "BTC", "book"))
+        await asyncio.sleep(0)
+        scheduler.tokens["kraken"] = 1.0
+        selected = scheduler.schedule(scheduler.refilled_at)
+        await fetch
+        return selected
+
+    assert asyncio.run(fetch_and_schedule()) == []
+    assert len(calls) == 1
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from exchanges import coinbase
+from exchanges.coinbase import Coinbase
+from scheduler import PollingScheduler
+
+
+UNIVERSE = {f"C{index}": f"C{index}-USD" for index in range(12)}
+
+
+def patch_coinbase(monkeypatch):
+    requested = []
+
+    async def get_assets(cls=None, refresh=False):
+        return Coinbase.assets
+
+    async def request_helper(url, method):
+        requested.append(url)
+        return {"bid": "1", "ask": "2", "price": "1.5"}
+
+    monkeypatch.setattr(Coinbase, "universe", UNIVERSE, raising=False)
+    monkeypatch.setattr(Coinbase, "get_assets", get_assets)
+    monkeypatch.setattr(coinbase, "request_helper", request_helper)
+    return requested
+
+
+def test_only_the_given_cryptos_are_fetched(monkeypatch):
+    requested = patch_coinbase(monkeypatch)
+
+    tickers = asyncio.run(Coinbase.get_tickers(["C1", "C5", "BTC"]))
+
+    assert sorted(tickers) == ["C1", "C5"]
+    assert len(requested) == 2
+
+
+def test_every_request_after_the_first_waits_for_the_throttle(monkeypatch):
+    requested = patch_coinbase(monkeypatch)
+    throttled = []
+
+    async def throttle():
+        throttled.append(len(requested))
+
+    tickers = asyncio.run(Coinbase.get_tickers(None, throttle))
+
+    assert len(tickers) == len(requested) == len(UNIVERSE)
+    assert len(throttled) == len(UNIVERSE) - 1
+
+
+def test_fan_out_is_spread_over_the_budget(monkeypatch):
+    patch_coinbase(monkeypatch)
+    scheduler = PollingScheduler({}, {"coinbase": 40.0})
+    scheduler.tokens["coinbase"] = 0
+
+    async def fetch():
+        start = time.monotonic()
+        await Coinbase.get_tickers(None, lambda: scheduler.acquire("coinbase"))
+        return time.monotonic() - start
+
+    # Eleven throttled requests at 40 per second, the first being free.
+    assert asyncio.run(fetch()) >= 11 / 40 * 0.9
+    assert scheduler.tokens["coinbase"] < 1
+
+
+def test_acquire_spends_available_tokens_right_away():
+    scheduler = PollingScheduler({}, {"kraken": 5.0})
+
+    async def acquire_all():
+        start = time.monotonic()
+        for _ in range(5):
+            await scheduler.acquire("kraken")
+        await scheduler.acquire("gemini")
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_all()) < 0.1
+    assert scheduler.tokens["kraken"] < 1
@@ -0,0 +1,85 @@
+import asyncio
+
+from exchanges.coinbase import Coinbase
+from exchanges.gemini import Gemini
+from exchanges.kraken import Kraken
+from routers import utils
+
+
+TRADES = {
+    Coinbase: [
+        {"trade_id": 3, "price": "100", "size": "1", "time": 5000},
+        {"trade_id": 2, "price": "101", "size": "1", "time": 3000},
+        {"trade_id": 1, "price": "102", "size": "2", "time": 1000},
+    ],
+    Gemini: [
+        {"trade_id": 12, "price": "99", "size": "1", "time": 4000},
+        {"trade_id": 11, "price": "98", "size": "1", "time": 2000},
+    ],
+    Kraken: [
+        {"trade_id": 21, "price": "100", "size": "3", "time": 6000},
+        {"trade_id": 20, "price": "100", "size": "1", "time": 500},
+    ],
+}
+
+
+def patch_exchanges(monkeypatch):
+    async def get_supported_exchanges(crypto):
+        return list(TRADES)
+
+    async def get_trades(exchange, crypto, limit):
+        return TRADES[exchange][:limit]
+
+    monkeypatch.setattr(utils, "get_supported_exchanges", get_supported_exchanges)
+    monkeypatch.setattr(utils, "get_trades", get_trades)
+
+
+def test_tape_is_ordered_and_tagged_with_each_exchange(monkeypatch):
+    patch_exchanges(monkeypatch)
+
+    tape = asyncio.run(utils.get_trade_tape("BTC", 10))
+
+    assert [trade["time"] for trade in tape["trades"]] == [
+        500,
+        1000,
+        2000,
+        3000,
+        4000,
+        5000,
+        6000,
+    ]
+    assert [trade["exchange"] for trade in tape["trades"]] == [
+        "kraken",
+        "coinbase",
+        "gemini",
+        "coinbase",
+        "gemini",
+        "coinbase",
+        "kraken",
+    ]
+    for trade in tape["trades"]:
+        exchange = utils.EXCHANGE_CLASSES[trade["exchange"]]
+        assert trade["trade_id"] in {item["trade_id"] for item in TRADES[exchange]}
+
+
+def test_tape_window_and_summary(monkeypatch):
+    patch_exchanges(monkeypatch)
+
+    tape = asyncio.run(utils.get_trade_tape("BTC", 10, start=2000, end=5000))
+
+    assert [(trade["exchange"], trade["time"]) for trade in tape["trades"]] == [
+        ("gemini", 2000),
+        ("coinbase", 3000),
+        ("gemini", 4000),
+    ]
+    assert tape["summary"]["coinbase"] == {"trades": 1, "volume": "1", "vwap": "101"}
+    assert tape["summary"]["kraken"] == {"trades": 0, "volume": "0", "vwap": None}
+    assert tape["summary"]["all"]["trades"] == 3
+
+
+def test_trades_window_bisects_newest_first_trades():
+    trades = TRADES[Coinbase]
+
+    assert utils.get_trades_window(trades, None, None) == trades[::-1]
+    assert utils.get_trades_window(trades, 3000, None) == trades[:2][::-1]
+    assert utils.get_trades_window(trades, None, 3000) == trades[2:]